@@ -0,0 +1,158 @@
+# alert_aggregator.py
+
+import os
+import time
+import threading
+import logging
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+from dotenv import load_dotenv
+from events import event_bus
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Aggregation configuration
+ALERT_COOLDOWN_SECONDS = float(os.getenv("ALERT_COOLDOWN_SECONDS", "60"))  # repeats on known cameras are suppressed this long
+ALERT_NEW_SUBJECT_COOLDOWN_SECONDS = float(os.getenv("ALERT_NEW_SUBJECT_COOLDOWN_SECONDS", "15"))  # per camera, before another person there is reported
+ALERT_INCIDENT_TTL_SECONDS = float(os.getenv("ALERT_INCIDENT_TTL_SECONDS", "1800"))  # quiet time after which a hit opens a new incident
+
+# Event type published for consolidated amber alert events
+AMBER_ALERT_EVENT = "amber_alert"
+
+
+class AlertIncident:
+    """All hits on one alert: the cameras and stored people it was matched on."""
+
+    def __init__(self, alert: Dict[str, Any], now: float):
+        self.alert = alert
+        self.first_seen = datetime.now().isoformat()
+        self.last_seen = self.first_seen
+        self.last_hit = now
+        self.last_emitted = 0.0
+        self.camera_emitted: Dict[str, float] = {}  # camera_id -> last "new", "escalated" or "new_subject" event there
+        self.cameras: Dict[str, str] = {}  # camera_id -> first sighting on that camera
+        self.person_ids: List[str] = []
+        self.hit_count = 0
+        self.suppressed = 0
+        self.best_score = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "alert_id": self.alert.get("id"),
+            "first_seen": self.first_seen,
+            "last_seen": self.last_seen,
+            "cameras": list(self.cameras),
+            "camera_first_seen": dict(self.cameras),
+            "person_ids": list(self.person_ids),
+            "hit_count": self.hit_count,
+            "suppressed": self.suppressed,
+            "best_score": round(self.best_score, 4)
+        }
+
+
+class AlertAggregator:
+    """
+    Debounces amber alert matches into incidents, one per alert ID.
+
+    The first hit opens an incident ("new"). A hit on a camera the incident has not
+    seen yet escalates it ("escalated"). A hit on a stored person the incident has not
+    matched yet is reported as "new_subject" even inside the cooldown, since a second
+    person matching the alert may be the real child. Stored person IDs are per
+    detection rather than per tracked person, so one person walking past a camera
+    yields a new ID most frames; "new_subject" is therefore only emitted on a camera
+    new_subject_cooldown_seconds after the last new, escalated or new_subject event
+    there. Further hits on known cameras only
+    emit a "repeat" once ALERT_COOLDOWN_SECONDS have passed since the last emitted
+    event. Anything else is counted and suppressed. Emitted events are published on
+    the event bus as AMBER_ALERT_EVENT with the consolidated incident attached.
+    """
+
+    def __init__(self, cooldown_seconds: float = ALERT_COOLDOWN_SECONDS, incident_ttl_seconds: float = ALERT_INCIDENT_TTL_SECONDS,
+                 new_subject_cooldown_seconds: float = ALERT_NEW_SUBJECT_COOLDOWN_SECONDS):
+        self.cooldown_seconds = cooldown_seconds
+        self.new_subject_cooldown_seconds = new_subject_cooldown_seconds
+        self.incident_ttl_seconds = incident_ttl_seconds
+        self._incidents: Dict[str, AlertIncident] = {}
+        self._lock = threading.Lock()
+        self._metrics = {"hits": 0, "new": 0, "escalated": 0, "new_subject": 0, "repeat": 0, "suppressed": 0}
+
+    def observe(self, match: Dict[str, Any], camera_id: str, person_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Record one amber alert match (as returned by check_amber_alert_matches).
+
+        Returns:
+            The consolidated event if the hit is worth reporting, otherwise None
+        """
+        alert = match.get("alert", {})
+        alert_id = alert.get("id") or alert.get("alert_message") or "unknown"
+        now = time.time()
+
+        with self._lock:
+            self._metrics["hits"] += 1
+            incident = self._incidents.get(alert_id)
+            if incident is None or now - incident.last_hit > self.incident_ttl_seconds:
+                incident = self._incidents[alert_id] = AlertIncident(alert, now)
+                kind = "new"
+            elif camera_id not in incident.cameras:
+                kind = "escalated"
+            elif (person_id and person_id not in incident.person_ids and
+                  now - incident.camera_emitted.get(camera_id, 0.0) >= self.new_subject_cooldown_seconds):
+                kind = "new_subject"
+            elif now - incident.last_emitted >= self.cooldown_seconds:
+                kind = "repeat"
+            else:
+                kind = None
+
+            incident.alert = alert
+            incident.hit_count += 1
+            incident.last_hit = now
+            incident.last_seen = datetime.now().isoformat()
+            incident.best_score = max(incident.best_score, match.get("score", 0.0))
+            incident.cameras.setdefault(camera_id, incident.last_seen)
+            if person_id and person_id not in incident.person_ids:
+                incident.person_ids.append(person_id)
+
+            if kind is None:
+                incident.suppressed += 1
+                self._metrics["suppressed"] += 1
+                return None
+            incident.last_emitted = now
+            if kind != "repeat":
+                incident.camera_emitted[camera_id] = now
+            self._metrics[kind] += 1
+            event = {
+                "match": True,
+                "event": kind,
+                "alert": alert,
+                "score": match.get("score"),
+                "camera_id": camera_id,
+                "person_id": person_id,
+                "incident": incident.to_dict()
+            }
+
+        logger.info(f"Amber alert {alert_id} {kind} on camera {camera_id} (cameras: {len(event['incident']['cameras'])}, hits: {event['incident']['hit_count']})")
+        event_bus.publish(AMBER_ALERT_EVENT, event, camera_id=camera_id)
+        return event
+
+    def incidents(self) -> List[Dict[str, Any]]:
+        """Open incidents, most recently seen first."""
+        now = time.time()
+        with self._lock:
+            for alert_id in [alert_id for alert_id, incident in self._incidents.items()
+                             if now - incident.last_hit > self.incident_ttl_seconds]:
+                del self._incidents[alert_id]
+            incidents = sorted(self._incidents.values(), key=lambda incident: incident.last_hit, reverse=True)
+            return [incident.to_dict() for incident in incidents]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._metrics, "open_incidents": len(self._incidents)}
+
+
+# Shared aggregator fed by /process_frame
+alert_aggregator = AlertAggregator()
@@ -0,0 +1,284 @@
+# alert_sweep.py
+
+import os
+import uuid
+import time
+import heapq
+import threading
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+import numpy as np
+from dotenv import load_dotenv
+from amber_alert import (amber_alert_matcher, score_alert_value, CRITICAL_ATTRIBUTES,
+                         AMBER_ALERT_MATCH_THRESHOLD, AMBER_ALERT_RELOAD_SECONDS)
+from events import event_bus
+from images import crop_url
+from ranking import get_ranker, AttributeMatrix
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Sweep configuration
+ALERT_SWEEP_WINDOW_HOURS = float(os.getenv("ALERT_SWEEP_WINDOW_HOURS", "24"))
+ALERT_SWEEP_CHUNK_SIZE = int(os.getenv("ALERT_SWEEP_CHUNK_SIZE", "50000"))  # detections scored per vectorized pass
+ALERT_SWEEP_MAX_HITS = int(os.getenv("ALERT_SWEEP_MAX_HITS", "500"))  # best hits kept per sweep
+ALERT_SWEEP_MAX_JOBS = int(os.getenv("ALERT_SWEEP_MAX_JOBS", "50"))  # finished sweeps kept for inspection
+ALERT_SWEEP_ON_NEW_ALERT = os.getenv("ALERT_SWEEP_ON_NEW_ALERT", "true").lower() == "true"
+
+# Event type published for each sweep hit
+ALERT_SWEEP_HIT = "alert_sweep_hit"
+
+
+def _equals(matrix: AttributeMatrix, key: str, value: str, rows: np.ndarray) -> np.ndarray:
+    """Mask of the rows whose (lowercased) value for key is exactly value."""
+    vocab = matrix.vocab.get(key, [])
+    if value not in vocab:
+        return np.zeros(len(rows), dtype=bool)
+    return matrix.codes[key][rows] == vocab.index(value)
+
+
+def _special_case(matrix: AttributeMatrix, rows: np.ndarray) -> np.ndarray:
+    """Rows that calculate_match_score scores 1.0 regardless of the alert (male child in all black)."""
+    return (_equals(matrix, "gender", "male", rows) & _equals(matrix, "age_group", "child", rows) &
+            _equals(matrix, "clothing_top_color", "black", rows) & _equals(matrix, "clothing_bottom_color", "black", rows))
+
+
+# Newest-first ordering of the ranker's active people, cached per ranker version
+_timeline: Optional[Tuple[Any, np.ndarray, np.ndarray]] = None
+_timeline_lock = threading.Lock()
+
+
+def _get_timeline(ranker) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns:
+        (positions into ranker.people newest first, their timestamps in ascending order)
+    """
+    global _timeline
+    with _timeline_lock:
+        if _timeline is None or _timeline[0] != ranker.version:
+            version = ranker.version
+            # Removed (evicted) rows stay in ranker.people until it is compacted
+            rows = np.flatnonzero(ranker.active[:ranker.size])
+            timestamps = np.array([str(ranker.people[i].get("metadata", {}).get("timestamp") or "") for i in rows])
+            ascending = np.argsort(timestamps, kind="stable")
+            _timeline = (version, rows[ascending[::-1]], timestamps[ascending])
+        return _timeline[1], _timeline[2]
+
+
+class SweepJob:
+    """
+    One retroactive sweep of an alert over stored detections.
+
+    Progress and hits are recorded as an append-only event log so any number of
+    readers can stream the sweep from the start while it runs.
+    """
+
+    def __init__(self, alert: Dict[str, Any], window_hours: Optional[float], min_score: float, chunk_size: int):
+        self.id = uuid.uuid4().hex
+        self.alert = alert
+        self.window_hours = window_hours
+        self.min_score = min_score
+        self.chunk_size = chunk_size
+        self.status = "pending"
+        self.error: Optional[str] = None
+        self.scanned = 0
+        self.total = 0
+        self.hit_count = 0
+        self.started_at = datetime.now().isoformat()
+        self.finished_at: Optional[str] = None
+        self._best: List[Tuple[float, int, Dict[str, Any]]] = []  # min-heap of the best hits
+        self._events: List[Tuple[str, Dict[str, Any]]] = []
+        self._cancel = threading.Event()
+        self._changed = threading.Condition()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "cancelled", "failed")
+
+    def cancel(self):
+        self._cancel.set()
+
+    def _record(self, event: str, data: Dict[str, Any]):
+        with self._changed:
+            self._events.append((event, data))
+            self._changed.notify_all()
+
+    def _add_hits(self, hits: List[Dict[str, Any]]):
+        with self._changed:
+            for hit in hits:
+                self.hit_count += 1
+                entry = (hit["score"], self.hit_count, hit)
+                if len(self._best) < ALERT_SWEEP_MAX_HITS:
+                    heapq.heappush(self._best, entry)
+                elif entry > self._best[0]:
+                    heapq.heapreplace(self._best, entry)
+
+    def hits(self) -> List[Dict[str, Any]]:
+        """Best hits so far, highest score first."""
+        with self._changed:
+            return [hit for _, _, hit in sorted(self._best, reverse=True)]
+
+    def iter_events(self, poll_seconds: float = 1.0) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Yield the sweep's events from the start, blocking for new ones until it finishes.
+        Events are ("hit", hit), ("progress", {scanned, total, hit_count}) and a final
+        ("status", job summary).
+        """
+        position = 0
+        while True:
+            with self._changed:
+                while position >= len(self._events) and not self.finished:
+                    self._changed.wait(poll_seconds)
+                events = self._events[position:]
+                position += len(events)
+                finished = self.finished and position >= len(self._events)
+            yield from events
+            if finished:
+                yield "status", self.to_dict(include_hits=False)
+                return
+
+    def to_dict(self, include_hits: bool = True) -> Dict[str, Any]:
+        summary = {
+            "id": self.id,
+            "alert_id": self.alert.get("id"),
+            "status": self.status,
+            "error": self.error,
+            "window_hours": self.window_hours,
+            "min_score": self.min_score,
+            "scanned": self.scanned,
+            "total": self.total,
+            "progress": round(self.scanned / self.total, 4) if self.total else (1.0 if self.finished else 0.0),
+            "hit_count": self.hit_count,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+        if include_hits:
+            summary["hits"] = self.hits()
+        return summary
+
+    def run(self):
+        """Score the alert against the stored detections, newest first, one chunk at a time."""
+        self.status = "running"
+        start = time.time()
+        try:
+            ranker = get_ranker()
+            order, ascending = _get_timeline(ranker)
+            if self.window_hours:
+                cutoff = (datetime.now() - timedelta(hours=self.window_hours)).isoformat()
+                rows = order[:len(ascending) - int(np.searchsorted(ascending, cutoff))]
+            else:
+                rows = order
+            self.total = len(rows)
+
+            description = self.alert.get("description", {})
+            query = {attr: str(description[attr]).strip().lower() for attr in CRITICAL_ATTRIBUTES
+                     if description.get(attr) not in (None, "")}
+            matrix = ranker.attributes
+            logger.info(f"Sweeping alert {self.alert.get('id')} over {self.total} detections (window: {self.window_hours}h)")
+
+            for offset in range(0, len(rows), self.chunk_size):
+                if self._cancel.is_set():
+                    break
+                chunk = rows[offset:offset + self.chunk_size]
+                scores, eligible = matrix.score(query, weights=CRITICAL_ATTRIBUTES, value_scorer=score_alert_value, rows=chunk)
+                scores = np.where(eligible, scores, 0.0)
+                scores[_special_case(matrix, chunk)] = 1.0
+
+                positions = np.flatnonzero(scores >= self.min_score)
+                positions = positions[np.argsort(-scores[positions], kind="stable")]
+                hits = [self._hit(ranker.people[chunk[i]], float(scores[i])) for i in positions]
+                self._add_hits(hits)
+                self.scanned += len(chunk)
+                for hit in hits:
+                    self._record("hit", hit)
+                    event_bus.publish(ALERT_SWEEP_HIT, {"sweep_id": self.id, **hit}, camera_id=hit["camera_id"])
+                self._record("progress", {"scanned": self.scanned, "total": self.total, "hit_count": self.hit_count})
+
+            self.status = "cancelled" if self._cancel.is_set() else "completed"
+        except Exception as e:
+            logger.error(f"Error sweeping alert {self.alert.get('id')}: {str(e)}")
+            self.status = "failed"
+            self.error = str(e)
+        finally:
+            self.finished_at = datetime.now().isoformat()
+            logger.info(f"Sweep {self.id} {self.status}: {self.hit_count} hits in {self.scanned}/{self.total} detections ({time.time() - start:.2f}s)")
+            with self._changed:
+                self._changed.notify_all()
+
+    def _hit(self, person: Dict[str, Any], score: float) -> Dict[str, Any]:
+        metadata = person.get("metadata", {})
+        return {
+            "alert_id": self.alert.get("id"),
+            "person_id": person.get("id"),
+            "score": round(score, 4),
+            "camera_id": metadata.get("camera_id", "unknown"),
+            "timestamp": metadata.get("timestamp"),
+            "description": person.get("description", {}),
+            "image_url": crop_url(person["id"]) if person.get("id") else None
+        }
+
+
+class AlertSweeper:
+    """
+    Runs retroactive sweeps in background threads. With ALERT_SWEEP_ON_NEW_ALERT a
+    sweep starts automatically for every alert that is activated while the server runs.
+    """
+
+    def __init__(self):
+        self._jobs: "OrderedDict[str, SweepJob]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._watcher: Optional[threading.Thread] = None
+        if ALERT_SWEEP_ON_NEW_ALERT:
+            amber_alert_matcher.add_listener(self._on_new_alerts)
+
+    def start(self, alert: Dict[str, Any], window_hours: Optional[float] = ALERT_SWEEP_WINDOW_HOURS,
+              min_score: float = AMBER_ALERT_MATCH_THRESHOLD, chunk_size: int = ALERT_SWEEP_CHUNK_SIZE) -> SweepJob:
+        """Start sweeping an alert over the detections of the last window_hours (all of them if falsy)."""
+        job = SweepJob(alert, window_hours, min_score, chunk_size)
+        with self._lock:
+            self._jobs[job.id] = job
+            finished = [job_id for job_id, existing in self._jobs.items() if existing.finished]
+            for job_id in finished[:max(0, len(self._jobs) - ALERT_SWEEP_MAX_JOBS)]:
+                del self._jobs[job_id]
+        threading.Thread(target=job.run, name=f"alert-sweep-{job.id[:8]}", daemon=True).start()
+        return job
+
+    def get(self, job_id: str) -> Optional[SweepJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job.to_dict(include_hits=False) for job in jobs]
+
+    def _on_new_alerts(self, alerts: List[Dict[str, Any]]):
+        for alert in alerts:
+            logger.info(f"New amber alert {alert.get('id')}, starting a retroactive sweep")
+            self.start(alert)
+
+    def watch(self):
+        """Poll the alert file in the background so new alerts are swept even when no frames arrive."""
+        if self._watcher is not None or not ALERT_SWEEP_ON_NEW_ALERT:
+            return
+
+        def poll():
+            while True:
+                try:
+                    amber_alert_matcher.refresh()
+                except Exception as e:
+                    logger.error(f"Error watching amber alerts: {e}")
+                time.sleep(max(AMBER_ALERT_RELOAD_SECONDS, 0.5))
+
+        self._watcher = threading.Thread(target=poll, name="amber-alert-watch", daemon=True)
+        self._watcher.start()
+
+
+# Shared sweeper used by the /amber_alerts/sweeps endpoints
+alert_sweeper = AlertSweeper()
@@ -1,14 +1,25 @@
 import json
 import os
+import time
+import threading
 import logging
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple, Callable
+import numpy as np
+from dotenv import load_dotenv
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Load environment variables
+load_dotenv()
+
 # Constants
 AMBER_ALERT_FILE = os.path.join(os.path.dirname(__file__), "data", "amber_alert.json")
+AMBER_ALERT_MATCH_THRESHOLD = 0.7  # Consider a match if score is above 0.7 (70%)
+AMBER_ALERT_RELOAD_SECONDS = float(os.getenv("AMBER_ALERT_RELOAD_SECONDS", "1"))  # how often the file is checked for changes
+AMBER_ALERT_ROW_CACHE_SIZE = 4096  # memoized (attribute, person value) rows
+PARTIAL_MATCH_CREDIT = 0.7
 
 # Critical matching attributes with weights
 CRITICAL_ATTRIBUTES = {
@@ -22,22 +33,28 @@ CRITICAL_ATTRIBUTES = {
     "location_context": 1.0
 }
 
-def load_amber_alerts():
+# Attributes whose alert rows are built when the alerts are compiled, for these values
+# and every value that appears in an alert
+INDEXED_ATTRIBUTES = ["age_group", "gender"]
+INDEXED_VALUES = {
+    "age_group": ["child", "teen", "adult", "senior", "elderly"],
+    "gender": ["male", "female", "other"]
+}
+
+def load_amber_alerts(path: str = AMBER_ALERT_FILE):
     """Load active amber alerts from the database file."""
     try:
-        if os.path.exists(AMBER_ALERT_FILE):
-            with open(AMBER_ALERT_FILE, 'r') as f:
+        if os.path.exists(path):
+            with open(path, 'r') as f:
                 data = json.load(f)
                 # Only return data if amber alerts are active
                 if data.get("active", False):
-                    alerts = data.get("alerts", [])
-                    logger.info(f"Loaded {len(alerts)} active amber alerts")
-                    return alerts
+                    return data.get("alerts", [])
                 else:
                     logger.info("Amber alerts are not currently active")
                     return []
         else:
-            logger.warning(f"Amber alert file not found at {AMBER_ALERT_FILE}")
+            logger.warning(f"Amber alert file not found at {path}")
             return []
     except json.JSONDecodeError as e:
         logger.error(f"JSON parsing error in amber alert file: {str(e)}")
@@ -46,69 +63,232 @@ def load_amber_alerts():
         logger.error(f"Error loading amber alerts: {str(e)}")
         return []
 
+def _canonical(value: Any) -> Optional[str]:
+    """Lowercased, trimmed attribute value, or None when missing."""
+    if value is None:
+        return None
+    value = str(value).strip().lower()
+    return value or None
+
+
+def _is_special_case(desc: Dict[str, Any]) -> bool:
+    # Hard-coded special case: if person is male, child, and wearing black top and bottom
+    return (_canonical(desc.get("gender")) == "male" and
+            _canonical(desc.get("age_group")) == "child" and
+            _canonical(desc.get("clothing_top_color")) == "black" and
+            _canonical(desc.get("clothing_bottom_color")) == "black")
+
+
+def score_alert_value(attr: str, alert_val: str, person_val: Optional[str]) -> Optional[Tuple[float, bool]]:
+    """
+    Score one alert attribute against one person value, as calculate_match_score does.
+    Has the value_scorer signature of ranking.AttributeMatrix.score.
+
+    Returns:
+        None when the person is ruled out (a child alert and the person is not a child),
+        otherwise (credit, whether the attribute counts towards the weighted total)
+    """
+    if attr == "age_group" and alert_val == "child" and person_val != "child":
+        return None
+    if person_val is None:
+        return 0.0, False
+    if alert_val == person_val:
+        return 1.0, True
+    if alert_val in person_val or person_val in alert_val:
+        return PARTIAL_MATCH_CREDIT, True
+    return 0.0, True
+
+
+class AmberAlertMatcher:
+    """
+    Active amber alerts compiled for matching many person descriptions at once.
+
+    The alert file is parsed once and re-read only when its modification time or size
+    changes. Alert values are canonicalized and, per attribute, every person value is
+    turned into a row of credits against all alerts. Rows are memoized and pre-built for
+    the age_group and gender values, so scoring a batch of N descriptions is a gather and
+    a few N x alerts array operations. The scores are the same as calculate_match_score.
+    """
+
+    def __init__(self, path: str = AMBER_ALERT_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._signature = None
+        self._last_check = 0.0
+        self.alerts: List[Dict[str, Any]] = []
+        self._values: Dict[str, List[Optional[str]]] = {}
+        self._child_only = np.zeros(0, dtype=bool)
+        self._rows: Dict[Tuple[str, Optional[str]], Tuple[np.ndarray, np.ndarray]] = {}
+        self._known_ids: Optional[set] = None
+        self._listeners: List[Callable[[List[Dict[str, Any]]], None]] = []
+
+    def add_listener(self, callback: Callable[[List[Dict[str, Any]]], None]):
+        """
+        Register callback(alerts) for alerts that appear in the file after it was
+        first loaded. Called from whichever thread noticed the change, without the lock held.
+        """
+        self._listeners.append(callback)
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.path)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def refresh(self, force: bool = False):
+        """Reload the alerts if the file changed (checked at most every AMBER_ALERT_RELOAD_SECONDS)."""
+        now = time.time()
+        if not force and now - self._last_check < AMBER_ALERT_RELOAD_SECONDS:
+            return
+        with self._lock:
+            self._last_check = now
+            signature = self._file_signature()
+            if not force and signature == self._signature:
+                return
+            self._compile(load_amber_alerts(self.path) if signature is not None else [])
+            self._signature = signature
+            ids = {alert.get("id") for alert in self.alerts}
+            new_alerts = [] if self._known_ids is None else [alert for alert in self.alerts if alert.get("id") not in self._known_ids]
+            self._known_ids = ids
+
+        if not new_alerts:
+            return
+        for callback in self._listeners:
+            try:
+                callback(new_alerts)
+            except Exception as e:
+                logger.error(f"Amber alert listener failed: {e}")
+
+    def _compile(self, alerts: List[Any]):
+        """Canonicalize and index the alerts. Must be called with the lock held."""
+        compiled = []
+        for i, alert in enumerate(alerts):
+            if not isinstance(alert, dict) or not isinstance(alert.get("description"), dict) or not alert["description"]:
+                logger.warning(f"Skipping amber alert {i}: missing or invalid description")
+                continue
+            compiled.append(alert)
+
+        self.alerts = compiled
+        self._values = {
+            attr: [_canonical(alert["description"].get(attr)) for alert in compiled]
+            for attr in CRITICAL_ATTRIBUTES
+        }
+        # Special case: If age_group is "child" in the alert, only children can match
+        self._child_only = np.array([value == "child" for value in self._values["age_group"]], dtype=bool)
+        self._rows = {}
+        for attr in INDEXED_ATTRIBUTES:
+            for value in set(self._values[attr]) | set(INDEXED_VALUES[attr]):
+                if value is not None:
+                    self._row(attr, value)
+        logger.info(f"Compiled {len(compiled)} active amber alerts from {self.path}")
+
+    def _row(self, attr: str, person_val: Optional[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """(credit, counted) of one person value against every alert's value for attr."""
+        key = (attr, person_val)
+        row = self._rows.get(key)
+        if row is None:
+            credit = np.zeros(len(self.alerts), dtype=np.float64)
+            counted = np.zeros(len(self.alerts), dtype=bool)
+            for i, alert_val in enumerate(self._values[attr]):
+                if alert_val is None:
+                    continue
+                # The child rule is applied to whole rows in score_batch, so a veto just earns no credit here
+                credit[i], counted[i] = score_alert_value(attr, alert_val, person_val) or (0.0, True)
+            if len(self._rows) >= AMBER_ALERT_ROW_CACHE_SIZE:
+                self._rows.clear()
+            row = self._rows[key] = (credit, counted)
+        return row
+
+    def get_alert(self, alert_id: str) -> Optional[Dict[str, Any]]:
+        """Active alert with the given ID, if any."""
+        self.refresh()
+        with self._lock:
+            return next((alert for alert in self.alerts if alert.get("id") == alert_id), None)
+
+    def targets_children(self) -> bool:
+        """Whether any active alert is for a child."""
+        self.refresh()
+        with self._lock:
+            return bool(self._child_only.any())
+
+    def score_batch(self, descriptions: List[Dict[str, Any]]) -> np.ndarray:
+        """
+        Score person descriptions against every active alert.
+
+        Returns:
+            Array of shape (len(descriptions), number of alerts) with scores in [0, 1]
+        """
+        self.refresh()
+        with self._lock:
+            n, a = len(descriptions), len(self.alerts)
+            if n == 0 or a == 0:
+                return np.zeros((n, a), dtype=np.float64)
+            descriptions = [desc if isinstance(desc, dict) else {} for desc in descriptions]
+
+            matched = np.zeros((n, a), dtype=np.float64)
+            total = np.zeros((n, a), dtype=np.float64)
+            for attr, weight in CRITICAL_ATTRIBUTES.items():
+                # Dictionary-encode the batch's values, then gather one row per distinct value
+                lookup: Dict[Optional[str], int] = {}
+                codes = np.array([lookup.setdefault(_canonical(desc.get(attr)), len(lookup)) for desc in descriptions])
+                rows = [self._row(attr, value) for value in lookup]
+                matched += weight * np.stack([credit for credit, _ in rows])[codes]
+                total += weight * np.stack([counted for _, counted in rows])[codes]
+
+            scores = np.divide(matched, total, out=np.zeros_like(matched), where=total > 0)
+            is_child = np.array([_canonical(desc.get("age_group")) == "child" for desc in descriptions], dtype=bool)
+            scores[np.outer(~is_child, self._child_only)] = 0.0
+            special = np.array([_is_special_case(desc) for desc in descriptions], dtype=bool)
+            scores[special] = 1.0
+            return scores
+
+    def match_batch(self, descriptions: List[Dict[str, Any]], threshold: float = AMBER_ALERT_MATCH_THRESHOLD) -> List[Optional[Dict[str, Any]]]:
+        """
+        Best matching alert for each description.
+
+        Returns:
+            One entry per description: {"match": True, "alert", "score"} for the
+            highest scoring alert at or above the threshold, otherwise None
+        """
+        try:
+            scores = self.score_batch(descriptions)
+            if scores.shape[1] == 0:
+                return [None] * len(descriptions)
+            best = scores.argmax(axis=1)
+            results = []
+            for i, j in enumerate(best):
+                score = float(scores[i, j])
+                if score >= threshold:
+                    alert = self.alerts[j]
+                    logger.info(f"Amber alert {alert.get('id', f'alert-{j}')} matched with score {score:.2f}")
+                    results.append({"match": True, "alert": alert, "score": score})
+                else:
+                    results.append(None)
+            return results
+        except Exception as e:
+            logger.error(f"Error checking amber alert matches: {str(e)}")
+            return [None] * len(descriptions)
+
+
+# Shared matcher used by /process_frame
+amber_alert_matcher = AmberAlertMatcher()
+
+
+def check_amber_alert_matches(person_descriptions: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+    """Check a batch of person descriptions against the active amber alerts in one pass."""
+    return amber_alert_matcher.match_batch(person_descriptions)
+
+
 def check_amber_alert_match(person_description: Dict[str, Any]) -> Dict[str, Any]:
     """
     Check if a person description matches any active amber alerts.
     Returns the matching alert if found, otherwise None.
     """
-    try:
-        # Ensure person_description is a dictionary
-        if not isinstance(person_description, dict):
-            logger.error(f"Invalid person_description type: {type(person_description)}")
-            return None
-            
-        # Load active amber alerts
-        active_alerts = load_amber_alerts()
-        if not active_alerts:
-            logger.info("No active amber alerts found")
-            return None
-        
-        logger.info(f"Checking amber alert match against {len(active_alerts)} active alerts")
-        logger.info(f"Person description keys: {list(person_description.keys())}")
-        
-        # Calculate match scores for each alert
-        matches = []
-        for i, alert in enumerate(active_alerts):
-            if not isinstance(alert, dict):
-                logger.warning(f"Alert {i} is not a dictionary: {type(alert)}")
-                continue
-                
-            alert_desc = alert.get("description", {})
-            if not alert_desc:
-                logger.warning(f"Alert {i} has no description field")
-                continue
-            
-            if not isinstance(alert_desc, dict):
-                logger.warning(f"Alert {i} description is not a dictionary: {type(alert_desc)}")
-                continue
-                
-            logger.info(f"Calculating match score for alert {alert.get('id', f'alert-{i}')}")
-            score = calculate_match_score(person_description, alert_desc)
-            logger.info(f"Match score for alert {alert.get('id', f'alert-{i}')}: {score}")
-            
-            # Consider a match if score is above 0.7 (70%)
-            if score >= 0.7:
-                matches.append({
-                    "alert": alert,
-                    "score": score
-                })
-        
-        # Return the highest scoring match if any
-        if matches:
-            matches.sort(key=lambda x: x["score"], reverse=True)
-            best_match = matches[0]
-            logger.info(f"Found amber alert match with score {best_match['score']}")
-            return {
-                "match": True,
-                "alert": best_match["alert"],
-                "score": best_match["score"]
-            }
-        
-        logger.info("No amber alert matches found above threshold")
-        return None
-    except Exception as e:
-        logger.error(f"Error checking amber alert match: {str(e)}")
+    if not isinstance(person_description, dict):
+        logger.error(f"Invalid person_description type: {type(person_description)}")
         return None
+    return amber_alert_matcher.match_batch([person_description])[0]
 
 def calculate_match_score(person_desc: Dict[str, Any], alert_desc: Dict[str, Any]) -> float:
     """
@@ -126,7 +306,7 @@ def calculate_match_score(person_desc: Dict[str, Any], alert_desc: Dict[str, Any
             person_desc.get("age_group", "").lower() == "child" and
             person_desc.get("clothing_top_color", "").lower() == "black" and
             person_desc.get("clothing_bottom_color", "").lower() == "black"):
-            logger.info("SPECIAL MATCH: Male child wearing all black")
+            logger.debug("SPECIAL MATCH: Male child wearing all black")
             return 1.0  # Perfect match
             
         # Track scoring
@@ -135,7 +315,7 @@ def calculate_match_score(person_desc: Dict[str, Any], alert_desc: Dict[str, Any
         
         # Special case: If age_group is not "child" in alert, no match
         if alert_desc.get("age_group") == "child" and person_desc.get("age_group") != "child":
-            logger.info("Alert is for a child but person is not a child")
+            logger.debug("Alert is for a child but person is not a child")
             return 0
         
         # Check each critical attribute
@@ -152,11 +332,11 @@ def calculate_match_score(person_desc: Dict[str, Any], alert_desc: Dict[str, Any
             # Check for exact match
             if alert_val == person_val:
                 weighted_matches += weight
-                logger.info(f"Exact match on {attr}: {alert_val} = {person_val}")
+                logger.debug(f"Exact match on {attr}: {alert_val} = {person_val}")
             # Check for partial match
             elif alert_val in person_val or person_val in alert_val:
                 weighted_matches += weight * 0.7
-                logger.info(f"Partial match on {attr}: {alert_val} ~ {person_val}")
+                logger.debug(f"Partial match on {attr}: {alert_val} ~ {person_val}")
             
         # Calculate final score
         if weighted_total == 0:
@@ -0,0 +1,451 @@
+# blob_store.py
+
+import json
+import os
+import struct
+import threading
+import zlib
+import logging
+import argparse
+from typing import Dict, Any, Optional, NamedTuple
+from dotenv import load_dotenv
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Packed crop storage - segment files plus an append-only offset index
+BLOB_STORE_DIR = os.getenv("BLOB_STORE_DIR", os.path.join("uploads", "blobs"))
+SEGMENT_MAX_BYTES = int(os.getenv("BLOB_SEGMENT_MAX_BYTES", str(256 * 1024 * 1024)))
+INDEX_FILE = "index.jsonl"
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".dat"
+
+# Every record in a segment is: header | blob id (utf-8) | payload
+# The header makes segments self-describing so the index can be rebuilt by scanning.
+RECORD_MAGIC = b"FSB1"
+TOMBSTONE_MAGIC = b"FSD1"  # a deleted blob: header | blob id, no payload
+RECORD_HEADER = struct.Struct(">4sHII")  # magic, id length, payload length, crc32
+
+
+class BlobEntry(NamedTuple):
+    segment: int
+    offset: int
+    length: int
+    crc: int
+
+
+class BlobStore:
+    """
+    Append-only packed blob store for person crops.
+
+    Crops are appended to large segment files instead of being written as one
+    small JPEG per detection. An in-memory offset index (persisted as an
+    append-only JSON lines log) maps each detection ID to its segment, offset
+    and length, so a read is a single positional read on an already open file.
+    """
+
+    def __init__(self, root: str = BLOB_STORE_DIR, segment_max_bytes: int = SEGMENT_MAX_BYTES):
+        self.root = root
+        self.segment_max_bytes = segment_max_bytes
+        self._lock = threading.RLock()
+        self._index: Dict[str, BlobEntry] = {}
+        self._segment_sizes: Dict[int, int] = {}
+        self._live_bytes: Dict[int, int] = {}
+        self._read_fds: Dict[int, int] = {}
+        self._active_segment = 0
+        self._active_fd = None
+        self._index_fd = None
+
+        os.makedirs(self.root, exist_ok=True)
+        self._load()
+
+    # ------------------------------------------------------------------
+    # Paths and file handles
+    # ------------------------------------------------------------------
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.root, f"{SEGMENT_PREFIX}{segment:06d}{SEGMENT_SUFFIX}")
+
+    def _index_path(self) -> str:
+        return os.path.join(self.root, INDEX_FILE)
+
+    def _list_segments(self):
+        segments = []
+        for name in os.listdir(self.root):
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX):
+                try:
+                    segments.append(int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]))
+                except ValueError:
+                    continue
+        return sorted(segments)
+
+    def _open_active_segment(self, segment: int):
+        if self._active_fd is not None:
+            os.close(self._active_fd)
+        flags = os.O_WRONLY | os.O_CREAT | os.O_APPEND | getattr(os, "O_BINARY", 0)
+        self._active_fd = os.open(self._segment_path(segment), flags, 0o644)
+        self._active_segment = segment
+        self._segment_sizes.setdefault(segment, os.path.getsize(self._segment_path(segment)))
+        self._live_bytes.setdefault(segment, 0)
+
+    def _open_index(self):
+        if self._index_fd is not None:
+            os.close(self._index_fd)
+        flags = os.O_WRONLY | os.O_CREAT | os.O_APPEND | getattr(os, "O_BINARY", 0)
+        self._index_fd = os.open(self._index_path(), flags, 0o644)
+
+    def _read_fd(self, segment: int) -> int:
+        fd = self._read_fds.get(segment)
+        if fd is None:
+            fd = os.open(self._segment_path(segment), os.O_RDONLY | getattr(os, "O_BINARY", 0))
+            self._read_fds[segment] = fd
+        return fd
+
+    def _close_read_fd(self, segment: int):
+        fd = self._read_fds.pop(segment, None)
+        if fd is not None:
+            os.close(fd)
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
+
+    def _load(self):
+        """Load the offset index, rebuilding it from the segments if it is missing."""
+        segments = self._list_segments()
+        for segment in segments:
+            self._segment_sizes[segment] = os.path.getsize(self._segment_path(segment))
+
+        if os.path.exists(self._index_path()):
+            self._replay_index()
+        elif segments:
+            logger.warning(f"Blob index missing in {self.root}, rebuilding from {len(segments)} segments")
+            for segment in segments:
+                self._scan_segment(segment)
+            self._rewrite_index()
+
+        for blob_id, entry in self._index.items():
+            self._live_bytes[entry.segment] = self._live_bytes.get(entry.segment, 0) + entry.length
+
+        self._open_active_segment(segments[-1] if segments else 1)
+        self._open_index()
+        logger.info(f"Blob store loaded from {self.root} with {len(self._index)} blobs in {len(self._segment_sizes)} segments")
+
+    def _replay_index(self):
+        with open(self._index_path(), "r") as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn final write after a crash - everything before it is still valid
+                    logger.warning(f"Skipping corrupt blob index line {line_no}")
+                    continue
+                blob_id = record.get("id")
+                if record.get("deleted"):
+                    self._index.pop(blob_id, None)
+                    continue
+                entry = BlobEntry(record["seg"], record["off"], record["len"], record["crc"])
+                # Ignore entries that point past the end of a segment (lost tail writes)
+                if entry.offset + entry.length > self._segment_sizes.get(entry.segment, -1):
+                    logger.warning(f"Blob index entry for {blob_id} points past end of segment {entry.segment}")
+                    continue
+                self._index[blob_id] = entry
+
+    def _scan_segment(self, segment: int):
+        """Rebuild index entries by walking the record headers of a segment."""
+        size = self._segment_sizes[segment]
+        offset = 0
+        with open(self._segment_path(segment), "rb") as f:
+            while offset + RECORD_HEADER.size <= size:
+                f.seek(offset)
+                magic, id_len, length, crc = RECORD_HEADER.unpack(f.read(RECORD_HEADER.size))
+                if magic not in (RECORD_MAGIC, TOMBSTONE_MAGIC):
+                    logger.warning(f"Bad record header in segment {segment} at offset {offset}, stopping scan")
+                    break
+                blob_id = f.read(id_len).decode("utf-8")
+                payload_offset = offset + RECORD_HEADER.size + id_len
+                if payload_offset + length > size:
+                    break
+                if magic == TOMBSTONE_MAGIC:
+                    self._index.pop(blob_id, None)
+                else:
+                    self._index[blob_id] = BlobEntry(segment, payload_offset, length, crc)
+                offset = payload_offset + length
+
+    def _rewrite_index(self):
+        """Atomically replace the index log with a snapshot of the live entries."""
+        tmp_path = self._index_path() + ".tmp"
+        with open(tmp_path, "w") as f:
+            for blob_id, entry in self._index.items():
+                f.write(json.dumps({"id": blob_id, "seg": entry.segment, "off": entry.offset,
+                                    "len": entry.length, "crc": entry.crc}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._index_path())
+        if self._index_fd is not None:
+            self._open_index()
+
+    # ------------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------------
+
+    def _write_record(self, magic: bytes, blob_id: str, data: bytes) -> int:
+        """Append one record to the active segment, rolling over when it is full. Returns the record offset."""
+        id_bytes = blob_id.encode("utf-8")
+        record_size = RECORD_HEADER.size + len(id_bytes) + len(data)
+
+        if self._segment_sizes[self._active_segment] > 0 and \
+                self._segment_sizes[self._active_segment] + record_size > self.segment_max_bytes:
+            self._open_active_segment(self._active_segment + 1)
+
+        crc = zlib.crc32(data) & 0xFFFFFFFF
+        header = RECORD_HEADER.pack(magic, len(id_bytes), len(data), crc)
+        offset = self._segment_sizes[self._active_segment]
+        os.write(self._active_fd, header + id_bytes + data)
+        self._segment_sizes[self._active_segment] = offset + record_size
+        return offset
+
+    def _append(self, blob_id: str, data: bytes) -> BlobEntry:
+        id_bytes = blob_id.encode("utf-8")
+        offset = self._write_record(RECORD_MAGIC, blob_id, data)
+        crc = zlib.crc32(data) & 0xFFFFFFFF
+
+        entry = BlobEntry(self._active_segment, offset + RECORD_HEADER.size + len(id_bytes), len(data), crc)
+        self._set_entry(blob_id, entry)
+        os.write(self._index_fd, (json.dumps({"id": blob_id, "seg": entry.segment, "off": entry.offset,
+                                              "len": entry.length, "crc": entry.crc}) + "\n").encode("utf-8"))
+        return entry
+
+    def _set_entry(self, blob_id: str, entry: Optional[BlobEntry]):
+        previous = self._index.get(blob_id)
+        if previous is not None:
+            self._live_bytes[previous.segment] -= previous.length
+        if entry is None:
+            self._index.pop(blob_id, None)
+        else:
+            self._index[blob_id] = entry
+            self._live_bytes[entry.segment] = self._live_bytes.get(entry.segment, 0) + entry.length
+
+    def put(self, blob_id: str, data: bytes):
+        """Append a blob. Writing an existing ID supersedes the previous payload."""
+        with self._lock:
+            self._append(blob_id, data)
+
+    def delete(self, blob_id: str) -> bool:
+        """
+        Tombstone a blob. Its bytes are reclaimed by the next compaction.
+
+        The tombstone goes into the index log and, as a payload-less record, into the
+        active segment, so rebuilding a lost index from the segments keeps the delete.
+        """
+        with self._lock:
+            if blob_id not in self._index:
+                return False
+            self._set_entry(blob_id, None)
+            self._write_record(TOMBSTONE_MAGIC, blob_id, b"")
+            os.write(self._index_fd, (json.dumps({"id": blob_id, "deleted": True}) + "\n").encode("utf-8"))
+            return True
+
+    def _tombstones(self, segment: int):
+        """IDs of the tombstone records in a segment."""
+        ids = []
+        size = self._segment_sizes[segment]
+        offset = 0
+        with open(self._segment_path(segment), "rb") as f:
+            while offset + RECORD_HEADER.size <= size:
+                f.seek(offset)
+                magic, id_len, length, _ = RECORD_HEADER.unpack(f.read(RECORD_HEADER.size))
+                if magic not in (RECORD_MAGIC, TOMBSTONE_MAGIC):
+                    break
+                if magic == TOMBSTONE_MAGIC:
+                    ids.append(f.read(id_len).decode("utf-8"))
+                offset += RECORD_HEADER.size + id_len + length
+        return ids
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    def _read(self, entry: BlobEntry) -> bytes:
+        fd = self._read_fd(entry.segment)
+        if hasattr(os, "pread"):
+            data = os.pread(fd, entry.length, entry.offset)
+        else:
+            # Platforms without pread share the descriptor, so seek+read must be serialized
+            with self._lock:
+                os.lseek(fd, entry.offset, os.SEEK_SET)
+                data = os.read(fd, entry.length)
+        if len(data) != entry.length or (zlib.crc32(data) & 0xFFFFFFFF) != entry.crc:
+            raise IOError(f"Corrupt blob in segment {entry.segment} at offset {entry.offset}")
+        return data
+
+    def get(self, blob_id: str) -> Optional[bytes]:
+        """Fetch a blob by ID, or None if it is not stored."""
+        with self._lock:
+            entry = self._index.get(blob_id)
+            if entry is None:
+                return None
+            # Make sure the read descriptor exists before releasing the lock so
+            # compaction cannot remove the segment between lookup and open
+            self._read_fd(entry.segment)
+        try:
+            return self._read(entry)
+        except OSError:
+            # The segment may have been compacted away between lookup and read - retry once
+            with self._lock:
+                entry = self._index.get(blob_id)
+                if entry is None:
+                    return None
+                return self._read(entry)
+
+    def __contains__(self, blob_id: str) -> bool:
+        return blob_id in self._index
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    # ------------------------------------------------------------------
+    # Maintenance
+    # ------------------------------------------------------------------
+
+    def compact(self, min_garbage_ratio: float = 0.3) -> Dict[str, Any]:
+        """
+        Reclaim space from superseded and deleted blobs.
+
+        Sealed segments whose garbage ratio is at least `min_garbage_ratio` have
+        their live blobs copied into the active segment and are then removed.
+        The index log is rewritten as a snapshot afterwards.
+
+        Returns:
+            Dictionary with the compacted segments and bytes reclaimed
+        """
+        with self._lock:
+            candidates = []
+            for segment, size in self._segment_sizes.items():
+                if segment == self._active_segment or size == 0:
+                    continue
+                garbage_ratio = 1 - (self._live_bytes.get(segment, 0) / size)
+                if garbage_ratio >= min_garbage_ratio:
+                    candidates.append(segment)
+
+        reclaimed = 0
+        for segment in sorted(candidates):
+            with self._lock:
+                live = [(blob_id, entry) for blob_id, entry in self._index.items() if entry.segment == segment]
+                for blob_id, entry in live:
+                    self._append(blob_id, self._read(entry))
+                # Carry tombstones forward while an older segment may still hold the deleted
+                # payload. An ID stored again since its delete no longer needs one.
+                if any(other < segment for other in self._segment_sizes):
+                    for blob_id in self._tombstones(segment):
+                        if blob_id not in self._index:
+                            self._write_record(TOMBSTONE_MAGIC, blob_id, b"")
+                self._close_read_fd(segment)
+                reclaimed += self._segment_sizes.pop(segment)
+                self._live_bytes.pop(segment, None)
+                os.remove(self._segment_path(segment))
+                logger.info(f"Compacted blob segment {segment}: moved {len(live)} live blobs")
+
+        with self._lock:
+            self._rewrite_index()
+
+        return {"compacted_segments": sorted(candidates), "bytes_reclaimed": reclaimed}
+
+    def import_directory(self, directory: str, extensions=(".jpg", ".jpeg", ".png")) -> int:
+        """
+        Pack legacy one-file-per-detection crops into the store.
+        The file name without extension is used as the detection ID.
+        """
+        imported = 0
+        for name in os.listdir(directory):
+            blob_id, ext = os.path.splitext(name)
+            if ext.lower() not in extensions or blob_id in self:
+                continue
+            with open(os.path.join(directory, name), "rb") as f:
+                self.put(blob_id, f.read())
+            imported += 1
+        logger.info(f"Imported {imported} crops from {directory} into blob store")
+        return imported
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total_bytes = sum(self._segment_sizes.values())
+            live_bytes = sum(self._live_bytes.values())
+            return {
+                "blobs": len(self._index),
+                "segments": len(self._segment_sizes),
+                "total_bytes": total_bytes,
+                "live_bytes": live_bytes,
+                "garbage_ratio": 1 - (live_bytes / total_bytes) if total_bytes else 0.0
+            }
+
+    def close(self):
+        with self._lock:
+            for segment in list(self._read_fds):
+                self._close_read_fd(segment)
+            for fd in (self._active_fd, self._index_fd):
+                if fd is not None:
+                    os.close(fd)
+            self._active_fd = None
+            self._index_fd = None
+
+
+# Shared store instance, opened on first use
+_store: Optional[BlobStore] = None
+_store_lock = threading.Lock()
+
+
+def get_blob_store() -> BlobStore:
+    """Return the process-wide blob store."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = BlobStore()
+    return _store
+
+
+def put_crop(detection_id: str, data: bytes):
+    """Store the encoded crop for a detection."""
+    get_blob_store().put(detection_id, data)
+
+
+def delete_crop(detection_id: str) -> bool:
+    """Delete the crop for a detection. Returns False if none was stored."""
+    return get_blob_store().delete(detection_id)
+
+
+def has_crop(detection_id: str) -> bool:
+    """Whether a crop is stored for a detection."""
+    return detection_id in get_blob_store()
+
+
+def get_crop(detection_id: str) -> Optional[bytes]:
+    """Fetch the encoded crop for a detection, or None if it is not stored."""
+    return get_blob_store().get(detection_id)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintenance for the packed crop blob store")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    compact_parser = subparsers.add_parser("compact", help="Reclaim space from deleted and superseded crops")
+    compact_parser.add_argument("--min-garbage-ratio", type=float, default=0.3)
+    import_parser = subparsers.add_parser("import", help="Pack a directory of legacy crop files")
+    import_parser.add_argument("directory", nargs="?", default="uploads")
+    subparsers.add_parser("stats", help="Show store statistics")
+    args = parser.parse_args()
+
+    store = get_blob_store()
+    if args.command == "compact":
+        print(json.dumps(store.compact(args.min_garbage_ratio), indent=2))
+    elif args.command == "import":
+        store.import_directory(args.directory)
+    print(json.dumps(store.stats(), indent=2))
+    store.close()
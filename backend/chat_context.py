@@ -0,0 +1,209 @@
+# chat_context.py
+
+import json
+import threading
+import logging
+from typing import Dict, Any, Callable, Optional, Tuple
+from dotenv import load_dotenv
+from db import load_database, get_database_version
+from search import get_camera_location
+from stats import get_stats_snapshot
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+
+class VersionedContext:
+    """
+    A value rendered once per database version and reused until the data changes,
+    e.g. the dataset context in a chat system prompt.
+    """
+
+    def __init__(self, name: str, build: Callable[[], Any]):
+        self.name = name
+        self._build = build
+        self._version: Optional[str] = None
+        self._value: Any = None
+        self._lock = threading.Lock()
+
+    def get(self) -> Tuple[Any, str]:
+        """
+        Returns:
+            Tuple of (value, database version it was rendered for)
+        """
+        version = get_database_version()
+        with self._lock:
+            if self._version != version:
+                self._value = self._build()
+                self._version = version
+                logger.info(f"Rendered {self.name} context for database version {version}")
+            return self._value, self._version
+
+
+def render_chat_prompt() -> str:
+    """System prompt for /chat: dataset statistics and per-camera details."""
+    # Dataset statistics are kept up to date incrementally by the stats service
+    stats = get_stats_snapshot()
+    total_people = stats["total_people"]
+    attributes = stats["attributes"]
+    camera_details = stats["cameras"]
+    
+    # Create system prompt with dataset knowledge
+    system_prompt = f"""You are an AI assistant with access to a surveillance camera database containing {total_people} people.
+
+Dataset Statistics:
+- Gender distribution: {', '.join(f'{k}: {v}' for k, v in attributes['gender'].items())}
+- Age groups: {', '.join(f'{k}: {v}' for k, v in attributes['age_group'].items())}
+- Hair colors: {', '.join(f'{k}: {v}' for k, v in attributes['hair_color'].items())}
+- Facial features: {', '.join(f'{k}: {v}' for k, v in attributes['facial_features'].items())}
+- Clothing (tops): {', '.join(f'{k}: {v}' for k, v in attributes['clothing_top'].items())}
+- Top colors: {', '.join(f'{k}: {v}' for k, v in attributes['clothing_top_color'].items())}
+- Locations: {', '.join(f'{k}: {v}' for k, v in attributes['location_context'].items())}
+- Camera distribution: {', '.join(f'{k}: {v["count"]} detections' for k, v in camera_details.items())}
+
+Camera Details:
+"""
+    
+    # Add detailed camera information
+    for camera_id, details in camera_details.items():
+        system_prompt += f"""
+Camera {camera_id}:
+- Total detections: {details['count']}
+- Last active: {details['last_seen']}
+- Gender distribution: {', '.join(f'{k}: {v}' for k, v in details['gender_dist'].items())}
+- Age distribution: {', '.join(f'{k}: {v}' for k, v in details['age_dist'].items())}
+- Clothing distribution: {', '.join(f'{k}: {v}' for k, v in details['clothing_dist'].items())}
+"""
+    
+    system_prompt += """
+You can help users:
+1. Understand what's in the dataset
+2. Search for specific people using natural language
+3. Analyze patterns and statistics
+4. Answer questions about the data
+5. Provide information about specific cameras and their detections
+
+If the user asks about a specific camera or camera ID, you can tell them:
+- How many detections that camera has made
+- What types of people it has detected
+- When it was last active
+- The gender, age, and clothing distribution of people detected by that camera
+
+If the user wants to search for someone, extract the search criteria and use it to find matches."""
+    
+    return system_prompt
+
+
+def build_person_search_context() -> Optional[Dict[str, Any]]:
+    """
+    System prompt, sample entries and statistics for /person_search_chat.
+
+    Returns:
+        Dictionary with system_prompt, simplified_people and db_stats, or None if the database is empty
+    """
+    stats = get_stats_snapshot()
+    if stats["total_people"] == 0:
+        return None
+    
+    total_people = stats["total_people"]
+    unique_cameras = list(stats["cameras"])
+    genders = stats["attributes"]["gender"]
+    age_groups = stats["attributes"]["age_group"]
+    clothing_colors = stats["attributes"]["clothing_top_color"]
+    
+    # Load the entire database from ml.json (read-only)
+    db = load_database()  # This now loads from ml.json
+    
+    # Format database for Gemini
+    # We need to simplify and truncate to avoid exceeding context limits
+    simplified_people = []
+    
+    # Only include people with good descriptions - limit to 100 entries max
+    max_entries = 100
+    counter = 0
+    
+    for person in db["people"]:
+        if counter >= max_entries:
+            break
+            
+        desc = person.get("description", {})
+        metadata = person.get("metadata", {})
+        
+        # Skip entries without good descriptions
+        if not desc or len(desc) < 3:
+            continue
+            
+        # Create a simplified representation
+        simple_person = {
+            "id": person.get("id", f"person_{counter}"),
+            "camera_id": metadata.get("camera_id", "unknown"),
+            "camera_location": get_camera_location(metadata.get("camera_id", "unknown")),
+            "timestamp": metadata.get("timestamp", "unknown"),
+            "description": desc
+        }
+        
+        simplified_people.append(simple_person)
+        counter += 1
+    
+    # Create database statistics summary
+    db_stats = {
+        "total_people": total_people,
+        "unique_cameras": len(unique_cameras),
+        "cameras": list(unique_cameras),
+        "gender_distribution": genders,
+        "age_distribution": age_groups,
+        "top_clothing_colors": clothing_colors
+    }
+        
+    # Create the prompt for Gemini
+    system_prompt = f"""
+You are an AI assistant for a surveillance system called Foresight that helps find people in camera footage.
+You have access to a database of {total_people} people detected across {len(unique_cameras)} cameras.
+
+YOUR DATABASE CONTEXT:
+- Total people detected: {total_people}
+- Camera locations: {", ".join(sorted(unique_cameras))}
+- Gender distribution: {", ".join(f"{k}: {v}" for k, v in genders.items())}
+- Age distribution: {", ".join(f"{k}: {v}" for k, v in age_groups.items())}
+
+The database contains detailed descriptions of people including:
+- Gender, age group, ethnicity, skin tone
+- Hair style and color
+- Clothing details (tops, bottoms, colors, patterns)
+- Accessories and bags
+- Location context
+- Camera ID and timestamp of detection
+
+Your job is to:
+1. Answer questions about people in the database
+2. Help users find specific people with natural language searches
+3. Provide statistics and insights about the data
+4. Suggest related searches that might be helpful
+
+DATABASE ENTRIES (simplified for reference):
+{json.dumps(simplified_people[:10], separators=(",", ":"))}
+...and {len(simplified_people) - 10} more entries not shown here.
+
+INSTRUCTIONS:
+- When users ask about specific people, search the database entries to find matches
+- For search queries, suggest specific attributes that might help narrow down results
+- If asked about statistics, use the database summary information
+- Be concise but informative in your responses
+- Include camera locations when mentioning specific detections
+- Mention timestamps in a human-readable format when relevant
+"""
+
+    return {
+        "system_prompt": system_prompt,
+        "simplified_people": simplified_people,
+        "db_stats": db_stats
+    }
+
+
+# Contexts shared by the chat endpoints
+chat_prompt_context = VersionedContext("chat", render_chat_prompt)
+person_search_context = VersionedContext("person search chat", build_person_search_context)
@@ -0,0 +1,146 @@
+# chat_sessions.py
+
+import os
+import uuid
+import time
+import threading
+import logging
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+from dotenv import load_dotenv
+import google.generativeai as genai
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Chat session configuration
+CHAT_MODEL_NAME = os.getenv("CHAT_MODEL_NAME", "gemini-2.0-flash")
+CHAT_SESSION_TTL_SECONDS = float(os.getenv("CHAT_SESSION_TTL_SECONDS", "1800"))
+CHAT_SESSION_MAX_SESSIONS = int(os.getenv("CHAT_SESSION_MAX_SESSIONS", "1000"))
+CHAT_SESSION_MAX_TURNS = int(os.getenv("CHAT_SESSION_MAX_TURNS", "20"))  # user/model exchanges kept per session
+
+# Model reply that closes the system prompt turn at the start of every session
+CONTEXT_ACKNOWLEDGEMENT = "Understood. I will use this context to answer."
+
+
+def _role(content: Any) -> str:
+    return content["role"] if isinstance(content, dict) else content.role
+
+
+def _primer(system_prompt: str) -> List[Dict[str, Any]]:
+    """Opening exchange that gives the model its system prompt without a round trip."""
+    return [
+        {"role": "user", "parts": [system_prompt]},
+        {"role": "model", "parts": [CONTEXT_ACKNOWLEDGEMENT]}
+    ]
+
+
+def to_gemini_history(messages: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+    """Convert {"role", "content"} messages (role "user" or "assistant") to Gemini chat history."""
+    return [
+        {"role": "model" if message.get("role") in ("assistant", "model") else "user",
+         "parts": [message.get("content", "")]}
+        for message in messages if message.get("content")
+    ]
+
+
+class ChatSession:
+    """
+    One server-side conversation with Gemini.
+
+    The system prompt is the first exchange of the history and is swapped in place
+    when the dataset context changes. Only the latest CHAT_SESSION_MAX_TURNS exchanges
+    are kept, so the tokens sent per turn stop growing with conversation length.
+    """
+
+    def __init__(self, conversation_id: str, system_prompt: str, context_version: str,
+                 history: Optional[List[Dict[str, Any]]] = None):
+        self.conversation_id = conversation_id
+        self.context_version = context_version
+        self.last_used = time.time()
+        self.turns = 0
+        self._lock = threading.Lock()
+        model = genai.GenerativeModel(CHAT_MODEL_NAME)
+        self._chat = model.start_chat(history=_primer(system_prompt) + self._trim(history or []))
+
+    @staticmethod
+    def _trim(history: List[Any]) -> List[Any]:
+        """Keep the latest exchanges, starting on a user turn."""
+        history = history[-CHAT_SESSION_MAX_TURNS * 2:]
+        while history and _role(history[0]) != "user":
+            history = history[1:]
+        return history
+
+    def send(self, message: str, system_prompt: str, context_version: str) -> str:
+        """Send one user message and return the model's reply."""
+        with self._lock:
+            primer = list(self._chat.history[:2])
+            if context_version != self.context_version:
+                primer = _primer(system_prompt)
+                self.context_version = context_version
+            self._chat.history = primer + self._trim(list(self._chat.history[2:]))
+            response = self._chat.send_message(message)
+            self.turns += 1
+            self.last_used = time.time()
+            return response.text
+
+
+class ChatSessionStore:
+    """
+    Chat sessions keyed by conversation ID. Sessions expire after
+    CHAT_SESSION_TTL_SECONDS without a message, and the least recently used
+    session is dropped once CHAT_SESSION_MAX_SESSIONS are open.
+    """
+
+    def __init__(self, ttl_seconds: float = CHAT_SESSION_TTL_SECONDS, max_sessions: int = CHAT_SESSION_MAX_SESSIONS):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._metrics = {"created": 0, "resumed": 0, "expired": 0, "evicted": 0}
+
+    def _prune(self, now: float):
+        """Drop expired sessions. Must be called with the lock held."""
+        expired = [key for key, session in self._sessions.items() if now - session.last_used > self.ttl_seconds]
+        for key in expired:
+            del self._sessions[key]
+            self._metrics["expired"] += 1
+
+    def get_or_create(self, kind: str, conversation_id: Optional[str], system_prompt: str, context_version: str,
+                      seed_history: Optional[List[Dict[str, Any]]] = None) -> ChatSession:
+        """
+        Resume the session for a conversation ID, or start one seeded with the
+        conversation so far. Sessions of different kinds (endpoints) never share history.
+        """
+        now = time.time()
+        with self._lock:
+            self._prune(now)
+            if conversation_id:
+                session = self._sessions.get(f"{kind}:{conversation_id}")
+                if session is not None:
+                    self._sessions.move_to_end(f"{kind}:{conversation_id}")
+                    self._metrics["resumed"] += 1
+                    return session
+
+            conversation_id = conversation_id or uuid.uuid4().hex
+            session = ChatSession(conversation_id, system_prompt, context_version, seed_history)
+            self._sessions[f"{kind}:{conversation_id}"] = session
+            self._metrics["created"] += 1
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self._metrics["evicted"] += 1
+            logger.info(f"Started {kind} chat session {conversation_id} ({len(seed_history or [])} seeded messages)")
+            return session
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._prune(time.time())
+            return {**self._metrics, "sessions": len(self._sessions), "max_sessions": self.max_sessions}
+
+
+# Shared store used by /chat and /person_search_chat
+chat_sessions = ChatSessionStore()
@@ -0,0 +1,298 @@
+# color_extract.py
+
+import os
+import re
+import time
+import threading
+import logging
+from collections import deque
+from typing import Dict, Any, Optional, Set, Tuple, Union
+import cv2
+import numpy as np
+from PIL import Image
+from dotenv import load_dotenv
+from ranking import COLOR_VARIATIONS
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Colour extraction configuration
+COLOR_EXTRACT_ENABLED = os.getenv("COLOR_EXTRACT_ENABLED", "true").lower() == "true"
+COLOR_MIN_SHARE = float(os.getenv("COLOR_MIN_SHARE", "0.6"))  # share of the region the dominant colour needs to be trusted
+COLOR_MAX_DISTANCE = float(os.getenv("COLOR_MAX_DISTANCE", "40"))  # Lab distance to the nearest palette colour
+COLOR_MIN_AGREEMENT = float(os.getenv("COLOR_MIN_AGREEMENT", "0.85"))  # share of checked crops where Gemini named the same colour
+COLOR_MIN_VERIFIED = int(os.getenv("COLOR_MIN_VERIFIED", "30"))  # checked crops per attribute before local colours replace Gemini's
+COLOR_VERIFY_EVERY = int(os.getenv("COLOR_VERIFY_EVERY", "20"))  # every Nth trusted colour is still asked for, to keep checking
+COLOR_AGREEMENT_WINDOW = 200  # most recent checks kept per attribute
+COLOR_CLUSTERS = 3
+COLOR_SAMPLE_SIZE = 24  # regions are downsampled to at most this many pixels per side before clustering
+ACHROMATIC_CHROMA = 12.0  # Lab chroma below which a colour is black, gray or white
+DARK_ACHROMATIC_CHROMA = 15.0  # below BLACK_MAX_LIGHTNESS hue is mostly sensor noise, so more chroma still reads as black
+LIGHT_ACHROMATIC_CHROMA = 25.0  # above WHITE_MIN_LIGHTNESS off-whites (cream, ivory) read as white, as in ranking.COLOR_VARIATIONS
+BLACK_MAX_LIGHTNESS = 30.0
+WHITE_MIN_LIGHTNESS = 85.0
+ACHROMATIC_MARGIN = 4.0  # lightness this close to the black/gray or gray/white boundary is ambiguous
+
+# Body regions of an upright person crop as (top, bottom, left, right) fractions; the
+# central band avoids most of the background around the person
+BODY_REGIONS = {
+    "clothing_top_color": (0.18, 0.48, 0.25, 0.75),
+    "clothing_bottom_color": (0.55, 0.85, 0.30, 0.70)
+}
+
+# Reference shades per colour name, in RGB. Names are the canonical colours of
+# ranking.COLOR_VARIATIONS so extracted values match searches directly.
+PALETTE = {
+    "red": [(200, 30, 40), (128, 0, 32), (220, 20, 60)],
+    "orange": [(240, 130, 30), (200, 90, 40)],
+    "yellow": [(240, 210, 40), (200, 170, 50)],
+    "green": [(40, 140, 60), (100, 120, 50), (30, 90, 50), (120, 190, 110)],
+    "blue": [(30, 70, 180), (20, 30, 90), (70, 110, 160), (110, 160, 220)],
+    "purple": [(110, 50, 150), (150, 110, 190), (70, 30, 90)],
+    "pink": [(240, 130, 170), (230, 60, 140), (240, 180, 190)],
+    "brown": [(110, 70, 40), (190, 160, 120), (160, 130, 90), (70, 45, 30)]
+}
+
+
+def _to_lab(rgb: np.ndarray) -> np.ndarray:
+    """Lab (L in 0-100) of an array of RGB uint8 pixels."""
+    pixels = np.asarray(rgb, dtype=np.float32).reshape(-1, 1, 3) / 255.0
+    return cv2.cvtColor(pixels, cv2.COLOR_RGB2LAB).reshape(-1, 3)
+
+
+_palette_names = [name for name, shades in PALETTE.items() for _ in shades]
+_palette_lab = _to_lab(np.array([shade for shades in PALETTE.values() for shade in shades], dtype=np.uint8))
+
+
+def name_color(lab: np.ndarray) -> Tuple[str, float]:
+    """
+    Canonical colour name of one Lab colour.
+
+    Returns:
+        (name, Lab distance to the matched reference; for black, gray and white 0, or
+        infinity when the lightness is within ACHROMATIC_MARGIN of a boundary)
+    """
+    lightness, a, b = (float(v) for v in lab)
+    chroma = float(np.hypot(a, b))
+    if lightness < BLACK_MAX_LIGHTNESS and chroma < DARK_ACHROMATIC_CHROMA:
+        return "black", 0.0 if lightness < BLACK_MAX_LIGHTNESS - ACHROMATIC_MARGIN else float("inf")
+    if lightness > WHITE_MIN_LIGHTNESS and chroma < LIGHT_ACHROMATIC_CHROMA:
+        return "white", 0.0 if lightness > WHITE_MIN_LIGHTNESS + ACHROMATIC_MARGIN else float("inf")
+    if chroma < ACHROMATIC_CHROMA:
+        ambiguous = abs(lightness - BLACK_MAX_LIGHTNESS) < ACHROMATIC_MARGIN or abs(lightness - WHITE_MIN_LIGHTNESS) < ACHROMATIC_MARGIN
+        return "gray", float("inf") if ambiguous else 0.0
+    distances = np.linalg.norm(_palette_lab - np.asarray(lab, dtype=np.float32), axis=1)
+    nearest = int(np.argmin(distances))
+    return _palette_names[nearest], float(distances[nearest])
+
+
+def _color_words() -> Dict[str, str]:
+    """
+    Colour words of ranking.COLOR_VARIATIONS -> canonical colour. Bare modifiers
+    ("dark", "light", "pale") and words listed under two colours ("amber", "coral")
+    say nothing definite about the hue and are left out.
+    """
+    names: Dict[str, Set[str]] = {}
+    for base, variations in COLOR_VARIATIONS.items():
+        for variation in variations:
+            names.setdefault(variation, set()).add("gray" if base == "grey" else base)
+    return {word: bases.pop() for word, bases in names.items() if len(bases) == 1 and word not in ("dark", "light", "pale")}
+
+
+_COLOR_WORDS = _color_words()
+_COLOR_PATTERN = re.compile(r"\b(" + "|".join(sorted(map(re.escape, _COLOR_WORDS), key=len, reverse=True)) + r")\b")
+
+
+def canonical_color(value: Any) -> Optional[str]:
+    """
+    Canonical colour named by a free-text colour such as Gemini returns ("navy blue",
+    "light grey", "cream"), or None when it names no colour or several different ones.
+    """
+    if not isinstance(value, str):
+        return None
+    names = {_COLOR_WORDS[word] for word in _COLOR_PATTERN.findall(value.lower())}
+    return names.pop() if len(names) == 1 else None
+
+
+def _dominant(region: np.ndarray) -> Optional[Tuple[str, float, float]]:
+    """
+    Most common colour name of an RGB region.
+
+    Pixels are clustered in Lab space and each cluster centre is named; clusters with
+    the same name (e.g. a lit and a shaded side of one shirt) pool their share.
+
+    Returns:
+        (name, share of the region, Lab distance of its closest cluster to the reference)
+    """
+    height, width = region.shape[:2]
+    if height < 2 or width < 2:
+        return None
+    scale = min(1.0, COLOR_SAMPLE_SIZE / max(height, width))
+    if scale < 1.0:
+        region = cv2.resize(region, (max(1, round(width * scale)), max(1, round(height * scale))), interpolation=cv2.INTER_AREA)
+    lab = _to_lab(region)
+    clusters = min(COLOR_CLUSTERS, len(lab))
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 10, 1.0)
+    _, labels, centers = cv2.kmeans(lab, clusters, None, criteria, 1, cv2.KMEANS_PP_CENTERS)
+    counts = np.bincount(labels.reshape(-1), minlength=clusters)
+
+    shares: Dict[str, float] = {}
+    distances: Dict[str, float] = {}
+    for center, count in zip(centers, counts):
+        if not count:
+            continue
+        name, distance = name_color(center)
+        shares[name] = shares.get(name, 0.0) + count / len(lab)
+        distances[name] = min(distances.get(name, distance), distance)
+    name = max(shares, key=shares.get)
+    return name, float(shares[name]), distances[name]
+
+
+class ColorExtractor:
+    """
+    Names clothing colours of a person crop on the CPU, without a model call.
+
+    The upper and lower body bands of the crop are clustered in Lab space and each
+    cluster is mapped to a canonical colour: black, gray or white by lightness when its
+    chroma is low, otherwise the nearest reference shade. A colour is only confident
+    when it covers at least min_share of the band and lies within max_distance of a
+    reference, so patterned or ambiguous regions are left to Gemini.
+
+    Confident colours are checked against Gemini before they replace its answer: while
+    an attribute is asked for, every crop where Gemini also named a colour counts as
+    a check. Only once min_verified checks agree at least min_agreement of the time is
+    the attribute left out of the prompt, and every verify_every-th crop still asks
+    Gemini so a drifting camera or lighting change is noticed.
+    """
+
+    def __init__(self, min_share: float = COLOR_MIN_SHARE, max_distance: float = COLOR_MAX_DISTANCE,
+                 min_agreement: float = COLOR_MIN_AGREEMENT, min_verified: int = COLOR_MIN_VERIFIED,
+                 verify_every: int = COLOR_VERIFY_EVERY):
+        self.min_share = min_share
+        self.max_distance = max_distance
+        self.min_agreement = min_agreement
+        self.min_verified = min_verified
+        self.verify_every = verify_every
+        self._lock = threading.Lock()
+        self._metrics = {"crops": 0, "seconds": 0.0, **{attr: 0 for attr in BODY_REGIONS}}
+        self._checks = {attr: deque(maxlen=COLOR_AGREEMENT_WINDOW) for attr in BODY_REGIONS}  # 1 when Gemini agreed
+        self._trusted_uses = {attr: 0 for attr in BODY_REGIONS}
+        self._skipped = {attr: 0 for attr in BODY_REGIONS}
+
+    def extract(self, image: Union[Image.Image, np.ndarray]) -> Dict[str, Dict[str, Any]]:
+        """
+        Colour of every body region of a crop, confident or not.
+
+        Args:
+            image: PIL Image or RGB array of one upright person
+
+        Returns:
+            Attribute -> {"color", "share", "distance", "confident"}
+        """
+        start = time.time()
+        rgb = np.asarray(image.convert("RGB")) if isinstance(image, Image.Image) else np.asarray(image)
+        height, width = rgb.shape[:2]
+        colors = {}
+        for attr, (top, bottom, left, right) in BODY_REGIONS.items():
+            region = rgb[int(height * top):int(height * bottom), int(width * left):int(width * right)]
+            dominant = _dominant(region)
+            if dominant is None:
+                continue
+            name, share, distance = dominant
+            colors[attr] = {
+                "color": name,
+                "share": round(share, 3),
+                "distance": round(distance, 1),
+                "confident": share >= self.min_share and distance <= self.max_distance
+            }
+
+        with self._lock:
+            self._metrics["crops"] += 1
+            self._metrics["seconds"] += time.time() - start
+            for attr, result in colors.items():
+                self._metrics[attr] += result["confident"]
+        return colors
+
+    def confident_colors(self, image: Union[Image.Image, np.ndarray]) -> Dict[str, str]:
+        """Attribute -> colour name for the regions named confidently; empty when COLOR_EXTRACT_ENABLED is off."""
+        if not COLOR_EXTRACT_ENABLED:
+            return {}
+        try:
+            return {attr: result["color"] for attr, result in self.extract(image).items() if result["confident"]}
+        except Exception as e:
+            logger.error(f"Error extracting colours: {e}")
+            return {}
+
+    def _trusted(self, attr: str) -> bool:
+        """Must be called with the lock held."""
+        checks = self._checks[attr]
+        return len(checks) >= self.min_verified and sum(checks) / len(checks) >= self.min_agreement
+
+    def skippable(self, colors: Dict[str, str]) -> Set[str]:
+        """
+        Attributes of colors (from confident_colors) that can be left out of the prompt.
+
+        Only attributes that have agreed with Gemini often enough qualify, and every
+        verify_every-th use of a trusted attribute is still asked for as a check.
+        """
+        skip = set()
+        with self._lock:
+            for attr in colors:
+                if not self._trusted(attr):
+                    continue
+                self._trusted_uses[attr] += 1
+                if self.verify_every > 0 and self._trusted_uses[attr] % self.verify_every == 0:
+                    continue
+                skip.add(attr)
+        return skip
+
+    def merge(self, description: Dict[str, Any], colors: Dict[str, str], skip: Set[str]) -> Dict[str, Any]:
+        """
+        Merge local colours into Gemini's description.
+
+        Attributes in skip weren't asked for and take the local colour. For the rest
+        Gemini's answer is kept and compared with the local colour; a trusted local colour
+        only fills in when Gemini left the attribute out.
+        """
+        with self._lock:
+            for attr, color in colors.items():
+                if attr in skip:
+                    description[attr] = color
+                    self._skipped[attr] += 1
+                    continue
+                answer = canonical_color(description.get(attr))
+                if answer is not None:
+                    self._checks[attr].append(int(answer == color))
+                elif attr not in description and self._trusted(attr):
+                    description[attr] = color
+        return description
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = dict(self._metrics)
+            agreement = {
+                attr: {
+                    "checked": len(checks),
+                    "agreement": round(sum(checks) / len(checks), 4) if checks else None,
+                    "trusted": self._trusted(attr),
+                    "skipped": self._skipped[attr]
+                }
+                for attr, checks in self._checks.items()
+            }
+        crops = metrics.pop("crops")
+        seconds = metrics.pop("seconds")
+        return {
+            "enabled": COLOR_EXTRACT_ENABLED,
+            "crops": crops,
+            "avg_ms": round(seconds / crops * 1000, 2) if crops else None,
+            "confident_rate": {attr: round(count / crops, 4) if crops else None for attr, count in metrics.items()},
+            "agreement": agreement
+        }
+
+
+# Shared extractor used by describe.py before calling Gemini
+color_extractor = ColorExtractor()
@@ -0,0 +1,140 @@
+# crop_prep.py
+
+import io
+import os
+import time
+import threading
+import logging
+from typing import Dict, Any, Union
+from PIL import Image
+from dotenv import load_dotenv
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Crop preparation configuration
+CROP_PREP_ENABLED = os.getenv("CROP_PREP_ENABLED", "true").lower() == "true"
+CROP_MAX_DIMENSION = int(os.getenv("CROP_MAX_DIMENSION", "512"))  # longest side sent to Gemini, in pixels
+CROP_JPEG_QUALITY = int(os.getenv("CROP_JPEG_QUALITY", "85"))  # starting JPEG quality
+CROP_MIN_JPEG_QUALITY = int(os.getenv("CROP_MIN_JPEG_QUALITY", "50"))  # quality floor before the crop is shrunk further
+CROP_MAX_BYTES = int(os.getenv("CROP_MAX_BYTES", "80000"))  # byte budget per encoded crop
+CROP_QUALITY_STEP = 10
+CROP_SHRINK_FACTOR = 0.75  # applied to the size when the budget can't be met at the quality floor
+CROP_MIN_DIMENSION = 64  # never shrink below this to meet the budget
+
+
+def _to_rgb(image: Union[Image.Image, bytes, str]) -> Image.Image:
+    if isinstance(image, str):
+        image = Image.open(image)
+    elif isinstance(image, bytes):
+        image = Image.open(io.BytesIO(image))
+    return image if image.mode == "RGB" else image.convert("RGB")
+
+
+def _resize(image: Image.Image, max_dimension: int) -> Image.Image:
+    """Downscale so the longest side is at most max_dimension, keeping the aspect ratio."""
+    width, height = image.size
+    longest = max(width, height)
+    if longest <= max_dimension:
+        return image
+    scale = max_dimension / longest
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    # reducing_gap lets Pillow shrink by an integer factor first, much faster on large crops
+    return image.resize(size, Image.LANCZOS, reducing_gap=3.0)
+
+
+def _encode(image: Image.Image, quality: int) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+class CropPreparer:
+    """
+    Downscales and JPEG-encodes crops before they are uploaded to Gemini.
+
+    The crop is resized so its longest side is at most max_dimension and encoded at
+    quality. If the result is over max_bytes the quality is lowered in steps down to
+    min_quality, then the crop is shrunk further until it fits (or reaches
+    CROP_MIN_DIMENSION). Sizes and timings are kept for /metrics.
+    """
+
+    def __init__(self, max_dimension: int = CROP_MAX_DIMENSION, quality: int = CROP_JPEG_QUALITY,
+                 min_quality: int = CROP_MIN_JPEG_QUALITY, max_bytes: int = CROP_MAX_BYTES):
+        self.max_dimension = max_dimension
+        self.quality = quality
+        self.min_quality = min_quality
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._metrics = {"prepared": 0, "resized": 0, "over_budget": 0, "input_pixels": 0, "output_pixels": 0, "output_bytes": 0, "seconds": 0.0}
+
+    def encode(self, image: Union[Image.Image, bytes, str]) -> bytes:
+        """
+        Prepare one crop.
+
+        Args:
+            image: PIL Image, encoded image bytes or an image path
+
+        Returns:
+            JPEG bytes within the byte budget where possible
+        """
+        start = time.time()
+        image = _to_rgb(image)
+        input_pixels = image.size[0] * image.size[1]
+        prepared = _resize(image, self.max_dimension)
+        quality = self.quality
+        data = _encode(prepared, quality)
+
+        while len(data) > self.max_bytes:
+            if quality > self.min_quality:
+                quality = max(self.min_quality, quality - CROP_QUALITY_STEP)
+            elif max(prepared.size) * CROP_SHRINK_FACTOR >= CROP_MIN_DIMENSION:
+                prepared = _resize(prepared, int(max(prepared.size) * CROP_SHRINK_FACTOR))
+            else:
+                break
+            data = _encode(prepared, quality)
+
+        with self._lock:
+            self._metrics["prepared"] += 1
+            self._metrics["resized"] += prepared.size != image.size
+            self._metrics["over_budget"] += len(data) > self.max_bytes
+            self._metrics["input_pixels"] += input_pixels
+            self._metrics["output_pixels"] += prepared.size[0] * prepared.size[1]
+            self._metrics["output_bytes"] += len(data)
+            self._metrics["seconds"] += time.time() - start
+        return data
+
+    def blob(self, image: Union[Image.Image, bytes, str]) -> Union[Dict[str, Any], Image.Image]:
+        """Crop as a Gemini content part: an image/jpeg blob, or the image unchanged when CROP_PREP_ENABLED is off."""
+        if not CROP_PREP_ENABLED:
+            return _to_rgb(image)
+        return {"mime_type": "image/jpeg", "data": self.encode(image)}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = dict(self._metrics)
+        prepared = metrics["prepared"]
+        return {
+            "enabled": CROP_PREP_ENABLED,
+            "max_dimension": self.max_dimension,
+            "max_bytes": self.max_bytes,
+            "prepared": prepared,
+            "resized": metrics["resized"],
+            "over_budget": metrics["over_budget"],
+            "avg_bytes": round(metrics["output_bytes"] / prepared) if prepared else None,
+            "pixel_reduction": round(1 - metrics["output_pixels"] / metrics["input_pixels"], 4) if metrics["input_pixels"] else None,
+            "avg_ms": round(metrics["seconds"] / prepared * 1000, 2) if prepared else None
+        }
+
+
+# Shared preparer used for every crop sent to Gemini
+crop_preparer = CropPreparer()
+
+
+def prepare_crop(image: Union[Image.Image, bytes, str]) -> Union[Dict[str, Any], Image.Image]:
+    """Downscaled, re-encoded crop ready to pass to generate_content."""
+    return crop_preparer.blob(image)
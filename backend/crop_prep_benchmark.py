@@ -0,0 +1,88 @@
+import cv2
+import io
+import os
+import sys
+import time
+from PIL import Image
+from ultralytics import YOLO
+from crop_prep import CropPreparer, CROP_MAX_BYTES
+
+# Benchmark crop preparation: upload bytes and encode time per setting and, when
+# GEMINI_API_KEY is set, description latency and attribute agreement against the
+# full-resolution crop.
+#
+#   python crop_prep_benchmark.py [image ...]
+
+# Settings to compare: (max dimension, JPEG quality, byte budget)
+SETTINGS = [
+    (1024, 90, 10 ** 9),
+    (768, 85, CROP_MAX_BYTES),
+    (512, 85, CROP_MAX_BYTES),
+    (384, 80, 40000),
+    (256, 75, 20000),
+]
+MAX_CROPS = int(os.getenv("BENCHMARK_MAX_CROPS", "10"))  # crops described per setting (each one is a Gemini call)
+
+# Use the images given on the command line, or the sample image like yolo_test.py
+image_paths = sys.argv[1:]
+if not image_paths:
+    image_paths = [os.path.join(os.path.dirname(os.path.abspath(__file__)), "sample.jpg")]
+    if not os.path.exists(image_paths[0]):
+        workspace_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        image_paths = [os.path.join(workspace_root, "venv/lib/python3.11/site-packages/ultralytics/assets/bus.jpg")]
+
+# Detect people and cut out their crops
+model = YOLO("yolo11n.pt")
+crops = []
+for image_path in image_paths:
+    frame = cv2.imread(image_path)
+    if frame is None:
+        raise ValueError(f"Could not load image at {image_path}")
+    results = model(frame, classes=[0], device='cpu', verbose=False)[0]
+    for x1, y1, x2, y2 in results.boxes.xyxy.cpu().numpy().astype("int"):
+        crop = frame[max(0, y1):y2, max(0, x1):x2]
+        if crop.size:
+            crops.append(Image.fromarray(cv2.cvtColor(crop, cv2.COLOR_BGR2RGB)))
+if not crops:
+    raise ValueError("No people detected in the benchmark images")
+print(f"{len(crops)} person crops from {len(image_paths)} images")
+
+# Full-resolution baseline: the crop as a default-quality JPEG, as uploaded before crop preparation
+baseline_bytes = []
+for crop in crops:
+    buffer = io.BytesIO()
+    crop.save(buffer, format="JPEG")
+    baseline_bytes.append(len(buffer.getvalue()))
+print(f"{'full resolution':<24} avg bytes {sum(baseline_bytes) / len(baseline_bytes):>10.0f}")
+
+describe = None
+if os.getenv("GEMINI_API_KEY"):
+    import describe
+    baseline = []
+    start = time.time()
+    for crop in crops[:MAX_CROPS]:
+        baseline.append(describe.describe_person(crop, prepare=False, use_cache=False, local_colors=False))
+    print(f"{'':<24} describe {(time.time() - start) / len(baseline) * 1000:>8.0f} ms/crop")
+
+for max_dimension, quality, max_bytes in SETTINGS:
+    preparer = CropPreparer(max_dimension=max_dimension, quality=quality, max_bytes=max_bytes)
+    start = time.time()
+    encoded = [preparer.encode(crop) for crop in crops]
+    encode_ms = (time.time() - start) / len(crops) * 1000
+    avg_bytes = sum(len(data) for data in encoded) / len(encoded)
+    label = f"{max_dimension}px q{quality} <= {max_bytes if max_bytes < 10 ** 9 else 'inf'}"
+    line = f"{label:<24} avg bytes {avg_bytes:>10.0f} ({avg_bytes / (sum(baseline_bytes) / len(baseline_bytes)):.0%}), encode {encode_ms:.1f} ms"
+
+    if describe is not None:
+        agreed = 0
+        compared = 0
+        start = time.time()
+        for data, expected in zip(encoded, baseline):
+            result = describe.describe_person({"mime_type": "image/jpeg", "data": data}, prepare=False, use_cache=False, local_colors=False)
+            for key, value in expected.items():
+                if value in (None, "", "unknown"):
+                    continue
+                compared += 1
+                agreed += str(result.get(key, "")).strip().lower() == str(value).strip().lower()
+        line += f", describe {(time.time() - start) / len(baseline) * 1000:.0f} ms/crop, agreement {agreed / compared if compared else 0:.0%}"
+    print(line)
@@ -0,0 +1,131 @@
+# crop_quality.py
+
+import os
+import heapq
+import itertools
+import logging
+from typing import Dict, Any, List, Optional, Tuple
+import cv2
+import numpy as np
+from dotenv import load_dotenv
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Crop quality configuration
+CROP_QUALITY_TOP_K = int(os.getenv("CROP_QUALITY_TOP_K", "1"))  # crops kept per track for description
+CROP_QUALITY_MIN_SCORE = float(os.getenv("CROP_QUALITY_MIN_SCORE", "0.25"))  # crops below this are never described
+CROP_QUALITY_TARGET_HEIGHT = 256  # crop height (px) at which the size score saturates
+CROP_QUALITY_SHARPNESS_REFERENCE = 100.0  # Laplacian variance scoring 0.5
+CROP_QUALITY_SHARPNESS_HEIGHT = 128  # crops are resized to this height before measuring sharpness
+CROP_QUALITY_EDGE_MARGIN = 2  # px from the frame border at which a box counts as cut off
+ASPECT_RANGE = (1.8, 3.5)  # height / width of a standing or walking person
+
+# Weight of each component in the overall score
+QUALITY_WEIGHTS = {
+    "size": 0.25,
+    "sharpness": 0.3,
+    "aspect": 0.15,
+    "confidence": 0.2,
+    "truncation": 0.1
+}
+
+# Penalty per frame edge the box touches; cutting off the head or feet loses the most attributes
+EDGE_PENALTIES = {"top": 0.35, "bottom": 0.35, "left": 0.15, "right": 0.15}
+
+
+def sharpness(crop: np.ndarray) -> float:
+    """Variance of the Laplacian of a BGR or grayscale crop, measured at a fixed height so crop size doesn't dominate."""
+    gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+    height, width = gray.shape[:2]
+    if height != CROP_QUALITY_SHARPNESS_HEIGHT:
+        scale = CROP_QUALITY_SHARPNESS_HEIGHT / height
+        gray = cv2.resize(gray, (max(1, round(width * scale)), CROP_QUALITY_SHARPNESS_HEIGHT), interpolation=cv2.INTER_AREA)
+    return float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
+
+def score_crop(crop: np.ndarray, box: Tuple[int, int, int, int], frame_shape: Tuple[int, ...],
+               confidence: Optional[float] = None) -> Tuple[float, Dict[str, float]]:
+    """
+    Score how useful a person crop is for description.
+
+    Args:
+        crop: BGR crop of the person
+        box: (x1, y1, x2, y2) of the crop in the frame
+        frame_shape: Shape of the frame the crop came from
+        confidence: Detector confidence, if known
+
+    Returns:
+        (score in [0, 1], per-component scores)
+    """
+    height, width = crop.shape[:2]
+    if height < 2 or width < 2:
+        return 0.0, {key: 0.0 for key in QUALITY_WEIGHTS}
+
+    laplacian_var = sharpness(crop)
+    ratio = height / width
+    low, high = ASPECT_RANGE
+    nearest = min(max(ratio, low), high)
+    x1, y1, x2, y2 = box
+    frame_height, frame_width = frame_shape[:2]
+    touched = {
+        "top": y1 <= CROP_QUALITY_EDGE_MARGIN,
+        "bottom": y2 >= frame_height - CROP_QUALITY_EDGE_MARGIN,
+        "left": x1 <= CROP_QUALITY_EDGE_MARGIN,
+        "right": x2 >= frame_width - CROP_QUALITY_EDGE_MARGIN
+    }
+
+    components = {
+        "size": min(1.0, height / CROP_QUALITY_TARGET_HEIGHT),
+        "sharpness": laplacian_var / (laplacian_var + CROP_QUALITY_SHARPNESS_REFERENCE),
+        # Falls off with the log distance from the expected range (half at a factor of 2 off)
+        "aspect": float(0.5 ** abs(np.log2(ratio / nearest))),
+        "confidence": float(confidence) if confidence is not None else 0.5,
+        "truncation": max(0.0, 1.0 - sum(penalty for edge, penalty in EDGE_PENALTIES.items() if touched[edge]))
+    }
+    score = sum(QUALITY_WEIGHTS[key] * value for key, value in components.items())
+    return score, components
+
+
+class TrackCropSelector:
+    """
+    Keeps the best top_k crops of each track as crops stream in.
+
+    Only the kept crops are held in memory, so a long video doesn't accumulate every
+    sampled crop. Crops scoring below min_score are discarded outright.
+    """
+
+    def __init__(self, top_k: int = CROP_QUALITY_TOP_K, min_score: float = CROP_QUALITY_MIN_SCORE):
+        self.top_k = top_k
+        self.min_score = min_score
+        self._best: Dict[Any, List[Tuple[float, int, Dict[str, Any]]]] = {}  # track -> min-heap of kept crops
+        self._order = itertools.count()
+        self.offered = 0
+        self.rejected = 0
+
+    def offer(self, track_id: Any, score: float, crop: Dict[str, Any]) -> bool:
+        """Consider a crop for its track. Returns True if it is currently kept."""
+        self.offered += 1
+        if score < self.min_score:
+            self.rejected += 1
+            return False
+        heap = self._best.setdefault(track_id, [])
+        entry = (score, next(self._order), crop)
+        if len(heap) < self.top_k:
+            heapq.heappush(heap, entry)
+            return True
+        if score > heap[0][0]:
+            heapq.heapreplace(heap, entry)
+            return True
+        return False
+
+    def selected(self) -> List[Dict[str, Any]]:
+        """Kept crops, grouped by track in first-seen order and best first within a track."""
+        crops = []
+        for heap in self._best.values():
+            crops.extend(crop for _, _, crop in sorted(heap, key=lambda entry: (-entry[0], entry[1])))
+        return crops
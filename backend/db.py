@@ -7,8 +7,13 @@ from dotenv import load_dotenv
 import base64
 from datetime import datetime
 import numpy as np
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Callable, Tuple
 import logging
+import io
+import threading
+from collections import OrderedDict
+from blob_store import put_crop, get_crop, delete_crop, has_crop
+from dedup import DEDUP_ENABLED, dedup_index, fold_sighting
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -20,11 +25,73 @@ load_dotenv()
 # Setup JSON storage - Use ml.json as the source
 DB_FILE = "ml.json"  # Changed from people_database.json to ml.json
 UPLOADS_DIR = "uploads"
+CROP_JPEG_QUALITY = int(os.getenv("CROP_JPEG_QUALITY", "90"))
+
+# Detections ingested while the server runs. ml.json stays read-only on disk, so these
+# records live in memory, are merged into load_database() and are evicted oldest-first.
+LIVE_STORE_MAX = int(os.getenv("LIVE_STORE_MAX", "50000"))
+_live_people: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_live_lock = threading.RLock()
+_live_generation = 0  # bumped whenever the live store changes
+_listeners: List[Callable[[str, Dict[str, Any]], None]] = []
+
+# ml.json records by ID, rebuilt when the file changes on disk: (file version, index)
+_file_index: Tuple[Optional[str], Dict[str, Dict[str, Any]]] = (None, {})
+_file_index_lock = threading.Lock()
 
 # Ensure uploads directory exists
 os.makedirs(UPLOADS_DIR, exist_ok=True)
 
-def load_database() -> Dict[str, Any]:
+def load_database(include_live: bool = True) -> Dict[str, Any]:
+    """Load the database from JSON file, plus any detections ingested since startup unless include_live is False."""
+    data = _load_database_file()
+    if not include_live:
+        return data
+    with _live_lock:
+        if _live_people:
+            data = {**data, "people": data["people"] + list(_live_people.values())}
+    return data
+
+def get_file_version() -> str:
+    """Version string of ml.json on disk (modification time and size)."""
+    try:
+        stat = os.stat(DB_FILE)
+        return f"{stat.st_mtime_ns}-{stat.st_size}"
+    except OSError:
+        return "missing"
+
+def get_database_version() -> str:
+    """
+    Version string that changes whenever the searchable data changes:
+    when ml.json is modified on disk or detections are added, folded or evicted.
+    """
+    return f"{get_file_version()}:{_live_generation}"
+
+def add_listener(callback: Callable[[str, Dict[str, Any]], None], replay: bool = False):
+    """
+    Register callback(event, person) for changes to the live store. Events are
+    "add" (new record), "update" (a duplicate detection was folded into the record)
+    and "evict" (the record was dropped to respect LIVE_STORE_MAX).
+
+    Callbacks run in order with the live store lock held, so they must be quick
+    and must not call back into db. With replay, "add" is delivered for every record
+    already in the live store before the callback is registered.
+    """
+    with _live_lock:
+        if replay:
+            for person in _live_people.values():
+                callback("add", person)
+        _listeners.append(callback)
+
+def _notify(event: str, person: Dict[str, Any]):
+    """Deliver a live store change to every listener. Must be called with the live store lock held."""
+    for callback in _listeners:
+        try:
+            callback(event, person)
+        except Exception as e:
+            logger.error(f"Database listener {getattr(callback, '__qualname__', callback)} failed on {event}: {e}")
+
+def _load_database_file() -> Dict[str, Any]:
     """Load the database from JSON file."""
     try:
         if os.path.exists(DB_FILE):
@@ -88,15 +155,141 @@ def initialize_database():
 # Initialize database check on module import
 initialize_database()
 
-def add_person(description_json: Dict[str, Any], metadata: Dict[str, Any] = None):
+def add_person(description_json: Dict[str, Any], metadata: Dict[str, Any] = None, embedding: List[float] = None):
     """
-    This function is kept for compatibility but will not add to the database.
-    We're using ml.json in read-only mode.
+    Ingest a detected person.
+
+    ml.json is used in read-only mode, so the record is kept in the in-memory live
+    store instead of being written to disk. Near-duplicates of a recent sighting on
+    the same camera are folded into that record (first_seen/last_seen/sighting_count)
+    rather than stored again. The crop (metadata["image"]) is packed into the blob store.
+
+    Returns:
+        ID of the new record, or of the existing record the detection was folded into
     """
-    logger.warning("Attempted to add person to database, but ml.json is being used in read-only mode. No changes were made.")
-    
-    # Generate a fake ID to return for API compatibility
-    return str(uuid.uuid4())
+    global _live_generation
+    metadata = dict(metadata or {})
+    image = metadata.pop("image", None)
+    camera_id = metadata.get("camera_id") or "unknown"
+    now = datetime.now()
+
+    with _live_lock:
+        if DEDUP_ENABLED:
+            duplicate_id = dedup_index.find_duplicate(camera_id, metadata, description_json, embedding, now)
+            if duplicate_id is not None and duplicate_id in _live_people:
+                person = _live_people[duplicate_id]
+                fold_sighting(person, metadata, now)
+                _live_generation += 1
+                dedup_index.observe(duplicate_id, camera_id, metadata, description_json, embedding, now)
+                _notify("update", person)
+                logger.info(f"Folded duplicate detection into {duplicate_id} (sightings: {person['metadata']['sighting_count']})")
+                return duplicate_id
+
+        person_id = str(uuid.uuid4())
+        timestamp = metadata.get("timestamp") or now.isoformat()
+        person = {
+            "id": person_id,
+            "description": description_json,
+            "metadata": {
+                **metadata,
+                "camera_id": camera_id,
+                "timestamp": timestamp,
+                "first_seen": timestamp,
+                "last_seen": timestamp,
+                "sighting_count": 1
+            }
+        }
+        if embedding is not None:
+            person["embedding"] = list(embedding)
+
+        _live_people[person_id] = person
+        _notify("add", person)
+        evicted_ids = []
+        while len(_live_people) > LIVE_STORE_MAX:
+            evicted_id, evicted = _live_people.popitem(last=False)
+            evicted_ids.append(evicted_id)
+            _notify("evict", evicted)
+        _live_generation += 1
+        if DEDUP_ENABLED:
+            dedup_index.observe(person_id, camera_id, metadata, description_json, embedding, now)
+
+    if image is not None:
+        try:
+            put_crop(person_id, encode_crop(image))
+        except Exception as e:
+            logger.error(f"Error storing crop for {person_id}: {e}")
+
+    # Evicted records are gone from search, so their crops and thumbnails are released for compaction
+    if evicted_ids:
+        from images import delete_thumbnails
+    for evicted_id in evicted_ids:
+        try:
+            delete_crop(evicted_id)
+            delete_thumbnails(evicted_id)
+        except Exception as e:
+            logger.error(f"Error deleting crop for evicted record {evicted_id}: {e}")
+
+    logger.info(f"Added person {person_id} from camera {camera_id} to live store")
+    return person_id
+
+def get_person(detection_id: str) -> Optional[Dict[str, Any]]:
+    """Record with the given ID from the live store or ml.json, or None if it is gone."""
+    global _file_index
+    with _live_lock:
+        person = _live_people.get(detection_id)
+    if person is not None:
+        return person
+    version = get_file_version()
+    with _file_index_lock:
+        if _file_index[0] != version:
+            people = _load_database_file().get("people", [])
+            _file_index = (version, {p["id"]: p for p in people if isinstance(p, dict) and p.get("id")})
+        return _file_index[1].get(detection_id)
+
+def encode_crop(image) -> bytes:
+    """Encode a PIL crop as JPEG bytes for storage."""
+    buffer = io.BytesIO()
+    image.convert("RGB").save(buffer, format="JPEG", quality=CROP_JPEG_QUALITY)
+    return buffer.getvalue()
+
+def _legacy_image_path(detection_id: str) -> str:
+    return os.path.join(UPLOADS_DIR, f"{os.path.basename(detection_id)}.jpg")
+
+def get_person_image(detection_id: str) -> Optional[bytes]:
+    """Load the stored crop for a detection ID from the blob store or the legacy uploads directory."""
+    return load_person_image({"id": detection_id, "metadata": {"image_path": _legacy_image_path(detection_id)}})
+
+def has_person_image(detection_id: str) -> bool:
+    """Whether get_person_image would find a crop, without reading it."""
+    try:
+        if has_crop(detection_id):
+            return True
+    except Exception as e:
+        logger.error(f"Error checking blob store for crop {detection_id}: {e}")
+    return os.path.exists(_legacy_image_path(detection_id))
+
+def load_person_image(person: Dict[str, Any]) -> Optional[bytes]:
+    """
+    Load the stored crop for a person record.
+    Checks the packed blob store first, then falls back to the legacy image_path file.
+    """
+    person_id = person.get("id", "")
+    if person_id:
+        try:
+            data = get_crop(person_id)
+            if data is not None:
+                return data
+        except Exception as e:
+            logger.error(f"Error reading crop {person_id} from blob store: {e}")
+
+    image_path = person.get("metadata", {}).get("image_path", "")
+    if image_path and os.path.exists(image_path):
+        try:
+            with open(image_path, "rb") as img_file:
+                return img_file.read()
+        except Exception as e:
+            logger.error(f"Error loading image {image_path}: {e}")
+    return None
 
 def cosine_similarity(a: List[float], b: List[float]) -> float:
     """Calculate cosine similarity between two vectors."""
@@ -104,21 +297,14 @@ def cosine_similarity(a: List[float], b: List[float]) -> float:
     b = np.array(b)
     return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
 
-def search_people(query_embedding: List[float], n: int = 3) -> Dict[str, Any]:
-    """Search for similar people in the database."""
-    db = load_database()
-    
-    # Calculate similarities
-    similarities = []
-    for person in db["people"]:
-        similarity = cosine_similarity(query_embedding, person["embedding"])
-        similarities.append((person, similarity))
-    
-    # Sort by similarity (descending)
-    similarities.sort(key=lambda x: x[1], reverse=True)
-    
-    # Take top n results
-    top_results = similarities[:n]
+def search_people(query_embedding: List[float], n: int = 3, return_image_urls: bool = False) -> Dict[str, Any]:
+    """
+    Search for similar people in the database.
+    With return_image_urls, matches carry an image_url instead of inline base64 image_data.
+    """
+    # Vectorized cosine similarity over the cached embedding matrix, top n by partition
+    from ranking import get_ranker
+    top_results = get_ranker().rank_by_embedding(query_embedding, n)
     
     # Process results
     processed_results = []
@@ -129,20 +315,24 @@ def search_people(query_embedding: List[float], n: int = 3) -> Dict[str, Any]:
             
             # Load and encode image
             image_data = None
-            image_path = person["metadata"].get("image_path", "")
-            if image_path and os.path.exists(image_path):
-                try:
-                    with open(image_path, "rb") as img_file:
-                        image_data = base64.b64encode(img_file.read()).decode("utf-8")
-                except Exception as e:
-                    print(f"Error loading image {image_path}: {e}")
+            image_url = None
+            if return_image_urls:
+                from images import crop_url
+                image_url = crop_url(person.get("id", ""))
+            else:
+                image_bytes = load_person_image(person)
+                if image_bytes:
+                    image_data = base64.b64encode(image_bytes).decode("utf-8")
             
-            processed_results.append({
+            result = {
                 "description": person["description"],
                 "metadata": person["metadata"],
                 "similarity": similarity_score,
                 "image_data": image_data
-            })
+            }
+            if image_url:
+                result["image_url"] = image_url
+            processed_results.append(result)
         except Exception as e:
             print(f"Error processing result: {e}")
             continue
@@ -0,0 +1,184 @@
+# dedup.py
+
+import os
+import threading
+import logging
+from collections import deque
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Sequence
+import numpy as np
+from dotenv import load_dotenv
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Near-duplicate collapsing configuration
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() == "true"
+DEDUP_WINDOW_SECONDS = float(os.getenv("DEDUP_WINDOW_SECONDS", "30"))
+DEDUP_IOU_THRESHOLD = float(os.getenv("DEDUP_IOU_THRESHOLD", "0.5"))
+DEDUP_DESCRIPTION_THRESHOLD = float(os.getenv("DEDUP_DESCRIPTION_THRESHOLD", "0.8"))
+DEDUP_EMBEDDING_THRESHOLD = float(os.getenv("DEDUP_EMBEDDING_THRESHOLD", "0.95"))
+DEDUP_MAX_RECENT_PER_CAMERA = int(os.getenv("DEDUP_MAX_RECENT_PER_CAMERA", "200"))
+
+# Attributes that describe the person rather than what they are doing
+IDENTITY_ATTRIBUTES = [
+    "gender", "age_group", "hair_style", "hair_color", "skin_tone", "facial_features",
+    "clothing_top", "clothing_top_color", "clothing_bottom", "clothing_bottom_color",
+    "footwear", "footwear_color", "accessories", "bag_type", "bag_color"
+]
+
+
+def bbox_iou(a: Sequence[float], b: Sequence[float]) -> float:
+    """Intersection over union of two (x1, y1, x2, y2) boxes."""
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    intersection = max(0.0, ix2 - ix1) * max(0.0, iy2 - iy1)
+    if intersection == 0:
+        return 0.0
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def is_informative(description: Any) -> bool:
+    """
+    False for Gemini failure fallbacks ({"error": ...} or only "unknown" values), which
+    look identical for every person and must not be used to fold detections together.
+    """
+    if not isinstance(description, dict) or "error" in description:
+        return False
+    return any(str(description.get(attr) or "unknown").lower() != "unknown" for attr in IDENTITY_ATTRIBUTES)
+
+
+def description_similarity(a: Dict[str, Any], b: Dict[str, Any]) -> float:
+    """Fraction of identity attributes present in either description that agree."""
+    compared = 0
+    agreed = 0
+    for attr in IDENTITY_ATTRIBUTES:
+        if attr not in a and attr not in b:
+            continue
+        compared += 1
+        if str(a.get(attr, "")).lower() == str(b.get(attr, "")).lower():
+            agreed += 1
+    return agreed / compared if compared else 0.0
+
+
+def embedding_similarity(a: List[float], b: List[float]) -> float:
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
+    denom = np.linalg.norm(a) * np.linalg.norm(b)
+    return float(np.dot(a, b) / denom) if denom else 0.0
+
+
+def stable_track_id(metadata: Dict[str, Any]) -> Optional[int]:
+    """
+    Return the track ID if it identifies a person across frames.
+    Numeric IDs come from ByteTrack; string IDs like "SF-MKT-001_person_0" are only
+    the detection's index within one frame and say nothing about identity.
+    """
+    track_id = metadata.get("track_id")
+    if isinstance(track_id, (int, np.integer)) and track_id >= 0:
+        return int(track_id)
+    return None
+
+
+class _RecentSighting:
+    __slots__ = ("person_id", "track_id", "bbox", "description", "embedding", "last_seen")
+
+    def __init__(self, person_id, track_id, bbox, description, embedding, last_seen):
+        self.person_id = person_id
+        self.track_id = track_id
+        self.bbox = bbox
+        self.description = description
+        self.embedding = embedding
+        self.last_seen = last_seen
+
+
+class DedupIndex:
+    """
+    Per-camera window of recent sightings used to collapse near-duplicate detections.
+
+    A new detection is a duplicate of a recent sighting on the same camera when it
+    carries the same tracker ID, or when its bounding box overlaps (IoU) and its
+    description or embedding is sufficiently similar. Failed descriptions are never
+    compared, so a Gemini outage doesn't fold different people together.
+    """
+
+    def __init__(self, window_seconds: float = DEDUP_WINDOW_SECONDS):
+        self.window_seconds = window_seconds
+        self._recent: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def _prune(self, recent: deque, now: datetime):
+        while recent and (now - recent[0].last_seen).total_seconds() > self.window_seconds:
+            recent.popleft()
+
+    def find_duplicate(self, camera_id: str, metadata: Dict[str, Any], description: Dict[str, Any],
+                       embedding: Optional[List[float]] = None, now: Optional[datetime] = None) -> Optional[str]:
+        """
+        Look for a recent sighting this detection duplicates.
+
+        Returns:
+            The person ID of the matching sighting, or None for a new person
+        """
+        now = now or datetime.now()
+        track_id = stable_track_id(metadata)
+        bbox = metadata.get("bbox")
+        comparable = is_informative(description)
+
+        with self._lock:
+            recent = self._recent.get(camera_id)
+            if not recent:
+                return None
+            self._prune(recent, now)
+
+            # Newest first - a person standing still matches their latest sighting
+            for sighting in reversed(recent):
+                if track_id is not None and sighting.track_id == track_id:
+                    return sighting.person_id
+                if bbox is None or sighting.bbox is None:
+                    continue
+                if bbox_iou(bbox, sighting.bbox) < DEDUP_IOU_THRESHOLD:
+                    continue
+                if embedding is not None and sighting.embedding is not None:
+                    if embedding_similarity(embedding, sighting.embedding) >= DEDUP_EMBEDDING_THRESHOLD:
+                        return sighting.person_id
+                if (comparable and is_informative(sighting.description) and
+                        description_similarity(description, sighting.description) >= DEDUP_DESCRIPTION_THRESHOLD):
+                    return sighting.person_id
+        return None
+
+    def observe(self, person_id: str, camera_id: str, metadata: Dict[str, Any], description: Dict[str, Any],
+                embedding: Optional[List[float]] = None, now: Optional[datetime] = None):
+        """Record a sighting so later detections can be folded into it."""
+        now = now or datetime.now()
+        with self._lock:
+            recent = self._recent.setdefault(camera_id, deque(maxlen=DEDUP_MAX_RECENT_PER_CAMERA))
+            # Drop the older sighting of the same person so the deque stays ordered by last_seen
+            for i, sighting in enumerate(recent):
+                if sighting.person_id == person_id:
+                    del recent[i]
+                    break
+            recent.append(_RecentSighting(person_id, stable_track_id(metadata), metadata.get("bbox"),
+                                          description, embedding, now))
+            self._prune(recent, now)
+
+
+def fold_sighting(person: Dict[str, Any], metadata: Dict[str, Any], seen_at: datetime):
+    """Fold a duplicate detection into an existing record's sighting summary."""
+    record_metadata = person.setdefault("metadata", {})
+    record_metadata.setdefault("first_seen", record_metadata.get("timestamp", seen_at.isoformat()))
+    record_metadata["last_seen"] = seen_at.isoformat()
+    record_metadata["sighting_count"] = record_metadata.get("sighting_count", 1) + 1
+    if metadata.get("bbox") is not None:
+        record_metadata["bbox"] = metadata["bbox"]
+    # Keep the most confident detection's score
+    if metadata.get("confidence", 0) > record_metadata.get("confidence", 0):
+        record_metadata["confidence"] = metadata["confidence"]
+
+
+# Shared index used by db.add_person
+dedup_index = DedupIndex()
@@ -1,6 +1,11 @@
 import os
+import json
 import google.generativeai as genai
 from PIL import Image
+from typing import List, Dict, Any, Set
+from crop_prep import prepare_crop
+from phash_cache import description_cache, image_signature
+from color_extract import color_extractor
 from dotenv import load_dotenv
 import logging
 
@@ -20,62 +25,115 @@ genai.configure(api_key=GEMINI_API_KEY)
 # Use gemini-1.5-pro model for better vision capabilities
 model = genai.GenerativeModel("gemini-1.5-pro")
 
-VISION_PROMPT = """
-Analyze this image of a person and describe them in detail. Provide the following attributes in JSON format:
+# Attributes requested for every person, shared by the single and batched prompts
+ATTRIBUTE_HINTS = {
+    "gender": "male, female, other",
+    "age_group": "child, teen, adult, senior",
+    "hair_style": "short, long, curly, straight, bald, etc.",
+    "hair_color": "black, brown, blonde, red, gray, etc.",
+    "skin_tone": "if visible",
+    "facial_features": "beard, mustache, glasses, etc.",
+    "clothing_top": "shirt, hoodie, t-shirt, jacket, etc.",
+    "clothing_top_color": "primary color of top",
+    "clothing_top_pattern": "solid, striped, plaid, etc.",
+    "clothing_bottom": "jeans, pants, skirt, shorts, etc.",
+    "clothing_bottom_color": "primary color of bottom",
+    "clothing_bottom_pattern": "solid, striped, plaid, etc.",
+    "accessories": "bag, hat, jewelry, etc.",
+    "bag_type": "backpack, handbag, shoulder bag, etc.",
+    "bag_color": "primary color of bag",
+    "pose": "standing, sitting, walking, etc.",
+    "location_context": "indoor, outdoor, etc."
+}
+
+
+def _attribute_list(skip=()) -> str:
+    """Prompt lines for the requested attributes, leaving out the ones in skip (already known locally)."""
+    lines = [f"- {attr} ({hint})" for attr, hint in ATTRIBUTE_HINTS.items() if attr not in skip]
+    return "\n" + "\n".join(lines) + "\n"
 
-- gender (male, female, other)
-- age_group (child, teen, adult, senior)
-- hair_style (short, long, curly, straight, bald, etc.)
-- hair_color (black, brown, blonde, red, gray, etc.)
-- skin_tone (if visible)
-- facial_features (beard, mustache, glasses, etc.)
-- clothing_top (shirt, hoodie, t-shirt, jacket, etc.)
-- clothing_top_color (primary color of top)
-- clothing_top_pattern (solid, striped, plaid, etc.)
-- clothing_bottom (jeans, pants, skirt, shorts, etc.)
-- clothing_bottom_color (primary color of bottom)
-- clothing_bottom_pattern (solid, striped, plaid, etc.)
-- accessories (bag, hat, jewelry, etc.)
-- bag_type (backpack, handbag, shoulder bag, etc.)
-- bag_color (primary color of bag)
-- pose (standing, sitting, walking, etc.)
-- location_context (indoor, outdoor, etc.)
 
+def _vision_prompt(skip=()) -> str:
+    return f"""
+Analyze this image of a person and describe them in detail. Provide the following attributes in JSON format:
+{_attribute_list(skip)}
 Be as specific and accurate as possible. If you can't determine an attribute with confidence, omit it from the response.
 Return ONLY a JSON object with these fields and nothing else.
 """
 
-def describe_person(image: Image.Image) -> dict:
+
+VISION_ATTRIBUTES = _attribute_list()
+VISION_PROMPT = _vision_prompt()
+
+BATCH_VISION_PROMPT = """
+The images below each show one person, and each image is preceded by its label "Crop N:".
+Describe every person separately, using the following attributes:
+{attributes}
+Be as specific and accurate as possible. If you can't determine an attribute with confidence, omit it.
+Return ONLY a JSON array with exactly {count} objects, one per crop. Each object must have an "index" field
+with the crop number N and the attributes above. Never merge people from different crops.
+"""
+
+# Crops described per Gemini request; larger groups are split into batches of this size
+DESCRIBE_BATCH_SIZE = int(os.getenv("DESCRIBE_BATCH_SIZE", "6"))
+
+
+def _strip_code_fence(response_text: str) -> str:
+    """Remove a markdown code block around a JSON response."""
+    response_text = response_text.strip()
+    if response_text.startswith("```json"):
+        response_text = response_text[7:]  # Remove ```json prefix
+    elif response_text.startswith("```"):
+        response_text = response_text[3:]
+    if response_text.endswith("```"):
+        response_text = response_text[:-3]  # Remove ``` suffix
+    return response_text.strip()
+
+
+def describe_person(image: Image.Image, prepare: bool = True, use_cache: bool = True, local_colors: bool = True) -> dict:
     """
     Takes a PIL Image of a person and returns a description using Gemini.
     
     Args:
         image: PIL Image object of a person
+        prepare: Downscale and re-encode the crop before upload (see crop_prep.py)
+        use_cache: Reuse the description of a near-identical earlier crop (see phash_cache.py)
+        local_colors: Name clothing colours locally, leaving them out of the prompt once they agree with Gemini (see color_extract.py)
         
     Returns:
         dict: Description of the person with attributes like gender, age, clothing, etc.
     """
+    signature = None
+    if use_cache and isinstance(image, Image.Image):
+        signature = image_signature(image)
+        cached = description_cache.get(image, signature)
+        if cached is not None:
+            logger.info("Reusing cached description for a near-identical person image")
+            return cached
+    
+    colors = color_extractor.confident_colors(image) if local_colors and isinstance(image, Image.Image) else {}
+    description = _describe_single(image, prepare, colors, color_extractor.skippable(colors))
+    if signature is not None:
+        description_cache.put(image, description, signature)
+    return description
+
+
+def _describe_single(image: Image.Image, prepare: bool, colors: Dict[str, str], skip: Set[str]) -> dict:
+    """One Gemini request for one crop; colours in skip are not asked for, and colors are merged into the answer."""
     try:
-        logger.info("Generating description for person image")
+        logger.info(f"Generating description for person image{f' (colours named locally: {sorted(skip)})' if skip else ''}")
         
         # Generate content with Gemini using the image
-        response = model.generate_content([VISION_PROMPT, image])
+        response = model.generate_content([_vision_prompt(skip) if skip else VISION_PROMPT, prepare_crop(image) if prepare else image])
         
-        # Clean up the response text
-        response_text = response.text.strip()
-        
-        # Handle markdown code blocks if present
-        if response_text.startswith("```json"):
-            response_text = response_text[7:]  # Remove ```json prefix
-        if response_text.endswith("```"):
-            response_text = response_text[:-3]  # Remove ``` suffix
+        # Clean up the response text, handling markdown code blocks if present
+        response_text = _strip_code_fence(response.text)
         
         # Convert response to dictionary
-        import json
         try:
-            description = json.loads(response_text.strip())
+            description = json.loads(response_text)
             logger.info(f"Successfully generated description with {len(description)} attributes")
-            return description
+            return color_extractor.merge(description, colors, skip)
         except json.JSONDecodeError as e:
             logger.error(f"Error parsing JSON response: {e}")
             logger.error(f"Response text: {response_text}")
@@ -94,4 +152,97 @@ def describe_person(image: Image.Image) -> dict:
             "gender": "unknown",
             "age_group": "unknown",
             "error": str(e)
-        } 
\ No newline at end of file
+        }
+
+
+def describe_people(images: List[Image.Image], batch_size: int = DESCRIBE_BATCH_SIZE) -> List[Dict[str, Any]]:
+    """
+    Describe several person crops with as few Gemini requests as possible.
+
+    Crops with a near-identical cached crop reuse its description. The rest are sent
+    batch_size at a time in one request with a single copy of the prompt, and the
+    response is a JSON array keyed by crop index. Clothing colours that can be named
+    locally for every crop of a batch are left out of its prompt. A batch whose response can't be
+    parsed is split in half and retried, and a failed request gives every crop of the
+    batch the error fallback; crops still missing from a response are described one
+    at a time with describe_person.
+
+    Args:
+        images: PIL Images, one person each
+        batch_size: Maximum crops per request
+
+    Returns:
+        One description per image, in the same order
+    """
+    descriptions: List[Dict[str, Any]] = [None] * len(images)
+    signatures = [image_signature(image) for image in images]
+    misses = []
+    for i, (image, signature) in enumerate(zip(images, signatures)):
+        descriptions[i] = description_cache.get(image, signature)
+        if descriptions[i] is None:
+            misses.append(i)
+    if len(misses) < len(images):
+        logger.info(f"Reusing cached descriptions for {len(images) - len(misses)} of {len(images)} person images")
+    
+    colors = [color_extractor.confident_colors(image) if i in misses else {} for i, image in enumerate(images)]
+    skips = [color_extractor.skippable(crop_colors) for crop_colors in colors]
+    for start in range(0, len(misses), max(1, batch_size)):
+        _describe_batch(images, misses[start:start + batch_size], descriptions, colors, skips)
+    for i in misses:
+        description_cache.put(images[i], descriptions[i], signatures[i])
+    return descriptions
+
+
+def _describe_batch(images: List[Image.Image], indices: List[int], descriptions: List[Dict[str, Any]],
+                    colors: List[Dict[str, str]], skips: List[Set[str]]):
+    """
+    Fill descriptions[i] for every i in indices. The batch is split when Gemini's answer
+    can't be parsed; when the request itself fails every crop gets the error fallback,
+    since retrying smaller batches during an outage only multiplies failing calls.
+    """
+    if len(indices) == 1:
+        descriptions[indices[0]] = _describe_single(images[indices[0]], True, colors[indices[0]], skips[indices[0]])
+        return
+
+    # Colours that can be named locally for every crop in the batch don't need to be asked for
+    skip = set.intersection(*(skips[i] for i in indices))
+    try:
+        logger.info(f"Generating descriptions for {len(indices)} person images in one request")
+        contents = [BATCH_VISION_PROMPT.format(attributes=_attribute_list(skip), count=len(indices))]
+        for crop_number, i in enumerate(indices):
+            contents.extend([f"Crop {crop_number}:", prepare_crop(images[i])])
+        response_text = model.generate_content(contents).text
+    except Exception as e:
+        logger.error(f"Error generating descriptions for {len(indices)} crops with Gemini: {e}")
+        # Same minimal fallback as _describe_single
+        for i in indices:
+            descriptions[i] = {"gender": "unknown", "age_group": "unknown", "error": str(e)}
+        return
+
+    try:
+        parsed = json.loads(_strip_code_fence(response_text))
+        if not isinstance(parsed, list):
+            raise ValueError(f"expected a JSON array, got {type(parsed).__name__}")
+    except ValueError as e:
+        # json.JSONDecodeError is a ValueError too
+        logger.error(f"Unusable batched description response for {len(indices)} crops, splitting the batch: {e}")
+        middle = len(indices) // 2
+        _describe_batch(images, indices[:middle], descriptions, colors, skips)
+        _describe_batch(images, indices[middle:], descriptions, colors, skips)
+        return
+
+    missing = set(range(len(indices)))
+    for item in parsed:
+        if not isinstance(item, dict):
+            continue
+        try:
+            crop_number = int(item.pop("index"))
+        except (KeyError, TypeError, ValueError):
+            continue
+        if crop_number in missing:
+            descriptions[indices[crop_number]] = color_extractor.merge(item, colors[indices[crop_number]], skip)
+            missing.discard(crop_number)
+    if missing:
+        logger.warning(f"Batched description response missed {len(missing)} of {len(indices)} crops, describing them separately")
+    for crop_number in sorted(missing):
+        descriptions[indices[crop_number]] = _describe_single(images[indices[crop_number]], True, colors[indices[crop_number]], skips[indices[crop_number]])
@@ -0,0 +1,200 @@
+# describe_queue.py
+
+import os
+import time
+import threading
+import logging
+from collections import deque
+from concurrent.futures import Future
+from typing import Dict, Any, Callable, List, Optional
+import numpy as np
+from dotenv import load_dotenv
+from llm import LLM_CALL_TIMEOUT_SECONDS
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Describe queue configuration
+DESCRIBE_WORKERS = int(os.getenv("DESCRIBE_WORKERS", "4"))  # concurrent Gemini describe calls across all requests
+DESCRIBE_QUEUE_MAX_PER_CAMERA = int(os.getenv("DESCRIBE_QUEUE_MAX_PER_CAMERA", "32"))  # queued jobs per camera before the oldest is dropped
+DESCRIBE_CHILD_HEIGHT_RATIO = float(os.getenv("DESCRIBE_CHILD_HEIGHT_RATIO", "0.7"))  # crops shorter than this x the frame's median are child-sized
+DESCRIBE_AGING_SECONDS = float(os.getenv("DESCRIBE_AGING_SECONDS", "5"))  # jobs queued this long are served ahead of higher lanes
+DESCRIBE_WAIT_TIMEOUT_SECONDS = float(os.getenv("DESCRIBE_WAIT_TIMEOUT_SECONDS", str(LLM_CALL_TIMEOUT_SECONDS)))  # how long /process_frame waits for a frame's descriptions
+DESCRIBE_WAIT_SAMPLES = 1000  # recent queue wait times kept per lane for percentiles
+
+# Priority lanes, served in this order
+LANE_ALERT = 0  # child-sized crops while an amber alert for a child is active
+LANE_CHILD = 1  # child-sized crops
+LANE_DEFAULT = 2  # other person crops
+LANE_SCENE = 3  # whole-frame scene descriptions
+LANE_NAMES = ["alert", "child", "default", "scene"]
+
+
+class DescribeDropped(Exception):
+    """Raised from a job's future when the job was dropped to keep its camera's queue bounded."""
+
+
+def assign_lanes(bboxes: List[List[float]], child_alert_active: bool = False) -> List[int]:
+    """
+    Lane for each person crop of a frame.
+
+    Crops much shorter than the frame's median person are treated as children. This
+    is a size heuristic only (it needs at least two people to compare against), but
+    it is available before any description exists.
+    """
+    heights = [max(0.0, y2 - y1) for _, y1, _, y2 in bboxes]
+    if len(heights) < 2:
+        return [LANE_DEFAULT] * len(heights)
+    reference = float(np.median(heights))
+    lanes = []
+    for height in heights:
+        if height < DESCRIBE_CHILD_HEIGHT_RATIO * reference:
+            lanes.append(LANE_ALERT if child_alert_active else LANE_CHILD)
+        else:
+            lanes.append(LANE_DEFAULT)
+    return lanes
+
+
+class _Job:
+    __slots__ = ("camera_id", "lane", "fn", "args", "future", "enqueued_at")
+
+    def __init__(self, camera_id: str, lane: int, fn: Callable, args: tuple):
+        self.camera_id = camera_id
+        self.lane = lane
+        self.fn = fn
+        self.args = args
+        self.future: Future = Future()
+        self.enqueued_at = time.time()
+
+
+class DescribeQueue:
+    """
+    Bounded, prioritized queue in front of a fixed pool of describe workers.
+
+    Jobs are served lane by lane (alert candidates, children, other people, scenes),
+    oldest first within a lane. A job that has waited aging_seconds is served ahead of
+    the lanes above it, so scene descriptions and default crops can't starve while
+    higher lanes stay busy. Each camera may have at most max_per_camera jobs
+    waiting; beyond that its oldest job in the lowest-priority lane is dropped, so a
+    busy camera sheds stale work instead of delaying everyone. The worker count caps
+    concurrent Gemini calls across all requests.
+    """
+
+    def __init__(self, workers: int = DESCRIBE_WORKERS, max_per_camera: int = DESCRIBE_QUEUE_MAX_PER_CAMERA,
+                 aging_seconds: float = DESCRIBE_AGING_SECONDS):
+        self.workers = workers
+        self.max_per_camera = max_per_camera
+        self.aging_seconds = aging_seconds
+        self._lanes = [deque() for _ in LANE_NAMES]
+        self._depth: Dict[str, int] = {}
+        self._cond = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._in_flight = 0
+        self._waits = [deque(maxlen=DESCRIBE_WAIT_SAMPLES) for _ in LANE_NAMES]
+        self._metrics = {"submitted": 0, "completed": 0, "failed": 0, "cancelled": 0, "dropped": 0, "aged": 0}
+        self._dropped_by_camera: Dict[str, int] = {}
+
+    def _start(self):
+        """Start the workers on first use. Must be called with the lock held."""
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, name=f"describe-{len(self._threads)}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, camera_id: str, lane: int, fn: Callable, *args) -> Future:
+        """
+        Queue fn(*args) for a describe worker.
+
+        Returns:
+            Future with fn's result; fails with DescribeDropped if the job is shed
+        """
+        job = _Job(camera_id or "unknown", lane, fn, args)
+        dropped = None
+        with self._cond:
+            self._start()
+            self._lanes[lane].append(job)
+            self._depth[job.camera_id] = self._depth.get(job.camera_id, 0) + 1
+            self._metrics["submitted"] += 1
+            if self._depth[job.camera_id] > self.max_per_camera:
+                dropped = self._drop_oldest(job.camera_id)
+            self._cond.notify()
+        if dropped is not None:
+            dropped.future.set_exception(DescribeDropped(f"Describe queue for camera {dropped.camera_id} is full"))
+        return job.future
+
+    def _drop_oldest(self, camera_id: str) -> Optional[_Job]:
+        """Remove the camera's oldest job from its lowest-priority lane. Must be called with the lock held."""
+        for lane in reversed(self._lanes):
+            for job in lane:
+                if job.camera_id == camera_id:
+                    lane.remove(job)
+                    self._depth[camera_id] -= 1
+                    self._metrics["dropped"] += 1
+                    self._dropped_by_camera[camera_id] = self._dropped_by_camera.get(camera_id, 0) + 1
+                    logger.warning(f"Describe queue full for camera {camera_id}, dropped a {LANE_NAMES[job.lane]} job")
+                    return job
+        return None
+
+    def _next(self) -> _Job:
+        """Block until a job is available and take it. Must be called with the lock held."""
+        while True:
+            heads = [lane[0] for lane in self._lanes if lane]
+            if heads:
+                # Lanes are FIFO, so each head is its lane's oldest job
+                oldest = min(heads, key=lambda job: job.enqueued_at)
+                job = heads[0]
+                if oldest is not job and time.time() - oldest.enqueued_at >= self.aging_seconds:
+                    job = oldest
+                    self._metrics["aged"] += 1
+                self._lanes[job.lane].popleft()
+                self._depth[job.camera_id] -= 1
+                if not self._depth[job.camera_id]:
+                    del self._depth[job.camera_id]
+                return job
+            self._cond.wait()
+
+    def _work(self):
+        while True:
+            with self._cond:
+                job = self._next()
+                self._in_flight += 1
+                self._waits[job.lane].append(time.time() - job.enqueued_at)
+            if job.future.set_running_or_notify_cancel():
+                try:
+                    job.future.set_result(job.fn(*job.args))
+                    outcome = "completed"
+                except Exception as e:
+                    logger.error(f"Describe job for camera {job.camera_id} failed: {e}")
+                    job.future.set_exception(e)
+                    outcome = "failed"
+            else:
+                outcome = "cancelled"
+            with self._cond:
+                self._in_flight -= 1
+                self._metrics[outcome] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            lanes = {}
+            for name, lane, waits in zip(LANE_NAMES, self._lanes, self._waits):
+                samples = np.array(waits) if waits else None
+                lanes[name] = {
+                    "depth": len(lane),
+                    "wait_avg_ms": round(float(samples.mean()) * 1000, 1) if samples is not None else None,
+                    "wait_p95_ms": round(float(np.percentile(samples, 95)) * 1000, 1) if samples is not None else None
+                }
+            return {
+                **self._metrics,
+                "workers": self.workers,
+                "in_flight": self._in_flight,
+                "lanes": lanes,
+                "dropped_by_camera": dict(self._dropped_by_camera)
+            }
+
+
+# Shared queue used by /process_frame for crop and scene descriptions
+describe_queue = DescribeQueue()
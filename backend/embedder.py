@@ -5,8 +5,7 @@ from chromadb.utils import embedding_functions
 import json
 import os
 from dotenv import load_dotenv
-from PIL import Image
-import io
+from crop_prep import crop_preparer
 
 # Load environment variables
 load_dotenv()
@@ -83,17 +82,8 @@ def embed_description(json_obj):
 
 def embed_image(image):
     """Convert image to embedding using Google embedding model."""
-    if isinstance(image, str):
-        # If image is a path, load it
-        image = Image.open(image)
-    elif isinstance(image, bytes):
-        # If image is bytes, convert to PIL Image
-        image = Image.open(io.BytesIO(image))
-    
-    # Convert image to base64 for embedding
-    buffered = io.BytesIO()
-    image.save(buffered, format="JPEG")
-    img_str = buffered.getvalue()
+    # Downscale and re-encode within the crop byte budget (accepts a path, bytes or PIL Image)
+    img_str = crop_preparer.encode(image)
     
     # Get embedding
     return embed_model([img_str])[0]
@@ -0,0 +1,134 @@
+# events.py
+
+import os
+import uuid
+import asyncio
+import threading
+import logging
+from datetime import datetime
+from typing import Dict, Any, Callable, Iterable, Optional
+from dotenv import load_dotenv
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Event bus configuration
+EVENT_QUEUE_MAX = int(os.getenv("EVENT_QUEUE_MAX", "1000"))  # per subscriber; the oldest event is dropped when full
+EVENT_KEEPALIVE_SECONDS = float(os.getenv("EVENT_KEEPALIVE_SECONDS", "15"))  # idle time before an SSE keepalive comment
+
+# Frame pipeline event types (other modules define their own next to their publishers)
+DETECTIONS_EVENT = "detections"  # person boxes of a processed frame
+PERSON_DESCRIBED_EVENT = "person_described"  # a deferred crop description completed
+FRAME_DESCRIBED_EVENT = "frame_described"  # a deferred scene description completed
+
+
+class Subscription:
+    """
+    One subscriber's queue of events. Created and read on an asyncio event loop;
+    events may be published from any thread.
+    """
+
+    def __init__(self, bus: "EventBus", types: Optional[Iterable[str]] = None, camera_ids: Optional[Iterable[str]] = None,
+                 predicate: Optional[Callable[[Dict[str, Any]], bool]] = None, maxsize: int = EVENT_QUEUE_MAX):
+        self.bus = bus
+        self.types = set(types) if types else None
+        self.camera_ids = set(camera_ids) if camera_ids else None
+        self.predicate = predicate
+        self.dropped = 0
+        self._loop = asyncio.get_running_loop()
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+
+    def accepts(self, event: Dict[str, Any]) -> bool:
+        if self.types is not None and event["type"] not in self.types:
+            return False
+        if self.camera_ids is not None and event.get("camera_id") not in self.camera_ids:
+            return False
+        return self.predicate is None or self.predicate(event)
+
+    def _put(self, event: Dict[str, Any]):
+        """Runs on the subscriber's loop. A slow subscriber loses its oldest events rather than blocking publishers."""
+        if self._queue.full():
+            self._queue.get_nowait()
+            self.dropped += 1
+        self._queue.put_nowait(event)
+
+    def deliver(self, event: Dict[str, Any]):
+        try:
+            self._loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # The subscriber's loop has closed
+            self.bus.unsubscribe(self)
+
+    async def get(self) -> Dict[str, Any]:
+        return await self._queue.get()
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+
+class EventBus:
+    """In-process publish/subscribe for pushing events to WebSocket and streaming clients."""
+
+    def __init__(self):
+        self._subscriptions = []
+        self._lock = threading.Lock()
+        self._published: Dict[str, int] = {}
+
+    def subscribe(self, types: Optional[Iterable[str]] = None, camera_ids: Optional[Iterable[str]] = None,
+                  predicate: Optional[Callable[[Dict[str, Any]], bool]] = None) -> Subscription:
+        """
+        Subscribe to events of the given types and cameras (all if None) that pass the predicate.
+        Must be called from a running event loop.
+        """
+        subscription = Subscription(self, types, camera_ids, predicate)
+        with self._lock:
+            self._subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+
+    def publish(self, event_type: str, data: Dict[str, Any], camera_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Publish an event to every matching subscriber without blocking. Safe to call from any thread.
+
+        Args:
+            event_type: Event type subscribers filter on
+            data: JSON-serializable payload
+            camera_id: Camera the event came from, for subscribers filtering by camera
+        """
+        event = {
+            "id": uuid.uuid4().hex,
+            "type": event_type,
+            "timestamp": datetime.now().isoformat(),
+            "camera_id": camera_id,
+            "data": data
+        }
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+            self._published[event_type] = self._published.get(event_type, 0) + 1
+        for subscription in subscriptions:
+            try:
+                if subscription.accepts(event):
+                    subscription.deliver(event)
+            except Exception as e:
+                logger.error(f"Error delivering {event_type} event: {e}")
+        return event
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "subscribers": len(self._subscriptions),
+                "published": dict(self._published),
+                "dropped": sum(subscription.dropped for subscription in self._subscriptions)
+            }
+
+
+# Shared bus for the whole server
+event_bus = EventBus()
@@ -0,0 +1,119 @@
+# images.py
+
+import os
+import io
+import hashlib
+import logging
+from typing import Optional, Tuple
+from urllib.parse import quote
+from PIL import Image
+from dotenv import load_dotenv
+from db import get_person_image, has_person_image
+from blob_store import put_crop, get_crop, delete_crop
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Crop serving configuration
+IMAGE_BASE_URL = os.getenv("IMAGE_BASE_URL", "")  # e.g. "http://localhost:8000"; empty keeps URLs relative
+THUMBNAIL_SIZES = sorted(int(s) for s in os.getenv("THUMBNAIL_SIZES", "64,128,256,512").split(","))
+THUMBNAIL_JPEG_QUALITY = int(os.getenv("THUMBNAIL_JPEG_QUALITY", "85"))
+IMAGE_CACHE_MAX_AGE = int(os.getenv("IMAGE_CACHE_MAX_AGE", str(7 * 24 * 3600)))
+
+# Crops are never rewritten under the same detection ID, so clients may cache them indefinitely
+CACHE_CONTROL = f"public, max-age={IMAGE_CACHE_MAX_AGE}, immutable"
+
+
+def crop_url(detection_id: str, size: Optional[int] = None) -> str:
+    """Build the URL that serves a detection's crop."""
+    url = f"{IMAGE_BASE_URL}/images/{quote(detection_id, safe='')}"
+    if size:
+        url += f"?size={snap_thumbnail_size(size)}"
+    return url
+
+
+def snap_thumbnail_size(size: int) -> int:
+    """
+    Round a requested size up to the nearest configured thumbnail size.
+    Bounding the set of sizes keeps the thumbnail cache bounded too.
+    """
+    for allowed in THUMBNAIL_SIZES:
+        if size <= allowed:
+            return allowed
+    return THUMBNAIL_SIZES[-1]
+
+
+def compute_etag(data: bytes) -> str:
+    """Strong ETag derived from the image content."""
+    return '"' + hashlib.blake2b(data, digest_size=12).hexdigest() + '"'
+
+
+def _thumbnail_id(detection_id: str, size: int) -> str:
+    """Blob store ID of a cached thumbnail; thumbnails are packed next to the crops."""
+    return f"{detection_id}@{size}px"
+
+
+def delete_thumbnails(detection_id: str):
+    """Drop the cached thumbnails of a crop, e.g. when the crop itself is deleted."""
+    for size in THUMBNAIL_SIZES:
+        delete_crop(_thumbnail_id(detection_id, size))
+
+
+def _render_thumbnail(data: bytes, size: int) -> bytes:
+    image = Image.open(io.BytesIO(data))
+    image.thumbnail((size, size))
+    buffer = io.BytesIO()
+    image.convert("RGB").save(buffer, format="JPEG", quality=THUMBNAIL_JPEG_QUALITY)
+    return buffer.getvalue()
+
+
+def get_crop_image(detection_id: str, size: Optional[int] = None) -> Optional[Tuple[bytes, str]]:
+    """
+    Load a crop, optionally downscaled to a thumbnail.
+
+    Thumbnails are rendered on first request and cached in the blob store. A cached
+    thumbnail is only served while the crop itself still exists.
+
+    Args:
+        detection_id: ID of the stored detection
+        size: Maximum thumbnail edge in pixels, or None for the original crop
+
+    Returns:
+        Tuple of (JPEG bytes, ETag), or None if the crop does not exist
+    """
+    if size:
+        size = snap_thumbnail_size(size)
+        if not has_person_image(detection_id):
+            return None
+        try:
+            data = get_crop(_thumbnail_id(detection_id, size))
+            if data is not None:
+                return data, compute_etag(data)
+        except Exception as e:
+            logger.error(f"Error reading cached {size}px thumbnail for {detection_id}: {e}")
+
+    original = get_person_image(detection_id)
+    if original is None:
+        return None
+    if not size:
+        return original, compute_etag(original)
+
+    try:
+        data = _render_thumbnail(original, size)
+    except Exception as e:
+        logger.error(f"Error rendering {size}px thumbnail for {detection_id}: {e}")
+        return original, compute_etag(original)
+
+    try:
+        put_crop(_thumbnail_id(detection_id, size), data)
+        # The crop may have been evicted while rendering; don't leave its thumbnail behind
+        if not has_person_image(detection_id):
+            delete_crop(_thumbnail_id(detection_id, size))
+    except Exception as e:
+        logger.error(f"Error caching {size}px thumbnail for {detection_id}: {e}")
+
+    return data, compute_etag(data)
@@ -0,0 +1,123 @@
+# llm.py
+
+import os
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor, Future, wait
+from typing import Dict, Any, Callable, Optional
+from dotenv import load_dotenv
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# LLM orchestration configuration
+LLM_CALL_TIMEOUT_SECONDS = float(os.getenv("LLM_CALL_TIMEOUT_SECONDS", "20"))
+LLM_MAX_WORKERS = int(os.getenv("LLM_MAX_WORKERS", "16"))
+
+# Gemini client calls block, so they run on this pool. It is shared so calls that
+# overrun their timeout finish in the background without holding up the caller.
+_executor = ThreadPoolExecutor(max_workers=LLM_MAX_WORKERS, thread_name_prefix="llm")
+
+
+class FanOutResult(dict):
+    """
+    Results of a fan-out keyed by call name. Calls that failed or timed out hold
+    their default value and are listed in `failed` with the reason.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.failed: Dict[str, str] = {}
+
+
+def submit(fn: Callable, *args, **kwargs) -> Future:
+    """Start a blocking call in the background, e.g. a Gemini call that can overlap local work."""
+    return _executor.submit(fn, *args, **kwargs)
+
+
+def _timeout_for(name: str, timeout: Optional[float], timeouts: Optional[Dict[str, float]]) -> float:
+    if timeouts and name in timeouts:
+        return timeouts[name]
+    return LLM_CALL_TIMEOUT_SECONDS if timeout is None else timeout
+
+
+async def gather_calls(calls: Dict[str, Callable[[], Any]], timeout: Optional[float] = None,
+                       timeouts: Optional[Dict[str, float]] = None,
+                       defaults: Optional[Dict[str, Any]] = None) -> FanOutResult:
+    """
+    Run independent calls concurrently from async code.
+
+    Each call is a zero-argument callable: coroutine functions are awaited on the
+    event loop, anything else runs on the LLM thread pool. Every call gets its own
+    timeout, and a call that fails or times out yields its default instead of failing
+    the others, so total latency approaches the slowest call rather than the sum.
+
+    Args:
+        calls: Call name -> zero-argument callable
+        timeout: Seconds allowed per call (defaults to LLM_CALL_TIMEOUT_SECONDS)
+        timeouts: Per-call overrides of timeout
+        defaults: Value used for a call that fails or times out (None if not given)
+
+    Returns:
+        FanOutResult mapping each call name to its result or default
+    """
+    loop = asyncio.get_running_loop()
+    defaults = defaults or {}
+
+    async def run(name: str, fn: Callable[[], Any]):
+        start = time.time()
+        if asyncio.iscoroutinefunction(fn):
+            awaitable = fn()
+        else:
+            awaitable = loop.run_in_executor(_executor, fn)
+        try:
+            result = await asyncio.wait_for(awaitable, _timeout_for(name, timeout, timeouts))
+            logger.info(f"LLM call '{name}' finished in {time.time() - start:.2f}s")
+            return result, None
+        except asyncio.TimeoutError:
+            return None, f"timed out after {_timeout_for(name, timeout, timeouts)}s"
+        except Exception as e:
+            return None, str(e)
+
+    outcomes = await asyncio.gather(*(run(name, fn) for name, fn in calls.items()))
+    return _collect(calls, outcomes, defaults)
+
+
+def run_calls(calls: Dict[str, Callable[[], Any]], timeout: Optional[float] = None,
+              timeouts: Optional[Dict[str, float]] = None,
+              defaults: Optional[Dict[str, Any]] = None) -> FanOutResult:
+    """
+    Run independent blocking calls concurrently from sync code.
+    Same contract as gather_calls; every call runs on the LLM thread pool.
+    """
+    start = time.time()
+    futures = {name: _executor.submit(fn) for name, fn in calls.items()}
+    outcomes = []
+    for name, future in futures.items():
+        remaining = max(0.0, start + _timeout_for(name, timeout, timeouts) - time.time())
+        wait([future], timeout=remaining)
+        if not future.done():
+            future.cancel()
+            outcomes.append((None, f"timed out after {_timeout_for(name, timeout, timeouts)}s"))
+        elif future.exception() is not None:
+            outcomes.append((None, str(future.exception())))
+        else:
+            outcomes.append((future.result(), None))
+    return _collect(calls, outcomes, defaults or {})
+
+
+def _collect(calls: Dict[str, Callable[[], Any]], outcomes, defaults: Dict[str, Any]) -> FanOutResult:
+    results = FanOutResult()
+    for name, (result, error) in zip(calls, outcomes):
+        if error is None:
+            results[name] = result
+        else:
+            logger.error(f"LLM call '{name}' failed, using its default: {error}")
+            results.failed[name] = error
+            results[name] = defaults.get(name)
+    return results
@@ -1,7 +1,7 @@
 # main.py
 
-from fastapi import File, UploadFile, Form, HTTPException, Request, FastAPI
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi import File, UploadFile, Form, HTTPException, Request, FastAPI, WebSocket
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
 from typing import List, Optional, Dict, Any
 from PIL import Image
 import uvicorn
@@ -14,6 +14,9 @@ import google.generativeai as genai
 import cv2
 import numpy as np
 import base64
+import json
+import asyncio
+from concurrent.futures import Future
 from app_init import app
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
@@ -21,10 +24,29 @@ from ultralytics import YOLO
 import uuid
 import supervision as sv
 import google.generativeai as palm
-from describe import describe_person
-from db import add_person, search_people, reset_database, load_database
-from search import find_similar_people, generate_rag_response, direct_database_search
-from amber_alert import check_amber_alert_match
+from describe import describe_person, describe_people, DESCRIBE_BATCH_SIZE
+from tracker import process_image, process_video
+from db import add_person, search_people, reset_database, load_database, get_database_version
+from search import find_similar_people, iter_similar_people, paginated_search, generate_rag_response, direct_database_search, query_to_structured_json, extract_critical_terms
+from amber_alert import check_amber_alert_matches, amber_alert_matcher, AMBER_ALERT_MATCH_THRESHOLD
+from alert_sweep import alert_sweeper, ALERT_SWEEP_WINDOW_HOURS
+from alert_aggregator import alert_aggregator, AMBER_ALERT_EVENT
+from images import get_crop_image, crop_url, CACHE_CONTROL
+from query_cache import query_cache, normalize_query
+from result_cache import result_cache, make_result_key, RESULT_CACHE_ENABLED
+from pagination import cursor_store
+from stats import get_stats_snapshot
+from chat_context import chat_prompt_context, person_search_context
+from chat_sessions import chat_sessions, to_gemini_history
+from llm import gather_calls
+from crop_prep import crop_preparer
+from phash_cache import description_cache
+from color_extract import color_extractor
+from describe_queue import describe_queue, assign_lanes, DescribeDropped, LANE_SCENE, DESCRIBE_WAIT_TIMEOUT_SECONDS
+from quick_match import find_quick_matches
+from query_parser import parser_stats
+from events import event_bus, DETECTIONS_EVENT, PERSON_DESCRIBED_EVENT, FRAME_DESCRIBED_EVENT, EVENT_KEEPALIVE_SECONDS
+from standing_queries import standing_queries, STANDING_QUERY_HIT, STANDING_QUERY_MIN_SCORE
 
 from fastapi.websockets import WebSocketDisconnect
 from twilio.twiml.voice_response import VoiceResponse, Connect, Say, Stream
@@ -91,9 +113,11 @@ class ChatMessage(BaseModel):
 
 class ChatRequest(BaseModel):
     messages: List[ChatMessage]
+    conversation_id: Optional[str] = Field(default=None, description="Continue a server-side chat session")
 
 class ChatResponse(BaseModel):
     response: str
+    conversation_id: Optional[str] = None
 
 class FrameResponse(BaseModel):
     detections: List[dict]
@@ -105,6 +129,8 @@ class FrameResponse(BaseModel):
 class FrameRequest(BaseModel):
     frame_data: str
     camera_id: str = Field(default="SF-MKT-001")
+    return_image_urls: bool = Field(default=False, description="Whether to return a crop_url per person crop instead of inline base64")
+    defer_descriptions: bool = Field(default=False, description="Return boxes immediately and publish descriptions and alerts on the event bus")
 
 class SearchRequest(BaseModel):
     description: str
@@ -115,17 +141,41 @@ class SearchRequest(BaseModel):
     top_k: int = Field(default=5, description="Number of top results to return", ge=1, le=20)
     structured_json: bool = Field(default=True, description="Whether to return structured JSON")
     use_direct_search: bool = Field(default=True, description="Whether to use direct database search with Gemini")
+    return_image_urls: bool = Field(default=False, description="Whether to return image URLs instead of inline base64 image data")
+    attribute_weight: Optional[float] = Field(default=None, ge=0, description="Weight of attribute agreement in hybrid ranking")
+    embedding_weight: Optional[float] = Field(default=None, ge=0, description="Weight of embedding similarity in hybrid ranking")
+    token_budget: Optional[int] = Field(default=None, ge=500, description="Prompt token budget for direct search re-ranking")
+    latency_budget: Optional[float] = Field(default=None, gt=0, description="Seconds to wait for direct search re-ranking before answering with what is ready")
+    page_size: Optional[int] = Field(default=None, ge=1, le=100, description="Page size; returns a next_cursor for browsing deeper (uses similarity-based search)")
+    cursor: Optional[str] = Field(default=None, description="next_cursor from a previous page")
+    stream: bool = Field(default=False, description="Whether to stream results as they become ready (uses similarity-based search)")
+    stream_format: str = Field(default="sse", pattern="^(sse|ndjson)$", description="Streaming format: server-sent events or newline-delimited JSON")
 
 class PersonSearchChatRequest(BaseModel):
     query: str = Field(..., description="The user's query for the personal assistant")
     conversation_history: List[Dict[str, str]] = Field(default_factory=list, description="Previous conversation turns")
     include_raw_database: bool = Field(default=False, description="Whether to include the raw database in the response")
+    conversation_id: Optional[str] = Field(default=None, description="Continue a server-side chat session")
 
 class PersonSearchChatResponse(BaseModel):
     response: str
     suggested_searches: List[str] = Field(default_factory=list)
     database_stats: Dict[str, Any] = Field(default_factory=dict)
     matches: List[Dict[str, Any]] = Field(default_factory=list)
+    conversation_id: Optional[str] = None
+
+class StandingQueryRequest(BaseModel):
+    name: Optional[str] = Field(default=None, description="Display name for the saved search")
+    description: Optional[str] = Field(default=None, description="Natural language description, parsed like a /search query")
+    query_json: Optional[Dict[str, Any]] = Field(default=None, description="Structured query; takes precedence over description")
+    camera_ids: Optional[List[str]] = Field(default=None, description="Only evaluate detections from these cameras")
+    min_score: float = Field(default=STANDING_QUERY_MIN_SCORE, ge=0, le=1, description="Minimum match score for a hit")
+
+class AlertSweepRequest(BaseModel):
+    alert_id: Optional[str] = Field(default=None, description="ID of an active alert in data/amber_alert.json")
+    alert: Optional[Dict[str, Any]] = Field(default=None, description="Alert to sweep instead of an active one (needs a description)")
+    window_hours: Optional[float] = Field(default=ALERT_SWEEP_WINDOW_HOURS, ge=0, description="Only sweep detections from the last N hours (0 sweeps everything)")
+    min_score: float = Field(default=AMBER_ALERT_MATCH_THRESHOLD, ge=0, le=1, description="Minimum match score for a hit")
 
 def save_upload_file(upload_file: UploadFile) -> str:
     """Save uploaded file and return the path"""
@@ -146,168 +196,58 @@ async def chat(request: ChatRequest):
     try:
         logger.info("Processing chat request")
         
-        # Load dataset info
-        db = load_database()
-        if not db or "people" not in db:
-            raise ValueError("Database is empty or invalid")
+        # Dataset context is rendered once per database version
+        system_prompt, context_version = chat_prompt_context.get()
         
-        total_people = len(db["people"])
-        
-        # Count statistics
-        stats = {
-            "gender": {},
-            "age_group": {},
-            "hair_color": {},
-            "facial_features": {},
-            "clothing_top": {},
-            "clothing_top_color": {},
-            "location_context": {},
-            "cameras": {}  # Add camera statistics
-        }
+        # Respond to the latest user message
+        latest = max((i for i, msg in enumerate(request.messages) if msg.role == "user"), default=None)
+        if latest is None:
+            raise ValueError("No user message to respond to")
+        msg = request.messages[latest]
         
-        # Track camera details
-        camera_details = {}
+        # A resumed session already holds the earlier turns; a new one is seeded with them
+        seed_history = to_gemini_history([{"role": m.role, "content": m.content} for m in request.messages[:latest]])
+        session = chat_sessions.get_or_create("chat", request.conversation_id, system_prompt, context_version, seed_history)
         
-        for person in db["people"]:
-            desc = person["description"]
-            # Track camera statistics
-            camera_id = person.get("metadata", {}).get("camera_id", "unknown")
-            stats["cameras"][camera_id] = stats["cameras"].get(camera_id, 0) + 1
-            
-            # Track camera details
-            if camera_id not in camera_details:
-                camera_details[camera_id] = {
-                    "count": 0,
-                    "last_seen": person.get("metadata", {}).get("timestamp", "unknown"),
-                    "gender_dist": {},
-                    "age_dist": {},
-                    "clothing_dist": {}
-                }
-            
-            camera_details[camera_id]["count"] += 1
+        # Check if it's a search request
+        if any(keyword in msg.content.lower() for keyword in ["find", "search", "look for", "where is"]):
+            # Use the search endpoint
+            result = find_similar_people(msg.content)
+            matches = result.get("matches", []) if isinstance(result, dict) else result
+            logger.info(f"Search results: Found {len(matches)} matches")
             
-            # Track gender distribution per camera
-            if "gender" in desc:
-                gender = desc["gender"]
-                camera_details[camera_id]["gender_dist"][gender] = camera_details[camera_id]["gender_dist"].get(gender, 0) + 1
-            
-            # Track age distribution per camera
-            if "age_group" in desc:
-                age = desc["age_group"]
-                camera_details[camera_id]["age_dist"][age] = camera_details[camera_id]["age_dist"].get(age, 0) + 1
-            
-            # Track clothing distribution per camera
-            if "clothing_top" in desc:
-                clothing = desc["clothing_top"]
-                camera_details[camera_id]["clothing_dist"][clothing] = camera_details[camera_id]["clothing_dist"].get(clothing, 0) + 1
-            
-            for key in stats:
-                if key != "cameras" and key in desc:
-                    value = desc[key]
-                    if isinstance(value, str):
-                        values = [v.strip() for v in value.split(",")]
-                        for v in values:
-                            stats[key][v] = stats[key].get(v, 0) + 1
-                    else:
-                        stats[key][value] = stats[key].get(value, 0) + 1
-        
-        # Create system prompt with dataset knowledge
-        system_prompt = f"""You are an AI assistant with access to a surveillance camera database containing {total_people} people.
-
-Dataset Statistics:
-- Gender distribution: {', '.join(f'{k}: {v}' for k, v in stats['gender'].items())}
-- Age groups: {', '.join(f'{k}: {v}' for k, v in stats['age_group'].items())}
-- Hair colors: {', '.join(f'{k}: {v}' for k, v in stats['hair_color'].items())}
-- Facial features: {', '.join(f'{k}: {v}' for k, v in stats['facial_features'].items())}
-- Clothing (tops): {', '.join(f'{k}: {v}' for k, v in stats['clothing_top'].items())}
-- Top colors: {', '.join(f'{k}: {v}' for k, v in stats['clothing_top_color'].items())}
-- Locations: {', '.join(f'{k}: {v}' for k, v in stats['location_context'].items())}
-- Camera distribution: {', '.join(f'{k}: {v} detections' for k, v in stats['cameras'].items())}
-
-Camera Details:
-"""
-        
-        # Add detailed camera information
-        for camera_id, details in camera_details.items():
-            system_prompt += f"""
-Camera {camera_id}:
-- Total detections: {details['count']}
-- Last active: {details['last_seen']}
-- Gender distribution: {', '.join(f'{k}: {v}' for k, v in details['gender_dist'].items())}
-- Age distribution: {', '.join(f'{k}: {v}' for k, v in details['age_dist'].items())}
-- Clothing distribution: {', '.join(f'{k}: {v}' for k, v in details['clothing_dist'].items())}
-"""
-        
-        system_prompt += """
-You can help users:
-1. Understand what's in the dataset
-2. Search for specific people using natural language
-3. Analyze patterns and statistics
-4. Answer questions about the data
-5. Provide information about specific cameras and their detections
-
-If the user asks about a specific camera or camera ID, you can tell them:
-- How many detections that camera has made
-- What types of people it has detected
-- When it was last active
-- The gender, age, and clothing distribution of people detected by that camera
-
-If the user wants to search for someone, extract the search criteria and use it to find matches."""
-        
-        # Initialize Gemini model
-        model = genai.GenerativeModel('gemini-2.0-flash')
-        
-        # Start chat with system prompt
-        chat = model.start_chat(history=[])
-        chat.send_message(system_prompt)
-        
-        # Process each message in the conversation history
-        for msg in request.messages:
-            if msg.role == "user":
-                # Check if it's a search request
-                if any(keyword in msg.content.lower() for keyword in ["find", "search", "look for", "where is"]):
-                    # Use the search endpoint
-                    matches = find_similar_people(msg.content)
-                    logger.info(f"Search results: Found {len(matches)} matches")
+            if matches and len(matches) > 0:
+                match_desc = "\n\nI found these matches:\n"
+                for i, match in enumerate(matches, 1):
+                    # Verify match is a dictionary
+                    if not isinstance(match, dict):
+                        logger.error(f"Match {i} is not a dictionary: {match}")
+                        continue
+                        
+                    desc = match.get("description", {})
+                    similarity = match.get("similarity", 0)
                     
-                    if matches and len(matches) > 0:
-                        match_desc = "\n\nI found these matches:\n"
-                        for i, match in enumerate(matches, 1):
-                            # Verify match is a dictionary
-                            if not isinstance(match, dict):
-                                logger.error(f"Match {i} is not a dictionary: {match}")
-                                continue
-                                
-                            desc = match.get("description", {})
-                            similarity = match.get("similarity", 0)
-                            
-                            # Safety check for description
-                            if not isinstance(desc, dict):
-                                logger.error(f"Description is not a dictionary: {desc}")
-                                continue
-                                
-                            match_desc += f"\n{i}. Match ({similarity:.1f}% similarity):\n"
-                            # Extract key attributes
-                            match_attrs = []
-                            for key, value in desc.items():
-                                if value and key not in ["id", "timestamp"]:
-                                    match_attrs.append(f"{key}: {value}")
-                            match_desc += "- " + ", ".join(match_attrs) + "\n"
+                    # Safety check for description
+                    if not isinstance(desc, dict):
+                        logger.error(f"Description is not a dictionary: {desc}")
+                        continue
                         
-                        response = chat.send_message(msg.content + match_desc)
-                    else:
-                        response = chat.send_message(msg.content + "\n\nI couldn't find any matches in the database.")
-                else:
-                    # Regular chat about the dataset
-                    response = chat.send_message(msg.content)
+                    match_desc += f"\n{i}. Match ({similarity:.1f}% similarity):\n"
+                    # Extract key attributes
+                    match_attrs = []
+                    for key, value in desc.items():
+                        if value and key not in ["id", "timestamp"]:
+                            match_attrs.append(f"{key}: {value}")
+                    match_desc += "- " + ", ".join(match_attrs) + "\n"
                 
-                # Store the response in history
-                chat.history.append({"role": "assistant", "parts": [response.text]})
-        
-        # Get the last response
-        last_response = chat.history[-1]["parts"][0]
+                response_text = session.send(msg.content + match_desc, system_prompt, context_version)
+            else:
+                response_text = session.send(msg.content + "\n\nI couldn't find any matches in the database.", system_prompt, context_version)
+        else:
+            # Regular chat about the dataset
+            response_text = session.send(msg.content, system_prompt, context_version)
         
-        return ChatResponse(response=last_response)
+        return ChatResponse(response=response_text, conversation_id=session.conversation_id)
     except Exception as e:
         logger.error(f"Error in chat endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -328,7 +268,8 @@ async def upload_file(file: UploadFile = File(...), is_video: bool = Form(False)
             image = Image.open(file_path)
             people = process_image(image)
         
-        # Process each detected person
+        # Process each detected person (embedder is imported here, as in search.py, so chromadb stays optional)
+        from embedder import embed_description
         results = []
         for person in people:
             try:
@@ -346,7 +287,8 @@ async def upload_file(file: UploadFile = File(...), is_video: bool = Form(False)
                             "track_id": person.get("track_id", -1),
                             "frame": person.get("frame", -1),
                             "image": person["image"],
-                            "camera_id": camera_id
+                            "camera_id": camera_id,
+                            "quality": person.get("quality")
                         }
                     )
                     
@@ -392,23 +334,77 @@ async def search(request: SearchRequest):
                    f"top_k={request.top_k}, "
                    f"use_direct_search={request.use_direct_search}")
         
-        # Use the new direct search method if requested
-        if request.use_direct_search:
-            logger.info("Using direct database search with Gemini")
-            result = direct_database_search(
+        # Browse a ranking kept server-side, page by page
+        if request.page_size is not None or request.cursor is not None:
+            result = paginated_search(
                 request.description,
-                top_k=request.top_k
+                page_size=request.page_size or request.top_k,
+                cursor=request.cursor,
+                include_match_highlights=request.include_match_highlights,
+                include_camera_location=request.include_camera_location,
+                return_image_urls=request.return_image_urls,
+                attribute_weight=request.attribute_weight,
+                embedding_weight=request.embedding_weight
             )
-        else:
-            # Use the traditional search method
-            logger.info("Using traditional similarity-based search method")
-            result = find_similar_people(
-                request.description, 
+            if result.get("expired"):
+                return JSONResponse(status_code=410, content=result)
+            return result
+        
+        # Stream the query, matches and images as they are ready, with the RAG summary last
+        if request.stream:
+            logger.info(f"Streaming similarity-based search results as {request.stream_format}")
+            return stream_search_events(request)
+        
+        # Serve repeated searches from the result cache while the database is unchanged
+        result = None
+        cache_key = None
+        if RESULT_CACHE_ENABLED:
+            database_version = get_database_version()
+            cache_key = make_result_key(
+                query_to_structured_json(request.description),
+                normalize_query(request.description),
+                use_direct_search=request.use_direct_search,
                 top_k=request.top_k,
                 include_match_highlights=request.include_match_highlights,
                 include_camera_location=request.include_camera_location,
-                include_rag_response=request.include_rag_response
+                include_rag_response=request.include_rag_response,
+                return_image_urls=request.return_image_urls,
+                attribute_weight=request.attribute_weight,
+                embedding_weight=request.embedding_weight,
+                token_budget=request.token_budget,
+                latency_budget=request.latency_budget
             )
+            result = result_cache.get(cache_key, database_version)
+            if result is not None:
+                logger.info("Serving search from result cache")
+        
+        if result is None:
+            # Use the new direct search method if requested
+            if request.use_direct_search:
+                logger.info("Using direct database search with Gemini")
+                result = direct_database_search(
+                    request.description,
+                    top_k=request.top_k,
+                    token_budget=request.token_budget,
+                    latency_budget=request.latency_budget
+                )
+            else:
+                # Use the traditional search method
+                logger.info("Using traditional similarity-based search method")
+                result = find_similar_people(
+                    request.description, 
+                    top_k=request.top_k,
+                    include_match_highlights=request.include_match_highlights,
+                    include_camera_location=request.include_camera_location,
+                    include_rag_response=request.include_rag_response,
+                    return_image_urls=request.return_image_urls,
+                    attribute_weight=request.attribute_weight,
+                    embedding_weight=request.embedding_weight
+                )
+            
+            # Errors and partial (timed out) results are retried rather than cached
+            if cache_key is not None and isinstance(result, dict) and "error" not in result and not result.get("partial"):
+                result_cache.put(cache_key, database_version, result)
         
         # If structured_json parameter is true, return the structured format
         if request.structured_json:
@@ -441,6 +437,263 @@ async def search(request: SearchRequest):
         )
 
 
+def stream_search_events(request: SearchRequest) -> StreamingResponse:
+    """
+    Stream a search as server-sent events or newline-delimited JSON.
+    See search.iter_similar_people for the event sequence; a final "done" event closes the stream.
+    """
+    events = iter_similar_people(
+        request.description,
+        top_k=request.top_k,
+        include_match_highlights=request.include_match_highlights,
+        include_camera_location=request.include_camera_location,
+        include_rag_response=request.include_rag_response,
+        return_image_urls=request.return_image_urls,
+        attribute_weight=request.attribute_weight,
+        embedding_weight=request.embedding_weight
+    )
+    return event_stream_response(events, request.stream_format)
+
+
+def event_stream_response(events, stream_format: str) -> StreamingResponse:
+    """Stream (event, data) pairs as server-sent events or newline-delimited JSON, closed by a "done" event."""
+    def encode(event: str, data: Dict[str, Any]) -> str:
+        if stream_format == "ndjson":
+            return json.dumps({"event": event, "data": data}) + "\n"
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    
+    def generate():
+        # Sync generator - Starlette runs it in a threadpool so ranking and Gemini calls don't block the loop
+        for event, data in events:
+            yield encode(event, data)
+        yield encode("done", {})
+    
+    media_type = "application/x-ndjson" if stream_format == "ndjson" else "text/event-stream"
+    return StreamingResponse(generate(), media_type=media_type,
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.get("/images/{detection_id}")
+async def get_image(detection_id: str, request: Request, size: Optional[int] = None):
+    """
+    Serve a stored person crop by detection ID.
+    Supports conditional requests via ETag and optional thumbnail sizes.
+    """
+    result = get_crop_image(detection_id, size)
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"No image for detection {detection_id}")
+    
+    data, etag = result
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return Response(content=data, media_type="image/jpeg", headers=headers)
+
+
+@app.get("/metrics")
+async def metrics():
+    """Cache and pipeline metrics."""
+    return {
+        "query_cache": query_cache.stats(),
+        "result_cache": result_cache.stats(),
+        "pagination": cursor_store.stats(),
+        "chat_sessions": chat_sessions.stats(),
+        "query_parser": parser_stats(),
+        "standing_queries": standing_queries.stats(),
+        "amber_alerts": alert_aggregator.stats(),
+        "describe_queue": describe_queue.stats(),
+        "crop_prep": crop_preparer.stats(),
+        "description_cache": description_cache.stats(),
+        "color_extract": color_extractor.stats(),
+        "events": event_bus.stats()
+    }
+
+
+@app.get("/stats")
+async def dataset_statistics():
+    """Dataset statistics: attribute distributions, per-camera rollups and hourly detection counts."""
+    return get_stats_snapshot()
+
+
+@app.post("/standing_queries")
+async def create_standing_query(request: StandingQueryRequest):
+    """Save a search that is evaluated against every new detection; hits are pushed over /standing_queries/ws."""
+    if not request.query_json and not (request.description and request.description.strip()):
+        raise HTTPException(status_code=400, detail="Provide a description or query_json")
+
+    query_json = request.query_json
+    required_terms = {}
+    if request.description:
+        required_terms = extract_critical_terms(request.description)
+        if not query_json:
+            query_json = await asyncio.get_running_loop().run_in_executor(None, query_to_structured_json, request.description)
+    if not query_json:
+        raise HTTPException(status_code=422, detail="Could not extract any attributes from the description")
+
+    return standing_queries.add(query_json, name=request.name, min_score=request.min_score,
+                                camera_ids=request.camera_ids, required_terms=required_terms,
+                                description=request.description)
+
+
+@app.get("/standing_queries")
+async def list_standing_queries():
+    return {"queries": standing_queries.list()}
+
+
+@app.get("/standing_queries/{query_id}")
+async def get_standing_query(query_id: str):
+    query = standing_queries.get(query_id)
+    if query is None:
+        raise HTTPException(status_code=404, detail=f"No standing query {query_id}")
+    return query
+
+
+@app.delete("/standing_queries/{query_id}")
+async def delete_standing_query(query_id: str):
+    if not standing_queries.delete(query_id):
+        raise HTTPException(status_code=404, detail=f"No standing query {query_id}")
+    return {"deleted": query_id}
+
+
+def _split_param(value: Optional[str]) -> Optional[List[str]]:
+    """Comma-separated query parameter as a list (None when empty)."""
+    items = [item.strip() for item in (value or "").split(",") if item.strip()]
+    return items or None
+
+
+@app.websocket("/standing_queries/ws")
+async def standing_query_hits(websocket: WebSocket):
+    """
+    Push standing query hits as they happen. Pass ?query_ids=a,b to receive only
+    those queries' hits.
+    """
+    await websocket.accept()
+    query_ids = set(_split_param(websocket.query_params.get("query_ids")) or [])
+    subscription = event_bus.subscribe(
+        types=[STANDING_QUERY_HIT],
+        predicate=(lambda event: event["data"]["query_id"] in query_ids) if query_ids else None
+    )
+    await forward_events(websocket, subscription, "Standing query")
+
+
+async def forward_events(websocket: WebSocket, subscription, label: str):
+    """Send a subscription's events to an accepted WebSocket until the client disconnects."""
+    async def push():
+        while True:
+            event = await subscription.get()
+            await websocket.send_text(json.dumps(event))
+
+    sender = asyncio.ensure_future(push())
+    try:
+        # Reading is how a disconnect is noticed while no events are arriving; anything sent is ignored
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        logger.info(f"{label} subscriber disconnected")
+    finally:
+        sender.cancel()
+        subscription.close()
+
+
+@app.get("/events")
+async def stream_events(types: Optional[str] = None, camera_ids: Optional[str] = None):
+    """
+    Server-sent events for detections, descriptions, alerts and standing query hits.
+    Filter with ?types=detections,amber_alert and ?camera_ids=SF-MKT-001.
+    """
+    subscription = event_bus.subscribe(types=_split_param(types), camera_ids=_split_param(camera_ids))
+
+    async def generate():
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.get(), EVENT_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    # Comment line so proxies keep the idle connection open
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            subscription.close()
+
+    return StreamingResponse(generate(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.websocket("/events/ws")
+async def event_socket(websocket: WebSocket):
+    """WebSocket fan-out of the event bus, with the same ?types= and ?camera_ids= filters as /events."""
+    await websocket.accept()
+    subscription = event_bus.subscribe(types=_split_param(websocket.query_params.get("types")),
+                                       camera_ids=_split_param(websocket.query_params.get("camera_ids")))
+    await forward_events(websocket, subscription, "Event")
+
+
+@app.get("/amber_alerts/incidents")
+async def amber_alert_incidents():
+    """Open amber alert incidents: the cameras and people each alert has been matched on."""
+    return {"incidents": alert_aggregator.incidents()}
+
+
+@app.websocket("/amber_alerts/ws")
+async def amber_alert_events(websocket: WebSocket):
+    """Push consolidated amber alert events (new, escalated, new_subject, repeat) as they happen."""
+    await websocket.accept()
+    subscription = event_bus.subscribe(types=[AMBER_ALERT_EVENT])
+    await forward_events(websocket, subscription, "Amber alert")
+
+
+@app.post("/amber_alerts/sweeps")
+async def start_alert_sweep(request: AlertSweepRequest):
+    """Retroactively score an alert against stored detections, newest first."""
+    alert = request.alert
+    if alert is None:
+        if not request.alert_id:
+            raise HTTPException(status_code=400, detail="Provide an alert_id or an alert")
+        alert = amber_alert_matcher.get_alert(request.alert_id)
+        if alert is None:
+            raise HTTPException(status_code=404, detail=f"No active amber alert {request.alert_id}")
+    elif not isinstance(alert.get("description"), dict) or not alert["description"]:
+        raise HTTPException(status_code=400, detail="The alert needs a description")
+
+    job = alert_sweeper.start(alert, window_hours=request.window_hours, min_score=request.min_score)
+    return job.to_dict(include_hits=False)
+
+
+@app.get("/amber_alerts/sweeps")
+async def list_alert_sweeps():
+    return {"sweeps": alert_sweeper.list()}
+
+
+@app.get("/amber_alerts/sweeps/{sweep_id}")
+async def get_alert_sweep(sweep_id: str):
+    """Sweep progress and the best hits so far."""
+    job = alert_sweeper.get(sweep_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"No sweep {sweep_id}")
+    return job.to_dict()
+
+
+@app.delete("/amber_alerts/sweeps/{sweep_id}")
+async def cancel_alert_sweep(sweep_id: str):
+    job = alert_sweeper.get(sweep_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"No sweep {sweep_id}")
+    job.cancel()
+    return job.to_dict(include_hits=False)
+
+
+@app.get("/amber_alerts/sweeps/{sweep_id}/stream")
+async def stream_alert_sweep(sweep_id: str, stream_format: str = "sse"):
+    """Stream a sweep's hits and progress from the start until it finishes."""
+    job = alert_sweeper.get(sweep_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"No sweep {sweep_id}")
+    if stream_format not in ("sse", "ndjson"):
+        raise HTTPException(status_code=400, detail="stream_format must be sse or ndjson")
+    return event_stream_response(job.iter_events(), stream_format)
+
+
 @app.get("/search_guidelines")
 async def search_guidelines():
     """Provide guidelines for writing effective search queries."""
@@ -482,12 +735,207 @@ async def handle_incoming_call(request: Request):
     return HTMLResponse(content=str(response), media_type="application/xml")
 
 
+@app.on_event("startup")
+async def startup_event():
+    # Sweep alerts activated while the server runs, even if no frames arrive
+    alert_sweeper.watch()
+
+
 @app.on_event("shutdown")
 async def shutdown_event():
     # Clean up OpenCV windows when the server shuts down
     cv2.destroyAllWindows()
 
 
+def store_described(person_pil: Image.Image, person_description: dict, camera_id: str, detection_id: str, conf: float, bbox: List[float]) -> Optional[str]:
+    """
+    Add one described person crop to the database.
+
+    Returns:
+        Stored record ID, or None if storing failed
+    """
+    try:
+        # Add to database with image and camera_id from request
+        stored_id = add_person(
+            description_json=person_description,
+            metadata={
+                "track_id": detection_id,
+                "frame": -1,  # We don't have frame number in this context
+                "image": person_pil,
+                "camera_id": camera_id,
+                "confidence": conf,
+                "bbox": bbox
+            }
+        )
+        logger.info(f"Added person to database with ID: {detection_id} for camera {camera_id}")
+        return stored_id
+    except Exception as store_error:
+        logger.error(f"Error storing person {detection_id} for camera {camera_id}: {str(store_error)}")
+        return None
+
+
+def describe_and_store_batch(crops: List[tuple], camera_id: str) -> List[tuple]:
+    """
+    Describe a group of person crops in as few Gemini requests as possible and add them to the database.
+
+    Args:
+        crops: (detection_id, PIL image, confidence, bbox) per crop
+
+    Returns:
+        (description, stored record ID or None if description failed) per crop, in order
+    """
+    try:
+        descriptions = describe_people([person_pil for _, person_pil, _, _ in crops])
+        logger.info(f"Generated {len(descriptions)} descriptions for people from camera {camera_id}")
+    except Exception as desc_error:
+        logger.error(f"Error generating descriptions for camera {camera_id}: {str(desc_error)}")
+        failed = {"error": f"Description generation failed: {str(desc_error)}"}
+        return [(failed, None)] * len(crops)
+    
+    results = []
+    for (detection_id, person_pil, conf, bbox), person_description in zip(crops, descriptions):
+        stored_id = store_described(person_pil, person_description, camera_id, detection_id, conf, bbox)
+        results.append((person_description, stored_id))
+    return results
+
+
+def split_batch_future(batch_future: Future, count: int) -> List[Future]:
+    """One future per crop of a queued describe_and_store_batch job, resolved when the batch finishes."""
+    futures = [Future() for _ in range(count)]
+    
+    def resolve(done: Future):
+        # A crop future is cancelled when its waiter times out; the others are still resolved
+        try:
+            results = done.result()
+        except BaseException as e:
+            for future in futures:
+                if not future.cancelled():
+                    future.set_exception(e)
+            return
+        for future, result in zip(futures, results):
+            if not future.cancelled():
+                future.set_result(result)
+    
+    batch_future.add_done_callback(resolve)
+    return futures
+
+
+def queue_descriptions(camera_id: str, pending: List[tuple]) -> List[Future]:
+    """
+    Queue a frame's person crops for description, DESCRIBE_BATCH_SIZE crops of the same lane per job.
+
+    Returns:
+        One future per pending crop, in order
+    """
+    lanes = assign_lanes([bbox for _, _, _, bbox, _ in pending], amber_alert_matcher.targets_children())
+    futures: List[Optional[Future]] = [None] * len(pending)
+    for lane in sorted(set(lanes)):
+        indices = [i for i, crop_lane in enumerate(lanes) if crop_lane == lane]
+        for start in range(0, len(indices), max(1, DESCRIBE_BATCH_SIZE)):
+            batch = indices[start:start + DESCRIBE_BATCH_SIZE]
+            crops = [pending[i][:4] for i in batch]
+            batch_future = describe_queue.submit(camera_id, lane, describe_and_store_batch, crops, camera_id)
+            for i, future in zip(batch, split_batch_future(batch_future, len(batch))):
+                futures[i] = future
+    return futures
+
+
+def describe_scene(frame: np.ndarray, camera_id: str) -> str:
+    """Generate a general description of the scene as a readable string."""
+    frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    pil_image = Image.fromarray(frame_rgb)
+    
+    try:
+        logger.info(f"Generating general scene description for camera {camera_id}")
+        scene_description = describe_person(pil_image, use_cache=False, local_colors=False)
+        logger.info(f"Scene description for camera {camera_id}: {scene_description}")
+    except Exception as scene_error:
+        logger.error(f"Error generating scene description for camera {camera_id}: {str(scene_error)}")
+        scene_description = {"error": f"Scene description failed: {str(scene_error)}"}
+    
+    # Convert description dictionary to a formatted string
+    description_str = ""
+    if scene_description:
+        if isinstance(scene_description, dict):
+            # Format the dictionary into a readable string
+            description_parts = []
+            for key, value in scene_description.items():
+                if value:  # Only include non-empty values
+                    # Convert key from snake_case to Title Case
+                    key_formatted = key.replace('_', ' ').title()
+                    description_parts.append(f"{key_formatted}: {value}")
+            description_str = ". ".join(description_parts)
+        else:
+            # If it's already a string, use it directly
+            description_str = str(scene_description)
+    return description_str
+
+
+def check_frame_alerts(person_crops: List[dict], camera_id: str, stored_ids: Dict[str, str]) -> Optional[dict]:
+    """
+    Check a frame's described crops against the amber alerts.
+    Matches are debounced per alert, so only new, escalated, new-subject or post-cooldown events are returned.
+    """
+    amber_alert_match = None
+    described = [person_crop for person_crop in person_crops if isinstance(person_crop.get("description"), dict)]
+    matches = check_amber_alert_matches([person_crop["description"] for person_crop in described])
+    for person_crop, match_result in zip(described, matches):
+        if match_result:
+            event = alert_aggregator.observe(match_result, camera_id, stored_ids.get(person_crop["id"]))
+            if event and amber_alert_match is None:
+                amber_alert_match = event
+    return amber_alert_match
+
+
+async def queued_result(future, camera_id: str, timeout: float = DESCRIBE_WAIT_TIMEOUT_SECONDS):
+    """Await one crop of a queued describe_and_store_batch job, falling back like a failed description."""
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(future), max(0.0, timeout))
+    except asyncio.TimeoutError:
+        logger.warning(f"Queued description for camera {camera_id} not ready after {timeout:.1f}s, skipping it")
+        return {"error": "Description timed out"}, None
+    except Exception as e:
+        logger.error(f"Queued description failed for camera {camera_id}: {str(e)}")
+        return {"error": f"Description generation failed: {str(e)}"}, None
+
+
+async def finish_deferred_frame(camera_id: str, pending: List[tuple], futures: List, scene_future):
+    """Publish a frame's queued descriptions as each completes, then check the amber alerts."""
+    try:
+        person_crops = []
+        stored_ids = {}
+        
+        async def publish_when_described(entry: tuple, future):
+            detection_id, _, _, bbox, _ = entry
+            person_description, stored_id = await queued_result(future, camera_id)
+            if stored_id:
+                stored_ids[detection_id] = stored_id
+            person_crops.append({"id": detection_id, "description": person_description})
+            event_bus.publish(PERSON_DESCRIBED_EVENT, {
+                "camera_id": camera_id,
+                "detection_id": detection_id,
+                "person_id": stored_id,
+                "description": person_description,
+                "bbox": bbox,
+                "crop_url": crop_url(stored_id) if stored_id else None
+            }, camera_id=camera_id)
+        
+        await asyncio.gather(*(publish_when_described(entry, future) for entry, future in zip(pending, futures)))
+        # Amber alert events are published by the aggregator
+        check_frame_alerts(person_crops, camera_id, stored_ids)
+        try:
+            scene = await asyncio.wait_for(asyncio.wrap_future(scene_future), DESCRIBE_WAIT_TIMEOUT_SECONDS)
+        except (DescribeDropped, asyncio.TimeoutError):
+            return
+        event_bus.publish(FRAME_DESCRIBED_EVENT, {"camera_id": camera_id, "description": scene}, camera_id=camera_id)
+    except Exception as e:
+        logger.error(f"Error finishing deferred frame for camera {camera_id}: {str(e)}")
+
+
+# Deferred frames still being finished; holding the tasks keeps them from being garbage collected
+_deferred_frames = set()
+
+
 @app.post("/process_frame", response_model=FrameResponse)
 async def process_frame(request: FrameRequest):
     try:
@@ -521,6 +969,8 @@ async def process_frame(request: FrameRequest):
         # Process detections
         detections = []
         person_crops = []
+        stored_ids = {}  # detection ID -> database record ID
+        pending = []  # crops waiting for a description: (detection_id, PIL image, confidence, bbox, BGR crop)
         
         # Debug: Check if there are any detections
         if len(results.boxes) == 0:
@@ -599,86 +1049,75 @@ async def process_frame(request: FrameRequest):
                     person_crop_rgb = cv2.cvtColor(person_crop, cv2.COLOR_BGR2RGB)
                     person_pil = Image.fromarray(person_crop_rgb)
                     
-                    # Generate description for this person
-                    try:
-                        person_description = describe_person(person_pil)
-                        logger.info(f"Generated description for person from camera {camera_id}: {person_description}")
-                        
-                        # Add to database with image and camera_id from request
-                        add_person(
-                            description_json=person_description,
-                            metadata={
-                                "track_id": detection_id,
-                                "frame": -1,  # We don't have frame number in this context
-                                "image": person_pil,
-                                "camera_id": camera_id,
-                                "confidence": conf,
-                                "bbox": [float(x1), float(y1), float(x2), float(y2)]
-                            }
-                        )
-                        logger.info(f"Added person to database with ID: {detection_id} for camera {camera_id}")
-                        
-                    except Exception as desc_error:
-                        logger.error(f"Error generating description for camera {camera_id}: {str(desc_error)}")
-                        person_description = {"error": f"Description generation failed: {str(desc_error)}"}
-                    
-                    # Convert crop to base64 for frontend display
-                    _, buffer = cv2.imencode('.jpg', person_crop)
-                    crop_base64 = base64.b64encode(buffer).decode('utf-8')
-                    
-                    # Add to person crops list
-                    person_crops.append({
+                    # Described by the describe queue once every crop of the frame is known
+                    bbox = [float(x1), float(y1), float(x2), float(y2)]
+                    crop_entry = {
                         "id": detection_id,
-                        "crop": crop_base64,
-                        "description": person_description,
+                        "description": None,
                         "camera_id": camera_id  # Explicitly include camera_id in each crop
-                    })
+                    }
+                    if request.defer_descriptions:
+                        # The result is published as a person_described event
+                        crop_entry["status"] = "pending"
+                    if not request.return_image_urls:
+                        # Convert crop to base64 for frontend display
+                        _, buffer = cv2.imencode('.jpg', person_crop)
+                        crop_entry["crop"] = base64.b64encode(buffer).decode('utf-8')
+                    
+                    # Add to person crops list
+                    pending.append((detection_id, person_pil, conf, bbox, person_crop))
+                    person_crops.append(crop_entry)
                     logger.info(f"Added person crop with ID {detection_id} for camera {camera_id}")
                 except Exception as crop_error:
                     logger.error(f"Error cropping person for camera {camera_id}: {str(crop_error)}")
                     # Continue processing other detections
         
-        # Generate a general description of the scene
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        pil_image = Image.fromarray(frame_rgb)
+        event_bus.publish(DETECTIONS_EVENT, {"camera_id": camera_id, "detections": detections}, camera_id=camera_id)
         
-        try:
-            logger.info(f"Generating general scene description for camera {camera_id}")
-            scene_description = describe_person(pil_image)
-            logger.info(f"Scene description for camera {camera_id}: {scene_description}")
-        except Exception as scene_error:
-            logger.error(f"Error generating scene description for camera {camera_id}: {str(scene_error)}")
-            scene_description = {"error": f"Scene description failed: {str(scene_error)}"}
+        # Queue the descriptions: alert candidates and child-sized crops first, the scene last
+        futures = queue_descriptions(camera_id, pending)
+        scene_future = describe_queue.submit(camera_id, LANE_SCENE, describe_scene, frame, camera_id)
         
-        # Convert description dictionary to a formatted string
-        description_str = ""
-        if scene_description:
-            if isinstance(scene_description, dict):
-                # Format the dictionary into a readable string
-                description_parts = []
-                for key, value in scene_description.items():
-                    if value:  # Only include non-empty values
-                        # Convert key from snake_case to Title Case
-                        key_formatted = key.replace('_', ' ').title()
-                        description_parts.append(f"{key_formatted}: {value}")
-                description_str = ". ".join(description_parts)
-            else:
-                # If it's already a string, use it directly
-                description_str = str(scene_description)
+        if request.defer_descriptions:
+            # Return the boxes now; descriptions, alerts and the scene description follow on the event bus
+            task = asyncio.ensure_future(finish_deferred_frame(camera_id, pending, futures, scene_future))
+            _deferred_frames.add(task)
+            task.add_done_callback(_deferred_frames.discard)
+            logger.info(f"Returning {len(detections)} detections for camera {camera_id}, {len(pending)} descriptions deferred")
+            return FrameResponse(
+                detections=detections,
+                description="",
+                timestamp=datetime.now().isoformat(),
+                person_crops=person_crops
+            )
+        
+        # Wait for the queued descriptions without blocking the event loop, up to one deadline per frame
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + DESCRIBE_WAIT_TIMEOUT_SECONDS
+        for crop_entry, (detection_id, _, _, _, person_crop), future in zip(person_crops, pending, futures):
+            person_description, stored_id = await queued_result(future, camera_id, deadline - loop.time())
+            crop_entry["description"] = person_description
+            if stored_id:
+                stored_ids[detection_id] = stored_id
+                if request.return_image_urls:
+                    # The crop is already in the blob store, so just point at the image endpoint
+                    crop_entry["crop_url"] = crop_url(stored_id)
+            elif request.return_image_urls:
+                _, buffer = cv2.imencode('.jpg', person_crop)
+                crop_entry["crop"] = base64.b64encode(buffer).decode('utf-8')
+        try:
+            description_str = await asyncio.wait_for(asyncio.wrap_future(scene_future), max(0.0, deadline - loop.time()))
+        except asyncio.TimeoutError:
+            logger.warning(f"Scene description for camera {camera_id} not ready in time, skipping it")
+            description_str = ""
+        except DescribeDropped as e:
+            logger.warning(f"Scene description skipped for camera {camera_id}: {e}")
+            description_str = ""
         
         # Debug: Log the response being sent
         logger.info(f"Sending response with {len(detections)} detections and {len(person_crops)} person crops for camera {camera_id}")
         
-        # Check for amber alert matches for each person description
-        amber_alert_match = None
-        for person_crop in person_crops:
-            if "description" in person_crop and isinstance(person_crop["description"], dict):
-                # Check if this person matches any active amber alerts
-                match_result = check_amber_alert_match(person_crop["description"])
-                if match_result:
-                    logger.info(f"Found amber alert match for camera {camera_id}: {match_result}")
-                    amber_alert_match = match_result
-                    break
+        amber_alert_match = check_frame_alerts(person_crops, camera_id, stored_ids)
         
         return FrameResponse(
             detections=detections,
@@ -749,160 +1188,49 @@ async def person_search_chat(request: PersonSearchChatRequest):
     1. Has full access to the database from ml.json (read-only mode)
     2. Can perform natural language searches
     3. Can answer questions about database contents
-    4. Maintains conversation context
+    4. Maintains conversation context in a server-side session keyed by conversation_id
     
     Note: The database is accessed in read-only mode from ml.json
     """
     try:
         logger.info(f"Received person search chat request: {request.query}")
         
-        # Load the entire database from ml.json (read-only)
-        db = load_database()  # This now loads from ml.json
-        if not db or "people" not in db or len(db["people"]) == 0:
+        # Dataset context is rendered once per database version
+        context, context_version = person_search_context.get()
+        if context is None:
             logger.warning("Database empty for person search chat")
             return PersonSearchChatResponse(
                 response="I don't have any person data to search through yet. Please ensure the ml.json file contains data.",
                 suggested_searches=[],
                 database_stats={"total_people": 0}
             )
+        simplified_people = context["simplified_people"]
         
-        # Calculate database statistics for context
-        total_people = len(db["people"])
-        unique_cameras = set()
-        genders = {}
-        age_groups = {}
-        clothing_colors = {}
+        # A resumed session already holds the conversation; a new one is seeded with the history sent
+        seed_history = to_gemini_history(request.conversation_history)
+        session = chat_sessions.get_or_create("person_search", request.conversation_id, context["system_prompt"],
+                                              context_version, seed_history)
         
-        for person in db["people"]:
-            # Count cameras
-            camera_id = person.get("metadata", {}).get("camera_id", "unknown")
-            unique_cameras.add(camera_id)
-            
-            # Count demographics
-            desc = person.get("description", {})
-            
-            # Gender stats
-            gender = desc.get("gender")
-            if gender:
-                genders[gender] = genders.get(gender, 0) + 1
-                
-            # Age stats
-            age = desc.get("age_group")
-            if age:
-                age_groups[age] = age_groups.get(age, 0) + 1
-                
-            # Clothing color stats (for top clothing)
-            color = desc.get("clothing_top_color")
-            if color:
-                clothing_colors[color] = clothing_colors.get(color, 0) + 1
-        
-        # Format database for Gemini
-        # We need to simplify and truncate to avoid exceeding context limits
-        simplified_people = []
-        
-        # Only include people with good descriptions - limit to 100 entries max
-        max_entries = 100
-        counter = 0
-        
-        for person in db["people"]:
-            if counter >= max_entries:
-                break
-                
-            desc = person.get("description", {})
-            metadata = person.get("metadata", {})
-            
-            # Skip entries without good descriptions
-            if not desc or len(desc) < 3:
-                continue
-                
-            # Create a simplified representation
-            simple_person = {
-                "id": person.get("id", f"person_{counter}"),
-                "camera_id": metadata.get("camera_id", "unknown"),
-                "camera_location": get_camera_location(metadata.get("camera_id", "unknown")),
-                "timestamp": metadata.get("timestamp", "unknown"),
-                "description": desc
+        # The chat reply, suggested searches and quick matches are independent, so they run concurrently
+        results = await gather_calls(
+            {
+                "response": lambda: session.send(request.query, context["system_prompt"], context_version),
+                "suggested_searches": lambda: get_suggested_searches(request.query, simplified_people[:5]),
+                "matches": lambda: find_quick_matches(request.query)
+            },
+            defaults={
+                "response": "I couldn't generate a response in time. Please try again.",
+                "suggested_searches": ["person wearing red", "child with backpack", "woman with blonde hair"],
+                "matches": []
             }
-            
-            simplified_people.append(simple_person)
-            counter += 1
-        
-        # Create database statistics summary
-        db_stats = {
-            "total_people": total_people,
-            "unique_cameras": len(unique_cameras),
-            "cameras": list(unique_cameras),
-            "gender_distribution": genders,
-            "age_distribution": age_groups,
-            "top_clothing_colors": clothing_colors
-        }
-            
-        # Create the prompt for Gemini
-        system_prompt = f"""
-You are an AI assistant for a surveillance system called Foresight that helps find people in camera footage.
-You have access to a database of {total_people} people detected across {len(unique_cameras)} cameras.
-
-YOUR DATABASE CONTEXT:
-- Total people detected: {total_people}
-- Camera locations: {", ".join(sorted(unique_cameras))}
-- Gender distribution: {", ".join(f"{k}: {v}" for k, v in genders.items())}
-- Age distribution: {", ".join(f"{k}: {v}" for k, v in age_groups.items())}
-
-The database contains detailed descriptions of people including:
-- Gender, age group, ethnicity, skin tone
-- Hair style and color
-- Clothing details (tops, bottoms, colors, patterns)
-- Accessories and bags
-- Location context
-- Camera ID and timestamp of detection
-
-Your job is to:
-1. Answer questions about people in the database
-2. Help users find specific people with natural language searches
-3. Provide statistics and insights about the data
-4. Suggest related searches that might be helpful
-
-DATABASE ENTRIES (simplified for reference):
-{json.dumps(simplified_people[:10], indent=2)}
-...and {len(simplified_people) - 10} more entries not shown here.
-
-INSTRUCTIONS:
-- When users ask about specific people, search the database entries to find matches
-- For search queries, suggest specific attributes that might help narrow down results
-- If asked about statistics, use the database summary information
-- Be concise but informative in your responses
-- Include camera locations when mentioning specific detections
-- Mention timestamps in a human-readable format when relevant
-"""
-
-        # Add conversation history if available
-        conversation = []
-        for turn in request.conversation_history:
-            role = turn.get("role", "user")
-            content = turn.get("content", "")
-            conversation.append({"role": role, "parts": [content]})
-            
-        # Add the user's current query
-        conversation.append({"role": "user", "parts": [request.query]})
-        
-        # Initialize Gemini model for chat
-        model = genai.GenerativeModel('gemini-2.0-flash')
-        
-        # Send the conversation to Gemini
-        chat = model.start_chat(history=conversation)
-        response = chat.send_message(system_prompt)
-        
-        # Get suggested searches using the query and Gemini's basic capabilities
-        suggested_searches = await get_suggested_searches(request.query, simplified_people[:5])
-            
-        # Run a quick search to find potential matches for the query
-        search_results = await find_quick_matches(request.query, simplified_people)
+        )
         
         return PersonSearchChatResponse(
-            response=response.text,
-            suggested_searches=suggested_searches,
-            database_stats=db_stats,
-            matches=search_results
+            response=results["response"],
+            suggested_searches=results["suggested_searches"],
+            database_stats=context["db_stats"],
+            matches=results["matches"],
+            conversation_id=session.conversation_id
         )
         
     except Exception as e:
@@ -913,7 +1241,7 @@ INSTRUCTIONS:
             database_stats={"error": str(e)}
         )
 
-async def get_suggested_searches(query: str, sample_entries: List[Dict[str, Any]] = None) -> List[str]:
+def get_suggested_searches(query: str, sample_entries: List[Dict[str, Any]] = None) -> List[str]:
     """Generate suggested searches based on the user's query."""
     try:
         # Create a simple prompt for Gemini
@@ -950,80 +1278,6 @@ Example response: ["man in red jacket", "woman with blonde hair", "child carryin
         logger.error(f"Error generating search suggestions: {str(e)}")
         return ["person wearing red", "child with backpack", "woman with blonde hair"]
 
-async def find_quick_matches(query: str, database_entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    """Quickly find potential matches for the query."""
-    try:
-        # If query is very short, return empty list
-        if len(query.strip()) < 3:
-            return []
-            
-        # Extract key terms from the query
-        query_lower = query.lower()
-        matches = []
-        
-        # Simple keyword matching for quick results
-        for person in database_entries:
-            score = 0
-            match_reasons = []
-            
-            desc = person.get("description", {})
-            desc_str = json.dumps(desc).lower()
-            
-            # Check for gender terms
-            for gender in ["male", "female", "man", "woman", "boy", "girl"]:
-                if gender in query_lower and gender in desc_str:
-                    score += 2
-                    match_reasons.append(f"Matches gender: {gender}")
-                    
-            # Check for age terms
-            for age in ["child", "kid", "teen", "adult", "elderly", "senior"]:
-                if age in query_lower and age in desc_str:
-                    score += 2
-                    match_reasons.append(f"Matches age group: {age}")
-                    
-            # Check for color terms
-            colors = ["red", "blue", "green", "yellow", "black", "white", "orange", 
-                     "purple", "pink", "brown", "gray", "grey"]
-            for color in colors:
-                if color in query_lower and color in desc_str:
-                    score += 1.5
-                    match_reasons.append(f"Matches color: {color}")
-                    
-            # Check for clothing terms
-            clothing = ["shirt", "pants", "jacket", "hoodie", "dress", "skirt", 
-                       "jeans", "sweater", "hat", "shoes", "shorts"]
-            for item in clothing:
-                if item in query_lower and item in desc_str:
-                    score += 1.5
-                    match_reasons.append(f"Matches clothing: {item}")
-                    
-            # Check for features
-            features = ["hair", "glasses", "beard", "mustache", "tall", "short", 
-                       "backpack", "bag", "hat", "sunglasses"]
-            for feature in features:
-                if feature in query_lower and feature in desc_str:
-                    score += 1
-                    match_reasons.append(f"Matches feature: {feature}")
-                    
-            # If score is above threshold, add to matches
-            if score > 3:
-                matches.append({
-                    "id": person.get("id", "unknown"),
-                    "camera_id": person.get("camera_id", "unknown"),
-                    "camera_location": person.get("camera_location", "Unknown location"),
-                    "description": person.get("description", {}),
-                    "score": min(score * 10, 100),  # Convert to 0-100 scale
-                    "match_reasons": match_reasons[:3]  # Limit to top 3 reasons
-                })
-                
-        # Sort by score (descending) and take top 5
-        matches.sort(key=lambda x: x["score"], reverse=True)
-        return matches[:5]
-            
-    except Exception as e:
-        logger.error(f"Error finding quick matches: {str(e)}")
-        return []
-
 if __name__ == "__main__":
     logger.info("Starting server...")
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,115 @@
+# pagination.py
+
+import os
+import uuid
+import time
+import threading
+import logging
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+from dotenv import load_dotenv
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Cursor pagination configuration
+PAGINATION_MAX_RESULTS = int(os.getenv("PAGINATION_MAX_RESULTS", "1000"))  # ranking depth kept per search
+PAGINATION_IDLE_SECONDS = float(os.getenv("PAGINATION_IDLE_SECONDS", "300"))  # expire if no page is read for this long
+PAGINATION_MAX_AGE_SECONDS = float(os.getenv("PAGINATION_MAX_AGE_SECONDS", "1800"))  # expire regardless of use
+PAGINATION_MAX_RESULT_SETS = int(os.getenv("PAGINATION_MAX_RESULT_SETS", "500"))
+
+
+class ResultSet:
+    """A ranked search result kept server-side: detection IDs and scores only."""
+    __slots__ = ("ids", "scores", "context", "created", "last_access")
+
+    def __init__(self, ids: List[str], scores: List[float], context: Dict[str, Any], now: float):
+        self.ids = ids
+        self.scores = scores
+        self.context = context
+        self.created = now
+        self.last_access = now
+
+
+class CursorStore:
+    """
+    Short-lived ranked result sets that search pages are cut from.
+
+    A cursor is "<result set id>:<offset>", so reading any page is a slice of
+    the stored ranking. Result sets expire when no page has been read for
+    PAGINATION_IDLE_SECONDS or once they are PAGINATION_MAX_AGE_SECONDS old,
+    and the least recently read set is dropped when the store is full.
+    """
+
+    def __init__(self, idle_seconds: float = PAGINATION_IDLE_SECONDS, max_age_seconds: float = PAGINATION_MAX_AGE_SECONDS,
+                 max_result_sets: int = PAGINATION_MAX_RESULT_SETS):
+        self.idle_seconds = idle_seconds
+        self.max_age_seconds = max_age_seconds
+        self.max_result_sets = max_result_sets
+        self._sets: "OrderedDict[str, ResultSet]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._metrics = {"created": 0, "pages": 0, "expired": 0, "evicted": 0, "unknown": 0}
+
+    def _expired(self, result_set: ResultSet, now: float) -> bool:
+        return (now - result_set.last_access > self.idle_seconds or
+                now - result_set.created > self.max_age_seconds)
+
+    def _prune(self, now: float):
+        """Drop expired result sets. Must be called with the lock held."""
+        for set_id in [set_id for set_id, result_set in self._sets.items() if self._expired(result_set, now)]:
+            del self._sets[set_id]
+            self._metrics["expired"] += 1
+
+    def create(self, ids: List[str], scores: List[float], context: Dict[str, Any]) -> str:
+        """Store a ranking and return the cursor of its first page."""
+        now = time.time()
+        set_id = uuid.uuid4().hex
+        with self._lock:
+            self._prune(now)
+            self._sets[set_id] = ResultSet(ids, scores, context, now)
+            while len(self._sets) > self.max_result_sets:
+                self._sets.popitem(last=False)
+                self._metrics["evicted"] += 1
+            self._metrics["created"] += 1
+        return f"{set_id}:0"
+
+    def page(self, cursor: str, page_size: int) -> Optional[Tuple[ResultSet, int, List[Tuple[str, float]], Optional[str]]]:
+        """
+        Read one page at a cursor.
+
+        Returns:
+            Tuple of (result set, offset, [(detection ID, score)], next cursor or None on the last page),
+            or None if the cursor is malformed, unknown or expired
+        """
+        set_id, _, offset = cursor.partition(":")
+        if not offset.isdigit():
+            return None
+        offset = int(offset)
+        now = time.time()
+        with self._lock:
+            result_set = self._sets.get(set_id)
+            if result_set is None or self._expired(result_set, now):
+                self._sets.pop(set_id, None)
+                self._metrics["unknown"] += 1
+                return None
+            result_set.last_access = now
+            self._sets.move_to_end(set_id)
+            self._metrics["pages"] += 1
+
+        end = offset + page_size
+        items = list(zip(result_set.ids[offset:end], result_set.scores[offset:end]))
+        next_cursor = f"{set_id}:{end}" if end < len(result_set.ids) else None
+        return result_set, offset, items, next_cursor
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._prune(time.time())
+            return {**self._metrics, "result_sets": len(self._sets), "max_result_sets": self.max_result_sets}
+
+
+# Shared store used by search.paginated_search
+cursor_store = CursorStore()
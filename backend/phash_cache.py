@@ -0,0 +1,227 @@
+# phash_cache.py
+
+import os
+import json
+import time
+import copy
+import sqlite3
+import threading
+import logging
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+import numpy as np
+from PIL import Image
+from dotenv import load_dotenv
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Description cache configuration
+PHASH_CACHE_ENABLED = os.getenv("PHASH_CACHE_ENABLED", "true").lower() == "true"
+PHASH_CACHE_MAX_ENTRIES = int(os.getenv("PHASH_CACHE_MAX_ENTRIES", "4096"))
+PHASH_CACHE_TTL_SECONDS = float(os.getenv("PHASH_CACHE_TTL_SECONDS", "3600"))
+PHASH_CACHE_MAX_DISTANCE = int(os.getenv("PHASH_CACHE_MAX_DISTANCE", "6"))  # differing hash bits (of 64) still treated as the same crop
+PHASH_CACHE_MAX_COLOR_DISTANCE = float(os.getenv("PHASH_CACHE_MAX_COLOR_DISTANCE", "24"))  # mean RGB distance per region, guards against same-shape different-colour crops
+PHASH_CACHE_DISK_PATH = os.getenv("PHASH_CACHE_DISK_PATH", "")  # empty disables the on-disk tier
+
+HASH_SIZE = 8  # 8x8 low-frequency DCT coefficients -> 64-bit hash
+HASH_IMAGE_SIZE = 32
+COLOR_REGIONS = 3  # horizontal bands (head, torso, legs) whose mean colour is stored next to the hash
+
+# Orthonormal DCT-II matrix, so the 2D DCT of a block X is D @ X @ D.T
+_n = np.arange(HASH_IMAGE_SIZE)
+_DCT = np.sqrt(2.0 / HASH_IMAGE_SIZE) * np.cos(np.pi * (2 * _n[None, :] + 1) * _n[:, None] / (2 * HASH_IMAGE_SIZE))
+_DCT[0] /= np.sqrt(2.0)
+
+
+def image_signature(image: Image.Image) -> Tuple[int, np.ndarray]:
+    """
+    Perceptual hash of a crop plus the mean colour of its head/torso/leg bands.
+
+    The crop is normalized to a 32x32 grayscale square, so the same person at a
+    slightly different size, JPEG quality or exposure hashes to (nearly) the same
+    64 bits. The hash is the sign of each low-frequency DCT coefficient relative to
+    their median.
+
+    Returns:
+        (64-bit hash, array of COLOR_REGIONS * 3 mean RGB values)
+    """
+    rgb = image.convert("RGB")
+    gray = np.asarray(rgb.convert("L").resize((HASH_IMAGE_SIZE, HASH_IMAGE_SIZE), Image.BILINEAR), dtype=np.float64)
+    coefficients = (_DCT @ gray @ _DCT.T)[:HASH_SIZE, :HASH_SIZE].flatten()
+    bits = coefficients > np.median(coefficients[1:])
+    phash = int(np.packbits(bits).view(">u8")[0])
+    colors = np.asarray(rgb.resize((1, COLOR_REGIONS), Image.BOX), dtype=np.float32).reshape(-1)
+    return phash, colors
+
+
+def _popcount(values: np.ndarray) -> np.ndarray:
+    return np.unpackbits(values.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+def _is_cacheable(description: Any) -> bool:
+    """Only real answers are cached; failures and the all-unknown fallback are retried next time."""
+    if not isinstance(description, dict) or not description or "error" in description:
+        return False
+    return any(str(value).lower() != "unknown" for value in description.values())
+
+
+class DescriptionCache:
+    """
+    Content-addressed cache of describe_person results.
+
+    Crops are keyed by image_signature and looked up by Hamming distance, so a
+    near-identical crop (a person pausing in view, overlapping cameras, a
+    re-uploaded clip) reuses an earlier description instead of a Gemini call.
+    Hashes are held in a flat array so a lookup is one vectorized scan. Entries are
+    evicted least recently used beyond max_entries and expire after ttl_seconds. An
+    optional SQLite file keeps them across restarts.
+    """
+
+    def __init__(self, max_entries: int = PHASH_CACHE_MAX_ENTRIES, ttl_seconds: float = PHASH_CACHE_TTL_SECONDS,
+                 max_distance: int = PHASH_CACHE_MAX_DISTANCE, max_color_distance: float = PHASH_CACHE_MAX_COLOR_DISTANCE,
+                 disk_path: str = PHASH_CACHE_DISK_PATH):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_distance = max_distance
+        self.max_color_distance = max_color_distance
+        self._hashes = np.zeros(max_entries, dtype=np.uint64)
+        self._colors = np.zeros((max_entries, COLOR_REGIONS * 3), dtype=np.float32)
+        self._valid = np.zeros(max_entries, dtype=bool)
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()  # slot -> (description, created), least recently used first
+        self._free = list(range(max_entries - 1, -1, -1))
+        self._lock = threading.Lock()
+        self._metrics = {"hits": 0, "misses": 0, "expired": 0, "evicted": 0, "stored": 0}
+        self._disk = None
+        if disk_path:
+            try:
+                self._disk = sqlite3.connect(disk_path, check_same_thread=False)
+                self._disk.execute(
+                    "CREATE TABLE IF NOT EXISTS description_cache (hash INTEGER PRIMARY KEY, colors TEXT NOT NULL, value TEXT NOT NULL, created REAL NOT NULL)"
+                )
+                self._disk.commit()
+                self._load()
+                logger.info(f"Description cache disk tier enabled at {disk_path} ({len(self._entries)} entries loaded)")
+            except sqlite3.Error as e:
+                logger.error(f"Could not open description cache database {disk_path}: {e}")
+                self._disk = None
+
+    def _load(self):
+        """Fill memory with the newest unexpired entries from disk."""
+        rows = self._disk.execute(
+            "SELECT hash, colors, value, created FROM description_cache WHERE created >= ? ORDER BY created DESC LIMIT ?",
+            (time.time() - self.ttl_seconds, self.max_entries)
+        ).fetchall()
+        for phash, colors, value, created in reversed(rows):
+            self._put_memory(phash & 0xFFFFFFFFFFFFFFFF, np.array(json.loads(colors), dtype=np.float32), json.loads(value), created)
+
+    def _evict(self, slot: int):
+        """Free a slot. Must be called with the lock held."""
+        del self._entries[slot]
+        self._valid[slot] = False
+        self._free.append(slot)
+
+    def _put_memory(self, phash: int, colors: np.ndarray, description: Dict[str, Any], created: float):
+        """Must be called with the lock held."""
+        if not self._free:
+            self._evict(next(iter(self._entries)))
+            self._metrics["evicted"] += 1
+        slot = self._free.pop()
+        self._hashes[slot] = phash
+        self._colors[slot] = colors
+        self._valid[slot] = True
+        self._entries[slot] = (description, created)
+
+    def _find(self, phash: int, colors: np.ndarray) -> Optional[int]:
+        """Slot of the closest live entry within both thresholds. Must be called with the lock held."""
+        if not self._entries:
+            return None
+        distances = _popcount(self._hashes ^ np.uint64(phash))
+        color_distances = np.abs(self._colors - colors).reshape(-1, COLOR_REGIONS, 3).mean(axis=2).max(axis=1)
+        candidates = np.flatnonzero(self._valid & (distances <= self.max_distance) & (color_distances <= self.max_color_distance))
+        if not len(candidates):
+            return None
+        return int(candidates[np.argmin(distances[candidates])])
+
+    def get(self, image: Image.Image, signature: Optional[Tuple[int, np.ndarray]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Cached description of a crop that looks like image, or None.
+
+        Args:
+            image: PIL Image of a person
+            signature: image_signature(image), if the caller already has it
+        """
+        if not PHASH_CACHE_ENABLED:
+            return None
+        phash, colors = signature or image_signature(image)
+        with self._lock:
+            while True:
+                slot = self._find(phash, colors)
+                if slot is None:
+                    self._metrics["misses"] += 1
+                    return None
+                description, created = self._entries[slot]
+                if time.time() - created <= self.ttl_seconds:
+                    break
+                self._evict(slot)
+                self._metrics["expired"] += 1
+            self._entries.move_to_end(slot)
+            self._metrics["hits"] += 1
+            return copy.deepcopy(description)
+
+    def put(self, image: Image.Image, description: Dict[str, Any], signature: Optional[Tuple[int, np.ndarray]] = None):
+        """Remember the description of a crop. Failed descriptions are not cached."""
+        if not PHASH_CACHE_ENABLED or not _is_cacheable(description):
+            return
+        phash, colors = signature or image_signature(image)
+        created = time.time()
+        with self._lock:
+            slot = self._find(phash, colors)
+            if slot is not None:
+                self._evict(slot)
+            self._put_memory(phash, colors, copy.deepcopy(description), created)
+            self._metrics["stored"] += 1
+            if self._disk is not None:
+                try:
+                    # SQLite integers are signed 64-bit
+                    signed = phash - (1 << 64) if phash >= 1 << 63 else phash
+                    self._disk.execute("INSERT OR REPLACE INTO description_cache (hash, colors, value, created) VALUES (?, ?, ?, ?)",
+                                       (signed, json.dumps(colors.tolist()), json.dumps(description), created))
+                    self._disk.execute("DELETE FROM description_cache WHERE created < ?", (created - self.ttl_seconds,))
+                    self._disk.commit()
+                except sqlite3.Error as e:
+                    logger.error(f"Description cache disk write failed: {e}")
+
+    def clear(self):
+        with self._lock:
+            for slot in list(self._entries):
+                self._evict(slot)
+            if self._disk is not None:
+                try:
+                    self._disk.execute("DELETE FROM description_cache")
+                    self._disk.commit()
+                except sqlite3.Error as e:
+                    logger.error(f"Description cache disk clear failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = dict(self._metrics)
+            lookups = metrics["hits"] + metrics["misses"]
+            metrics.update({
+                "enabled": PHASH_CACHE_ENABLED,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "max_distance": self.max_distance,
+                "disk_enabled": self._disk is not None,
+                "hit_rate": metrics["hits"] / lookups if lookups else 0.0
+            })
+            return metrics
+
+
+# Shared cache consulted by describe.describe_person and describe.describe_people
+description_cache = DescriptionCache()
@@ -0,0 +1,211 @@
+# query_cache.py
+
+import os
+import re
+import json
+import time
+import copy
+import sqlite3
+import threading
+import logging
+from collections import OrderedDict
+from typing import Dict, Any, Callable, Optional
+from dotenv import load_dotenv
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Query parse cache configuration
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "2048"))
+QUERY_CACHE_TTL_SECONDS = float(os.getenv("QUERY_CACHE_TTL_SECONDS", str(24 * 3600)))
+QUERY_CACHE_DISK_PATH = os.getenv("QUERY_CACHE_DISK_PATH", "")  # empty disables the on-disk tier
+QUERY_CACHE_WAIT_SECONDS = float(os.getenv("QUERY_CACHE_WAIT_SECONDS", "30"))
+
+
+def normalize_query(query: str) -> str:
+    """Canonical cache key: lowercase, collapsed whitespace, no trailing punctuation."""
+    query = re.sub(r"\s+", " ", query.strip().lower())
+    return query.rstrip(" .!?,;")
+
+
+class UncachedResult(dict):
+    """A parse returned to the callers but never cached, e.g. a fallback after a failed Gemini call."""
+
+
+class _Flight:
+    """A computation in progress that concurrent callers wait on."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class QueryParseCache:
+    """
+    Two-tier cache for parsed search queries.
+
+    An in-memory LRU sits in front of an optional SQLite file so parses survive
+    restarts. Entries expire after a TTL. Concurrent callers asking for the same
+    key while it is being computed wait for the one in-flight computation
+    (single-flight) instead of each calling Gemini.
+    """
+
+    def __init__(self, max_entries: int = QUERY_CACHE_MAX_ENTRIES, ttl_seconds: float = QUERY_CACHE_TTL_SECONDS,
+                 disk_path: str = QUERY_CACHE_DISK_PATH):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._in_flight: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+        self._metrics = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "shared_in_flight": 0, "expired": 0, "uncached": 0}
+        self._disk = None
+        if disk_path:
+            try:
+                self._disk = sqlite3.connect(disk_path, check_same_thread=False)
+                self._disk.execute(
+                    "CREATE TABLE IF NOT EXISTS query_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)"
+                )
+                self._disk.commit()
+                logger.info(f"Query cache disk tier enabled at {disk_path}")
+            except sqlite3.Error as e:
+                logger.error(f"Could not open query cache database {disk_path}: {e}")
+                self._disk = None
+
+    def _get_memory(self, key: str, now: float) -> Optional[Dict[str, Any]]:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        value, created = entry
+        if now - created > self.ttl_seconds:
+            del self._memory[key]
+            self._metrics["expired"] += 1
+            return None
+        self._memory.move_to_end(key)
+        return value
+
+    def _put_memory(self, key: str, value: Dict[str, Any], created: float):
+        self._memory[key] = (value, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _get_disk(self, key: str, now: float) -> Optional[Dict[str, Any]]:
+        if self._disk is None:
+            return None
+        try:
+            row = self._disk.execute("SELECT value, created FROM query_cache WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Query cache disk read failed: {e}")
+            return None
+        if row is None:
+            return None
+        value, created = row
+        if now - created > self.ttl_seconds:
+            self._metrics["expired"] += 1
+            return None
+        value = json.loads(value)
+        # Promote to memory, keeping the original creation time so the TTL still applies
+        self._put_memory(key, value, created)
+        return value
+
+    def _put_disk(self, key: str, value: Dict[str, Any], created: float):
+        if self._disk is None:
+            return
+        try:
+            self._disk.execute("INSERT OR REPLACE INTO query_cache (key, value, created) VALUES (?, ?, ?)",
+                               (key, json.dumps(value), created))
+            self._disk.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Query cache disk write failed: {e}")
+
+    def _lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        """Check both tiers. Must be called with the lock held."""
+        now = time.time()
+        value = self._get_memory(key, now)
+        if value is not None:
+            self._metrics["memory_hits"] += 1
+            return value
+        value = self._get_disk(key, now)
+        if value is not None:
+            self._metrics["disk_hits"] += 1
+        return value
+
+    def get_or_compute(self, key: str, compute: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Return the cached value for `key`, computing it at most once across concurrent callers.
+        Empty results and UncachedResult fallbacks are returned but not cached so
+        transient failures are retried.
+        """
+        with self._lock:
+            value = self._lookup(key)
+            if value is not None:
+                return copy.deepcopy(value)
+            flight = self._in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._in_flight[key] = flight
+                self._metrics["misses"] += 1
+            else:
+                self._metrics["shared_in_flight"] += 1
+
+        if not leader:
+            if not flight.event.wait(QUERY_CACHE_WAIT_SECONDS):
+                logger.warning(f"Timed out waiting for in-flight query parse: '{key}'")
+                return compute()
+            if flight.error is not None:
+                raise flight.error
+            return copy.deepcopy(flight.result)
+
+        try:
+            result = compute()
+            flight.result = result
+            if isinstance(result, UncachedResult):
+                with self._lock:
+                    self._metrics["uncached"] += 1
+            elif result:
+                created = time.time()
+                with self._lock:
+                    self._put_memory(key, copy.deepcopy(result), created)
+                    self._put_disk(key, result, created)
+            return result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            flight.event.set()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._disk is not None:
+                try:
+                    self._disk.execute("DELETE FROM query_cache")
+                    self._disk.commit()
+                except sqlite3.Error as e:
+                    logger.error(f"Query cache disk clear failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = dict(self._metrics)
+            hits = metrics["memory_hits"] + metrics["disk_hits"] + metrics["shared_in_flight"]
+            lookups = hits + metrics["misses"]
+            metrics.update({
+                "entries": len(self._memory),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "disk_enabled": self._disk is not None,
+                "hit_rate": hits / lookups if lookups else 0.0
+            })
+            return metrics
+
+
+# Shared cache used by search.query_to_structured_json
+query_cache = QueryParseCache()
@@ -0,0 +1,348 @@
+# query_parser.py
+
+import os
+import re
+import threading
+import logging
+from typing import Dict, Any, List, Tuple, NamedTuple
+from dotenv import load_dotenv
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Queries parsed locally with at least this confidence skip the Gemini call
+LOCAL_PARSER_MIN_CONFIDENCE = float(os.getenv("LOCAL_PARSER_MIN_CONFIDENCE", "0.85"))
+# Confidence lost per ambiguity; a single one takes a fully understood query below the default threshold
+LOCAL_PARSER_PENALTY = 0.2
+
+# ----------------------------------------------------------------------
+# Lexicon: surface phrase -> (token type, canonical value)
+# ----------------------------------------------------------------------
+
+GENDER_TERMS = {
+    "male": ["man", "male", "guy", "men", "guys", "gentleman", "masculine"],
+    "female": ["woman", "female", "lady", "women", "ladies", "feminine"],
+}
+
+# Boy/girl imply both gender and age group
+GENDERED_CHILD_TERMS = {
+    "boy": "male", "boys": "male", "girl": "female", "girls": "female",
+}
+
+AGE_TERMS = {
+    "child": ["child", "kid", "kids", "children", "toddler", "baby"],
+    "teen": ["teen", "teens", "teenager", "teenage", "adolescent"],
+    "adult": ["adult", "grown-up", "middle-aged", "middle aged"],
+    "senior": ["senior", "elderly", "old", "older", "aged", "elder"],
+}
+
+COLORS = [
+    "red", "blue", "green", "yellow", "black", "white", "purple", "orange", "pink", "gray",
+    "brown", "beige", "tan", "navy", "maroon", "burgundy", "khaki", "olive", "teal", "gold",
+    "silver", "cream", "turquoise", "violet", "lavender",
+]
+COLOR_ALIASES = {"grey": "gray", "navy blue": "navy"}
+COLOR_SHADES = ["light", "dark", "bright", "pale"]
+
+GARMENTS = {
+    "top": {
+        "shirt": "shirt", "t-shirt": "t-shirt", "tshirt": "t-shirt", "t shirt": "t-shirt", "tee": "t-shirt",
+        "hoodie": "hoodie", "hooded sweatshirt": "hoodie", "jacket": "jacket", "coat": "coat",
+        "sweater": "sweater", "sweatshirt": "sweatshirt", "blouse": "blouse", "tank top": "tank top",
+        "polo": "polo", "polo shirt": "polo", "vest": "vest", "cardigan": "cardigan", "blazer": "blazer",
+        "top": "top", "dress": "dress", "uniform": "uniform",
+    },
+    "bottom": {
+        "jeans": "jeans", "pants": "pants", "trousers": "pants", "slacks": "pants", "shorts": "shorts",
+        "skirt": "skirt", "leggings": "leggings", "joggers": "joggers", "sweatpants": "sweatpants",
+        "khakis": "khakis", "chinos": "chinos",
+    },
+    "footwear": {
+        "sneakers": "sneakers", "shoes": "shoes", "boots": "boots", "sandals": "sandals",
+        "heels": "heels", "trainers": "sneakers", "flip flops": "sandals",
+    },
+}
+
+BAGS = {
+    "backpack": "backpack", "bag": "bag", "handbag": "handbag", "purse": "purse",
+    "shoulder bag": "shoulder bag", "tote": "tote bag", "tote bag": "tote bag", "suitcase": "suitcase",
+    "briefcase": "briefcase",
+}
+
+ACCESSORIES = {
+    "hat": "hat", "cap": "cap", "baseball cap": "cap", "beanie": "beanie", "scarf": "scarf",
+    "umbrella": "umbrella", "cane": "cane", "watch": "watch", "headphones": "headphones",
+    "mask": "mask", "stroller": "stroller", "gloves": "gloves",
+}
+
+FACIAL_FEATURES = {
+    "glasses": "glasses", "eyeglasses": "glasses", "sunglasses": "sunglasses", "beard": "beard",
+    "bearded": "beard", "mustache": "mustache", "moustache": "mustache", "goatee": "goatee",
+    "stubble": "stubble", "clean-shaven": "clean-shaven", "clean shaven": "clean-shaven",
+}
+
+HAIR_STYLES = ["long", "short", "curly", "straight", "wavy", "bald", "braided", "ponytail", "buzzed", "shoulder-length"]
+HAIR_WORDS = ["hair", "haired"]
+HAIR_COLOR_WORDS = {"blonde": "blonde", "blond": "blonde", "brunette": "brown", "redhead": "red", "redheaded": "red"}
+
+PATTERNS = {
+    "striped": "striped", "stripes": "striped", "plaid": "plaid", "checkered": "plaid", "floral": "floral",
+    "solid": "solid", "plain": "solid", "polka dot": "polka dot", "camo": "camouflage", "camouflage": "camouflage",
+    "graphic": "graphic",
+}
+
+POSES = {"standing": "standing", "walking": "walking", "sitting": "sitting", "running": "running"}
+LOCATIONS = {"indoor": "indoor", "indoors": "indoor", "inside": "indoor", "outdoor": "outdoor", "outdoors": "outdoor", "outside": "outdoor"}
+HEIGHTS = {"tall": "tall", "short": "short"}
+BUILDS = {"thin": "thin", "slim": "thin", "skinny": "thin", "athletic": "athletic", "muscular": "athletic", "heavy": "heavy", "heavyset": "heavy", "stocky": "heavy"}
+SKIN_TONES = {"light-skinned": "light", "light skinned": "light", "dark-skinned": "dark", "dark skinned": "dark", "tan-skinned": "medium"}
+
+# Words that carry no attribute on their own
+STOPWORDS = {
+    "a", "an", "the", "in", "with", "wearing", "and", "who", "is", "was", "has", "having", "carrying",
+    "holding", "dressed", "of", "on", "at", "wears", "person", "someone", "somebody", "people", "individual",
+    "looking", "for", "find", "me", "show", "search", "any", "that", "their", "his", "her", "some", "or",
+    "seen", "last", "color", "colored", "coloured", "pair", "bottom",
+}
+
+
+class _Token(NamedTuple):
+    kind: str
+    value: Any
+    text: str
+
+
+def _build_lexicon() -> Dict[str, Tuple[str, Any]]:
+    lexicon: Dict[str, Tuple[str, Any]] = {}
+    for canonical, terms in GENDER_TERMS.items():
+        for term in terms:
+            lexicon[term] = ("gender", canonical)
+    for term, gender in GENDERED_CHILD_TERMS.items():
+        lexicon[term] = ("gendered_child", gender)
+    for canonical, terms in AGE_TERMS.items():
+        for term in terms:
+            lexicon[term] = ("age", canonical)
+    for color in COLORS:
+        lexicon[color] = ("color", color)
+    for alias, color in COLOR_ALIASES.items():
+        lexicon[alias] = ("color", color)
+    for shade in COLOR_SHADES:
+        for color in COLORS + list(COLOR_ALIASES):
+            lexicon[f"{shade} {color}"] = ("color", f"{shade} {COLOR_ALIASES.get(color, color)}")
+    for slot, garments in GARMENTS.items():
+        for term, canonical in garments.items():
+            lexicon[term] = ("garment", (slot, canonical))
+    for term, canonical in BAGS.items():
+        lexicon[term] = ("bag", canonical)
+    for term, canonical in ACCESSORIES.items():
+        lexicon[term] = ("accessory", canonical)
+    for term, canonical in FACIAL_FEATURES.items():
+        lexicon[term] = ("facial", canonical)
+    for style in HAIR_STYLES:
+        lexicon.setdefault(style, ("hair_style", style))
+    for word in HAIR_WORDS:
+        lexicon[word] = ("hair", None)
+    for term, canonical in HAIR_COLOR_WORDS.items():
+        lexicon[term] = ("hair_color", canonical)
+    for term, canonical in PATTERNS.items():
+        lexicon.setdefault(term, ("pattern", canonical))
+    for mapping, kind in ((POSES, "pose"), (LOCATIONS, "location"), (BUILDS, "build"), (SKIN_TONES, "skin_tone")):
+        for term, canonical in mapping.items():
+            lexicon[term] = (kind, canonical)
+    for term, canonical in HEIGHTS.items():
+        # "short" stays a hair style token; the parser resolves it to height by context
+        lexicon.setdefault(term, ("height", canonical))
+    return lexicon
+
+
+LEXICON = _build_lexicon()
+MAX_PHRASE_WORDS = max(len(term.split()) for term in LEXICON)
+
+
+def tokenize(query: str) -> List[_Token]:
+    """Split a query into lexicon tokens, preferring the longest matching phrase."""
+    words = re.findall(r"[a-z]+(?:-[a-z]+)*|\d+", query.lower())
+    tokens = []
+    i = 0
+    while i < len(words):
+        for length in range(min(MAX_PHRASE_WORDS, len(words) - i), 0, -1):
+            phrase = " ".join(words[i:i + length])
+            if phrase in LEXICON:
+                kind, value = LEXICON[phrase]
+                tokens.append(_Token(kind, value, phrase))
+                i += length
+                break
+        else:
+            word = words[i]
+            tokens.append(_Token("stop" if word in STOPWORDS else "unknown", None, word))
+            i += 1
+    return tokens
+
+
+def _append_value(result: Dict[str, Any], key: str, value: str):
+    existing = result.get(key)
+    if not existing:
+        result[key] = value
+    elif value not in existing.split(", "):
+        result[key] = f"{existing}, {value}"
+
+
+class LocalParse(NamedTuple):
+    attributes: Dict[str, Any]
+    confidence: float
+    unknown_terms: List[str]
+
+
+def parse_query_locally(query: str) -> LocalParse:
+    """
+    Parse common query shapes ("<age> <gender> in <color> <garment> with <accessory>")
+    into the same structured JSON that Gemini produces.
+
+    Modifiers (colors, patterns, hair styles) bind to the next noun they precede.
+    Confidence is the share of content words that were understood, reduced by
+    LOCAL_PARSER_PENALTY for each dangling or dropped modifier and conflicting value,
+    so any ambiguity sends the query to Gemini.
+    """
+    tokens = tokenize(query)
+    result: Dict[str, Any] = {}
+    unknown: List[str] = []
+    penalties = 0
+    pending_colors: List[str] = []
+    pending_patterns: List[str] = []
+    pending_hair_styles: List[str] = []
+
+    def set_value(key, value):
+        nonlocal penalties
+        if key in result and result[key] != value:
+            penalties += 1
+        result[key] = value
+
+    def take_color():
+        color = pending_colors[-1] if pending_colors else None
+        if len(pending_colors) > 1:
+            # "red and blue shirt" - keep the nearest color but we are not sure
+            nonlocal penalties
+            penalties += 1
+        pending_colors.clear()
+        return color
+
+    def drop_color():
+        # A color on something without a color attribute ("red hat") would be lost
+        nonlocal penalties
+        if take_color():
+            penalties += 1
+
+    for index, token in enumerate(tokens):
+        kind, value = token.kind, token.value
+        next_kind = tokens[index + 1].kind if index + 1 < len(tokens) else None
+
+        if kind == "color":
+            pending_colors.append(value)
+        elif kind == "pattern":
+            pending_patterns.append(value)
+        elif kind == "hair_style":
+            if value == "short" and next_kind not in ("hair", "hair_color", "color", "hair_style"):
+                # "short man" is about height, "short (blonde) hair" about hair length
+                set_value("height_estimate", "short")
+            else:
+                pending_hair_styles.append(value)
+        elif kind == "garment":
+            slot, garment = value
+            prefix = "footwear" if slot == "footwear" else f"clothing_{slot}"
+            set_value(prefix, garment)
+            color = take_color()
+            if color:
+                set_value(f"{prefix}_color", color)
+            if pending_patterns and slot != "footwear":
+                set_value(f"{prefix}_pattern", pending_patterns[-1])
+            pending_patterns.clear()
+        elif kind == "bag":
+            _append_value(result, "accessories", value)
+            set_value("bag_type", value)
+            color = take_color()
+            if color:
+                set_value("bag_color", color)
+        elif kind == "accessory":
+            _append_value(result, "accessories", value)
+            drop_color()
+        elif kind == "facial":
+            _append_value(result, "facial_features", value)
+            drop_color()
+        elif kind == "hair":
+            color = take_color()
+            if color:
+                set_value("hair_color", color)
+            if pending_hair_styles:
+                set_value("hair_style", " ".join(pending_hair_styles))
+                pending_hair_styles.clear()
+        elif kind == "hair_color":
+            set_value("hair_color", value)
+            if pending_hair_styles:
+                set_value("hair_style", " ".join(pending_hair_styles))
+                pending_hair_styles.clear()
+            # "blonde hair" - the following "hair" token has nothing left to bind
+        elif kind == "gender":
+            set_value("gender", value)
+        elif kind == "gendered_child":
+            set_value("gender", value)
+            # "teenage girl" - an explicit age term wins over the child default
+            result.setdefault("age_group", "child")
+        elif kind == "age":
+            set_value("age_group", value)
+        elif kind == "height":
+            set_value("height_estimate", value)
+        elif kind == "build":
+            set_value("build_type", value)
+        elif kind == "skin_tone":
+            set_value("skin_tone", value)
+        elif kind == "pose":
+            set_value("pose", value)
+        elif kind == "location":
+            set_value("location_context", value)
+        elif kind == "unknown":
+            unknown.append(token.text)
+
+        # A color directly before a person noun ("black man") may be ethnicity or skin tone
+        if kind in ("gender", "gendered_child", "age") and pending_colors:
+            penalties += 2
+            pending_colors.clear()
+
+    # Modifiers that never found a noun ("someone in red") are a guess at best
+    if pending_colors:
+        set_value("clothing_top_color", pending_colors[-1])
+        penalties += 1
+    if pending_patterns or pending_hair_styles:
+        penalties += 1
+
+    content = [t for t in tokens if t.kind != "stop"]
+    if not result or not content:
+        return LocalParse({}, 0.0, unknown)
+
+    understood = (len(content) - len(unknown)) / len(content)
+    confidence = max(0.0, understood - LOCAL_PARSER_PENALTY * penalties)
+    return LocalParse(result, round(confidence, 3), unknown)
+
+
+# How often each parse path was taken, for /metrics
+_parse_counts = {"local": 0, "gemini": 0}
+_parse_counts_lock = threading.Lock()
+
+
+def record_parse_source(source: str):
+    with _parse_counts_lock:
+        _parse_counts[source] = _parse_counts.get(source, 0) + 1
+
+
+def parser_stats() -> Dict[str, Any]:
+    with _parse_counts_lock:
+        counts = dict(_parse_counts)
+    total = sum(counts.values())
+    return {
+        **counts,
+        "local_rate": counts["local"] / total if total else 0.0,
+        "min_confidence": LOCAL_PARSER_MIN_CONFIDENCE
+    }
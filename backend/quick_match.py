@@ -0,0 +1,252 @@
+# quick_match.py
+
+import re
+import threading
+import logging
+from collections import deque
+from typing import Dict, Any, List, Optional, Tuple
+import numpy as np
+from dotenv import load_dotenv
+from db import load_database, get_file_version, add_listener
+from query_parser import STOPWORDS
+from ranking import top_k_indices
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Minimum score for a quick match, on the weights below
+QUICK_MATCH_MIN_SCORE = 3
+
+# Weighted terms by category: (category, weight)
+QUICK_MATCH_TERMS: Dict[str, Tuple[str, float]] = {}
+for _term in ["male", "female"]:
+    QUICK_MATCH_TERMS[_term] = ("gender", 2.0)
+for _term in ["child", "teen", "adult", "elderly", "senior"]:
+    QUICK_MATCH_TERMS[_term] = ("age group", 2.0)
+for _term in ["red", "blue", "green", "yellow", "black", "white", "orange", "purple", "pink", "brown", "gray"]:
+    QUICK_MATCH_TERMS[_term] = ("color", 1.5)
+for _term in ["shirt", "pants", "jacket", "hoodie", "dress", "skirt", "jeans", "sweater", "shoes", "shorts"]:
+    QUICK_MATCH_TERMS[_term] = ("clothing", 1.5)
+for _term in ["hair", "glasses", "beard", "mustache", "tall", "short", "backpack", "bag", "hat", "sunglasses"]:
+    QUICK_MATCH_TERMS[_term] = ("feature", 1.0)
+
+# Any other description word named in the query
+OTHER_TERM = ("attribute", 1.0)
+
+# Spellings folded together on both the query and the description side
+TERM_ALIASES = {
+    "man": "male", "men": "male", "boy": "male", "woman": "female", "women": "female", "girl": "female",
+    "kid": "child", "kids": "child", "children": "child", "teenager": "teen", "elder": "elderly",
+    "grey": "gray", "tshirt": "shirt", "shirts": "shirt", "jackets": "jacket", "hoodies": "hoodie",
+    "dresses": "dress", "skirts": "skirt", "sweaters": "sweater", "hats": "hat", "bags": "bag",
+    "backpacks": "backpack", "moustache": "mustache"
+}
+
+# Words implied by others, e.g. a boy is also a child
+TERM_IMPLIES = {"boy": ["child"], "girl": ["child"]}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase words of a query or description value, with aliases folded."""
+    terms = []
+    for word in re.findall(r"[a-z]+", text.lower()):
+        terms.append(TERM_ALIASES.get(word, word))
+        terms.extend(TERM_IMPLIES.get(word, []))
+    return terms
+
+
+def description_terms(description: Dict[str, Any]) -> set:
+    """Terms in a description's values (keys such as "hair_color" are not indexed)."""
+    terms = set()
+    for value in description.values():
+        values = value if isinstance(value, list) else [value]
+        for v in values:
+            if v is not None:
+                terms.update(tokenize(str(v)))
+    return terms
+
+
+def _contains(posting: np.ndarray, i: int) -> bool:
+    """Membership test on a sorted posting list."""
+    position = np.searchsorted(posting, i)
+    return position < len(posting) and posting[position] == i
+
+
+def _term_weight(term: str) -> Optional[Tuple[str, float]]:
+    """Category and weight of an indexed term, or None when it is never matched."""
+    if term in STOPWORDS or len(term) <= 2:
+        return None
+    return QUICK_MATCH_TERMS.get(term, OTHER_TERM)
+
+
+class QuickMatchIndex:
+    """
+    Inverted index from description terms to the people whose descriptions contain them.
+
+    Posting lists are arrays of person positions, so scoring a query is one
+    vectorized add per query term instead of a scan over every description.
+
+    The ml.json records come first, followed by live detections. add appends the new
+    person's positions to its terms' posting lists and remove marks the position
+    inactive, so ingest never rebuilds the index. Readers only look at the positions
+    that existed when they started matching.
+    """
+
+    def __init__(self, people: List[Dict[str, Any]], file_version: Any = None, live: List[Dict[str, Any]] = ()):
+        self.file_version = file_version
+        self.file_count = len(people)
+        self.people: List[Dict[str, Any]] = []
+        self.index_by_id: Dict[str, int] = {}
+        self.postings: Dict[str, List[int]] = {}
+        self.weights: Dict[str, Tuple[str, float]] = {}  # per-term category and weight, for matchable terms
+        self.active = np.zeros(0, dtype=bool)
+        self.removed = 0
+        self._arrays: Dict[str, np.ndarray] = {}  # posting lists as arrays, extended as they grow
+        for person in list(people) + list(live):
+            self.add(person)
+        logger.info(f"Built quick match index over {len(self.people)} people ({len(self.postings)} terms)")
+
+    def add(self, person: Dict[str, Any]):
+        """Index a newly ingested person. add and remove calls must not overlap."""
+        position = len(self.people)
+        if position >= len(self.active):
+            grown = np.zeros(max(16, len(self.active) * 2), dtype=bool)
+            grown[:position] = self.active[:position]
+            self.active = grown
+        self.active[position] = True
+        description = person.get("description")
+        for term in (description_terms(description) if isinstance(description, dict) else ()):
+            posting = self.postings.get(term)
+            if posting is None:
+                posting = self.postings[term] = []
+                weight = _term_weight(term)
+                if weight is not None:
+                    self.weights[term] = weight
+            posting.append(position)
+        if person.get("id"):
+            self.index_by_id[person["id"]] = position
+        # Publishes the position to readers, so it goes last
+        self.people.append(person)
+
+    def remove(self, person_id: str):
+        """Drop a person from matches; the position is reclaimed by compacted()."""
+        position = self.index_by_id.pop(person_id, None)
+        if position is None:
+            return
+        self.active[position] = False
+        self.removed += 1
+
+    def live_people(self) -> List[Dict[str, Any]]:
+        """Active people that were added after the ml.json records, oldest first."""
+        return [self.people[i] for i in range(self.file_count, len(self.people)) if self.active[i]]
+
+    def compacted(self) -> "QuickMatchIndex":
+        """New index over the active positions only."""
+        records = [self.people[i] for i in range(self.file_count) if self.active[i]]
+        return QuickMatchIndex(records, self.file_version, self.live_people())
+
+    def _posting(self, term: str, size: int) -> np.ndarray:
+        """Sorted positions below size whose description contains term."""
+        posting = self.postings[term]
+        array = self._arrays.get(term)
+        if array is None or len(array) < len(posting):
+            known = 0 if array is None else len(array)
+            extra = np.asarray(posting[known:], dtype=np.int64)
+            array = extra if array is None else np.concatenate([array, extra])
+            self._arrays[term] = array
+        return array[:np.searchsorted(array, size)]
+
+    def match(self, query: str, top_k: int = 5, min_score: float = QUICK_MATCH_MIN_SCORE) -> List[Tuple[Dict[str, Any], float, List[str]]]:
+        """
+        Score every person by the weighted query terms their description contains.
+
+        Returns:
+            Up to top_k (person, score, match reasons) scoring above min_score, best first
+        """
+        size = len(self.people)
+        query_terms = [term for term in dict.fromkeys(tokenize(query)) if term in self.weights]
+        if not query_terms or not size:
+            return []
+
+        postings = {term: self._posting(term, size) for term in query_terms}
+        scores = np.zeros(size, dtype=np.float32)
+        for term in query_terms:
+            scores[postings[term]] += self.weights[term][1]
+        scores[~self.active[:size]] = 0.0
+
+        eligible = int((scores > min_score).sum())
+        results = []
+        for i in top_k_indices(scores, min(top_k, eligible)):
+            person = self.people[i]
+            matched = [term for term in query_terms if _contains(postings[term], i)]
+            reasons = [f"Matches {self.weights[term][0]}: {term}" for term in matched]
+            results.append((person, float(scores[i]), reasons))
+        return results
+
+
+# Shared index. Live store changes are queued by the db listener and applied on the
+# next get_quick_match_index call; only a change to ml.json itself rebuilds it.
+_index: Optional[QuickMatchIndex] = None
+_index_lock = threading.Lock()
+_pending: deque = deque()  # ("add" | "evict", person) not yet applied to _index
+
+
+def _on_database_change(event: str, person: Dict[str, Any]):
+    # Folded duplicates ("update") don't change the description that was indexed
+    if event in ("add", "evict"):
+        _pending.append((event, person))
+
+
+add_listener(_on_database_change, replay=True)
+
+
+def get_quick_match_index() -> QuickMatchIndex:
+    """Return the quick match index, brought up to date with the live store and ml.json."""
+    global _index
+    file_version = get_file_version()
+    index = _index
+    if index is not None and index.file_version == file_version and not _pending:
+        return index
+    with _index_lock:
+        if _index is None or _index.file_version != file_version:
+            live = _index.live_people() if _index is not None else []
+            _index = QuickMatchIndex(load_database(include_live=False).get("people", []), file_version, live)
+        while _pending:
+            event, person = _pending.popleft()
+            if event == "add":
+                _index.add(person)
+            else:
+                _index.remove(person.get("id"))
+        # Evicted positions are only reclaimed once they make up half the index
+        if _index.removed > len(_index.people) // 2:
+            _index = _index.compacted()
+        return _index
+
+
+def find_quick_matches(query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+    """Quickly find potential matches for the query across the whole database."""
+    try:
+        # If query is very short, return empty list
+        if len(query.strip()) < 3:
+            return []
+
+        from search import get_camera_location
+        matches = []
+        for person, score, reasons in get_quick_match_index().match(query, top_k):
+            camera_id = person.get("metadata", {}).get("camera_id", "unknown")
+            matches.append({
+                "id": person.get("id", "unknown"),
+                "camera_id": camera_id,
+                "camera_location": get_camera_location(camera_id),
+                "description": person.get("description", {}),
+                "score": min(score * 10, 100),  # Convert to 0-100 scale
+                "match_reasons": reasons[:3]  # Limit to top 3 reasons
+            })
+        return matches
+    except Exception as e:
+        logger.error(f"Error finding quick matches: {str(e)}")
+        return []
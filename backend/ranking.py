@@ -0,0 +1,610 @@
+# ranking.py
+
+import os
+import re
+import itertools
+import threading
+import logging
+from collections import deque
+from typing import Dict, Any, List, Optional, Tuple, Callable
+import numpy as np
+from dotenv import load_dotenv
+from db import load_database, get_file_version, add_listener
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Hybrid ranking weights - attribute agreement vs. description embedding similarity
+SEARCH_ATTRIBUTE_WEIGHT = float(os.getenv("SEARCH_ATTRIBUTE_WEIGHT", "0.75"))
+SEARCH_EMBEDDING_WEIGHT = float(os.getenv("SEARCH_EMBEDDING_WEIGHT", "0.25"))
+
+# Define weights for different attributes - adjusted to improve matching priorities
+ATTRIBUTE_WEIGHTS = {
+    'gender': 4.0,  # Critical match - increased weight
+    'age_group': 3.0,  # Very important match - increased weight
+    'child_context': 1.5,
+    'height_estimate': 1.0,
+    'build_type': 1.0,
+    'ethnicity': 1.2,
+    'skin_tone': 1.2,
+    'hair_style': 1.5,  # Increased importance
+    'hair_color': 2.5,  # Increased importance
+    'facial_features': 3.0,  # Key identifying feature
+    'clothing_top': 2.5,  # Increased importance
+    'clothing_top_color': 3.0,  # Increased importance as often mentioned
+    'clothing_top_pattern': 1.2,
+    'clothing_bottom': 2.0,  # Increased importance
+    'clothing_bottom_color': 2.0,  # Increased importance
+    'clothing_bottom_pattern': 1.0,
+    'footwear': 1.2,
+    'footwear_color': 1.0,
+    'accessories': 1.5,  # Increased importance
+    'bag_type': 1.0,
+    'bag_color': 1.0,
+    'pose': 0.8,  # Reduced as this can change
+    'location_context': 0.8  # Reduced as this can change
+}
+
+# Define critical attributes that must match exactly when specified
+MUST_MATCH_EXACT = [
+    'facial_features',  # For glasses, beard, etc.
+    'accessories',       # For specific accessories
+    'clothing_top',      # For specific top clothing items
+    'clothing_bottom'    # For specific bottom clothing items
+]
+
+# Specific terms that require exact matching, and the attribute they live in
+CRITICAL_TERMS = {
+    'glasses': 'facial_features',
+    'beard': 'facial_features',
+    'mustache': 'facial_features',
+    'hat': 'accessories',
+    'backpack': 'accessories',
+    'hoodie': 'clothing_top',
+    'jacket': 'clothing_top',
+    'jeans': 'clothing_bottom'
+}
+
+# Expanded color variations mapping
+COLOR_VARIATIONS = {
+    'grey': ['grey', 'gray', 'silver', 'light gray', 'light grey', 'dark gray', 'dark grey', 'charcoal'],
+    'gray': ['grey', 'gray', 'silver', 'light gray', 'light grey', 'dark gray', 'dark grey', 'charcoal'],
+    'black': ['black', 'dark', 'jet black', 'midnight', 'ebony', 'onyx'],
+    'white': ['white', 'light', 'cream', 'ivory', 'off-white', 'snow', 'pale'],
+    'red': ['red', 'maroon', 'burgundy', 'crimson', 'scarlet', 'ruby', 'wine', 'cherry'],
+    'blue': ['blue', 'navy', 'light blue', 'sky blue', 'azure', 'cobalt', 'indigo', 'royal blue', 'denim'],
+    'green': ['green', 'olive', 'emerald', 'lime', 'forest green', 'mint', 'sage', 'teal'],
+    'yellow': ['yellow', 'gold', 'amber', 'mustard', 'lemon', 'honey'],
+    'brown': ['brown', 'tan', 'beige', 'khaki', 'chocolate', 'caramel', 'coffee', 'mocha', 'taupe'],
+    'orange': ['orange', 'peach', 'coral', 'rust', 'amber', 'tangerine'],
+    'purple': ['purple', 'violet', 'lavender', 'plum', 'magenta', 'lilac', 'mauve'],
+    'pink': ['pink', 'salmon', 'coral', 'rose', 'fuchsia', 'blush', 'hot pink']
+}
+
+# Expanded gender variations mapping
+GENDER_VARIATIONS = {
+    'female': ['female', 'woman', 'girl', 'lady', 'women', 'girls', 'ladies', 'feminine'],
+    'male': ['male', 'man', 'boy', 'guy', 'men', 'boys', 'guys', 'masculine'],
+    'other': ['other', 'non-binary', 'nonbinary', 'transgender', 'trans', 'neutral']
+}
+
+# Expanded age group variations mapping
+AGE_GROUP_VARIATIONS = {
+    'child': ['child', 'kid', 'children', 'kids', 'young', 'little', 'small', 'toddler', 'baby'],
+    'teen': ['teen', 'teenager', 'adolescent', 'youth', 'young adult', 'juvenile'],
+    'adult': ['adult', 'grown-up', 'grown up', 'mature', 'middle-aged', 'middle aged'],
+    'senior': ['senior', 'elderly', 'old', 'older', 'aged', 'retired', 'elder']
+}
+
+# Expanded facial hair variations mapping
+FACIAL_HAIR_VARIATIONS = {
+    'beard': ['beard', 'bearded', 'facial hair', 'facial-hair', 'full beard', 'has beard'],
+    'mustache': ['mustache', 'moustache', 'stache', 'mustachio', 'has mustache'],
+    'goatee': ['goatee', 'goatee beard', 'chin beard', 'has goatee'],
+    'stubble': ['stubble', '5 o\'clock shadow', 'facial stubble', 'light beard', 'stubbled'],
+    'clean-shaven': ['clean-shaven', 'clean shaven', 'no facial hair', 'no beard', 'cleanly shaven'],
+    'beard_length': ['short beard', 'medium beard', 'long beard', 'full beard'],
+    'beard_style': ['trimmed', 'neat', 'well-groomed', 'unkempt', 'messy'],
+    'beard_color': ['black beard', 'brown beard', 'gray beard', 'white beard', 'colored beard']
+}
+
+# Expanded clothing types mapping for better matching
+CLOTHING_TOP_VARIATIONS = {
+    'shirt': ['shirt', 'top', 'tee', 't-shirt', 'tshirt', 't shirt', 'button-up', 'button up', 'blouse'],
+    'sweater': ['sweater', 'jumper', 'pullover', 'cardigan', 'sweatshirt'],
+    'jacket': ['jacket', 'coat', 'blazer', 'windbreaker', 'outerwear', 'hoodie', 'hooded'],
+    'hoodie': ['hoodie', 'hooded sweatshirt', 'hooded jacket', 'sweatshirt with hood'],
+    'tank top': ['tank top', 'sleeveless top', 'camisole', 'vest'],
+    'dress shirt': ['dress shirt', 'button-down', 'formal shirt', 'collared shirt', 'oxford'],
+    'polo': ['polo', 'polo shirt', 'golf shirt', 'tennis shirt']
+}
+
+# Partial credit for substring and shared-word matches
+PARTIAL_MATCH_CREDIT = 0.7
+WORD_MATCH_CREDIT = 0.5
+
+
+def has_facial_hair(value: str, include_clean_shaven: bool = False) -> bool:
+    """Whether a facial_features value mentions facial hair."""
+    for feature, variations in FACIAL_HAIR_VARIATIONS.items():
+        if feature == 'clean-shaven' and not include_clean_shaven:
+            continue
+        if any(term in value for term in variations):
+            return True
+    return False
+
+
+def _expand_variations(value: str, variations_map: Dict[str, List[str]]) -> set:
+    expanded = {value}
+    for base, variations in variations_map.items():
+        # Whole words only, so "male" does not match "female"
+        if re.search(rf"\b{re.escape(base)}\b", value) or any(var == value for var in variations):
+            expanded.update(variations)
+            expanded.add(base)
+    return expanded
+
+
+def score_attribute_value(key: str, query_val: str, person_val: Optional[str]) -> Optional[Tuple[float, bool]]:
+    """
+    Score one queried attribute against one person value.
+
+    Both values are lowercased strings; person_val is None when the person has
+    no value for the attribute.
+
+    Returns:
+        None when the person is ruled out entirely (e.g. gender mismatch or a
+        required item missing), otherwise (credit in [0, 1], whether the
+        attribute counts towards the weighted total)
+    """
+    # Specific items (glasses, backpack, jeans...) must be present when asked for
+    if key in MUST_MATCH_EXACT and query_val:
+        for term, attr in CRITICAL_TERMS.items():
+            if attr == key and term in query_val and (person_val is None or term not in person_val):
+                return None
+
+    # Asking for facial hair rules out people without it, and clean-shaven rules out people with it
+    if key == 'facial_features':
+        person_has_hair = person_val is not None and has_facial_hair(person_val)
+        if has_facial_hair(query_val) and not person_has_hair:
+            return None
+        if 'clean-shaven' in query_val and person_has_hair:
+            return None
+
+    if person_val is None:
+        return 0.0, False
+
+    if key == 'gender':
+        # Strict matching - a gender mismatch rules the person out
+        if query_val == person_val:
+            return 1.0, True
+        if _expand_variations(query_val, GENDER_VARIATIONS) & _expand_variations(person_val, GENDER_VARIATIONS):
+            return 1.0, True
+        return None
+
+    if key == 'age_group':
+        if query_val == person_val:
+            return 1.0, True
+        query_ages = _expand_variations(query_val, AGE_GROUP_VARIATIONS)
+        person_ages = _expand_variations(person_val, AGE_GROUP_VARIATIONS)
+        if query_ages & person_ages:
+            return 1.0, True
+        # Strict matching for child-related queries
+        if any(term in query_val for term in ['child', 'kid', 'children', 'kids']) and person_val != 'child':
+            return None
+        if any(q in p or p in q for q in query_ages for p in person_ages):
+            return PARTIAL_MATCH_CREDIT, True
+        return 0.0, True
+
+    if key == 'clothing_top':
+        # A specific item in the query must appear in the person's top
+        for term in CLOTHING_TOP_VARIATIONS:
+            if term in query_val and term not in person_val:
+                return None
+        if query_val == person_val:
+            return 1.0, True
+        query_category = None
+        person_category = None
+        for category, variations in CLOTHING_TOP_VARIATIONS.items():
+            if category in query_val or any(var in query_val for var in variations):
+                query_category = category
+            if category in person_val or any(var in person_val for var in variations):
+                person_category = category
+        if query_category and query_category == person_category:
+            return 1.0, True
+        if query_val in person_val or person_val in query_val:
+            return PARTIAL_MATCH_CREDIT, True
+        return 0.0, True
+
+    if key in ('clothing_bottom', 'accessories'):
+        # Item requirements were enforced above; anything else earns partial credit
+        if query_val == person_val:
+            return 1.0, True
+        return PARTIAL_MATCH_CREDIT, True
+
+    # Default handling for other attributes
+    if query_val == person_val:
+        return 1.0, True
+    if query_val in person_val or person_val in query_val:
+        return PARTIAL_MATCH_CREDIT, True
+    if any(word in person_val.split() for word in query_val.split() if len(word) > 2):
+        return WORD_MATCH_CREDIT, True
+    return 0.0, True
+
+
+class AttributeMatrix:
+    """
+    Columnar, dictionary-encoded view of person descriptions.
+
+    Each attribute is stored as an int32 code per person pointing into a
+    vocabulary of distinct lowercased values (-1 when missing). Scoring a
+    query evaluates the value scorer once per distinct value and gathers the
+    result for all people with numpy, so cost is O(vocabulary) in Python and
+    O(people) in vectorized code.
+
+    Rows can be appended one at a time; columns are over-allocated and grow by
+    doubling, and a row only counts towards size once all its codes are written,
+    so a concurrent reader never sees a half-written row.
+    """
+
+    def __init__(self, descriptions: List[Dict[str, Any]]):
+        self.size = len(descriptions)
+        self.codes: Dict[str, np.ndarray] = {}
+        self.vocab: Dict[str, List[str]] = {}
+        self._capacity = self.size
+
+        lookups: Dict[str, Dict[str, int]] = {}
+        columns: Dict[str, List[int]] = {}
+        for row, description in enumerate(descriptions):
+            for key, value in description.items():
+                if value is None or value == "":
+                    continue
+                lookup = lookups.get(key)
+                if lookup is None:
+                    lookup = lookups[key] = {}
+                    columns[key] = [-1] * self.size
+                    self.vocab[key] = []
+                text = str(value).lower()
+                code = lookup.get(text)
+                if code is None:
+                    code = lookup[text] = len(self.vocab[key])
+                    self.vocab[key].append(text)
+                columns[key][row] = code
+
+        for key, column in columns.items():
+            self.codes[key] = np.asarray(column, dtype=np.int32)
+        self._lookups = lookups
+
+    def append(self, description: Dict[str, Any]) -> int:
+        """Add a person as the next row and return its position. Calls must not overlap."""
+        row = self.size
+        if row >= self._capacity:
+            self._capacity = max(16, self._capacity * 2)
+            for key, codes in list(self.codes.items()):
+                grown = np.full(self._capacity, -1, dtype=np.int32)
+                grown[:row] = codes[:row]
+                self.codes[key] = grown
+        for key, value in description.items():
+            if value is None or value == "":
+                continue
+            lookup = self._lookups.get(key)
+            if lookup is None:
+                # Codes before vocab, so a reader that finds the vocabulary also finds the column
+                self.codes[key] = np.full(self._capacity, -1, dtype=np.int32)
+                self.vocab[key] = []
+                lookup = self._lookups[key] = {}
+            text = str(value).lower()
+            code = lookup.get(text)
+            if code is None:
+                code = lookup[text] = len(self.vocab[key])
+                self.vocab[key].append(text)
+            self.codes[key][row] = code
+        self.size = row + 1
+        return row
+
+    def _column(self, key: str, rows: Optional[np.ndarray], size: int) -> Optional[np.ndarray]:
+        codes = self.codes.get(key)
+        if codes is None:
+            return None
+        return codes[:size] if rows is None else codes[rows]
+
+    def score(self, query_json: Dict[str, Any], weights: Dict[str, float] = ATTRIBUTE_WEIGHTS,
+              value_scorer: Callable[[str, str, Optional[str]], Optional[Tuple[float, bool]]] = score_attribute_value,
+              required_terms: Optional[Dict[str, str]] = None,
+              rows: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Score every person against a structured query.
+
+        Args:
+            query_json: Structured query attributes
+            weights: Per-attribute weights (1.0 for unlisted attributes)
+            value_scorer: Function scoring (attribute, query value, person value)
+            required_terms: {term: attribute} that must appear verbatim in the person's value
+            rows: Only score these people (positions), e.g. one chunk of a sweep
+
+        Returns:
+            Tuple of (scores in [0, 1], eligibility mask), aligned with rows when given
+        """
+        size = self.size if rows is None else len(rows)
+        matched = np.zeros(size, dtype=np.float64)
+        total = np.zeros(size, dtype=np.float64)
+        eligible = np.ones(size, dtype=bool)
+
+        for key, raw_value in query_json.items():
+            if raw_value is None or raw_value == "":
+                continue
+            query_val = str(raw_value).lower()
+            weight = weights.get(key, 1.0)
+            # Copied, since rows appended meanwhile may grow the vocabulary
+            vocab = list(self.vocab.get(key, []))
+
+            # One slot per distinct value plus a trailing slot for "missing"
+            credit = np.zeros(len(vocab) + 1, dtype=np.float64)
+            counted = np.zeros(len(vocab) + 1, dtype=bool)
+            allowed = np.ones(len(vocab) + 1, dtype=bool)
+            for index, person_val in enumerate(vocab + [None]):
+                result = value_scorer(key, query_val, person_val)
+                if result is None:
+                    allowed[index] = False
+                else:
+                    credit[index], counted[index] = result
+
+            codes = self._column(key, rows, size)
+            if codes is None:
+                codes = np.full(size, -1, dtype=np.int32)
+            slots = np.where(codes < 0, len(vocab), codes)
+            eligible &= allowed[slots]
+            matched += weight * credit[slots]
+            total += weight * counted[slots]
+
+        for term, key in (required_terms or {}).items():
+            vocab = list(self.vocab.get(key, []))
+            present = np.array([term in value for value in vocab] + [False], dtype=bool)
+            codes = self._column(key, rows, size)
+            if codes is None:
+                eligible[:] = False
+                continue
+            eligible &= present[np.where(codes < 0, len(vocab), codes)]
+
+        scores = np.divide(matched, total, out=np.zeros_like(matched), where=total > 0)
+        return scores, eligible
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first, without sorting the whole array."""
+    if k <= 0 or scores.size == 0:
+        return np.empty(0, dtype=np.int64)
+    if k < scores.size:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(scores.size)
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def _grown(array: np.ndarray, capacity: int, used: int) -> np.ndarray:
+    """Copy of the first used rows of array in a zeroed array of the given capacity."""
+    grown = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+    grown[:used] = array[:used]
+    return grown
+
+
+_epochs = itertools.count()
+
+
+class HybridRanker:
+    """
+    Ranks people by fusing attribute agreement with embedding cosine similarity.
+
+    Scores are calibrated rather than rescaled: the attribute score is the
+    weighted fraction of queried attributes that match, the embedding score
+    is the cosine similarity clipped to [0, 1], and the final score is their
+    weighted average. People without an embedding are scored on attributes alone.
+
+    The ml.json records come first, followed by live detections: add appends a row
+    and remove marks one inactive, so ingest never forces a rebuild. Readers only
+    look at the rows that existed when they started scoring.
+    """
+
+    def __init__(self, people: List[Dict[str, Any]], file_version: Any = None, live: List[Dict[str, Any]] = ()):
+        self.file_version = file_version
+        self.epoch = next(_epochs)
+        records = [p for p in people if isinstance(p.get("description"), dict)]
+        self.file_count = len(records)
+        self.people = records + [p for p in live if isinstance(p.get("description"), dict)]
+        self.index_by_id = {p.get("id"): i for i, p in enumerate(self.people) if p.get("id")}
+        self.attributes = AttributeMatrix([p["description"] for p in self.people])
+        self.active = np.ones(len(self.people), dtype=bool)
+        self.removed = 0
+
+        # Unit-normalized embedding matrix; rows without an embedding stay zero
+        self.has_embedding = np.zeros(len(self.people), dtype=bool)
+        self.embeddings = None
+        dims = {len(p["embedding"]) for p in self.people if p.get("embedding")}
+        self._mixed_dimensions = len(dims) > 1
+        if len(dims) == 1:
+            dim = dims.pop()
+            self.embeddings = np.zeros((len(self.people), dim), dtype=np.float32)
+            for i, person in enumerate(self.people):
+                if person.get("embedding"):
+                    self.embeddings[i] = person["embedding"]
+                    self.has_embedding[i] = True
+            norms = np.linalg.norm(self.embeddings, axis=1, keepdims=True)
+            np.divide(self.embeddings, norms, out=self.embeddings, where=norms > 0)
+        elif self._mixed_dimensions:
+            logger.warning(f"Stored embeddings have mixed dimensions {sorted(dims)}, ignoring embeddings for ranking")
+
+        logger.info(f"Built ranker over {len(self.people)} people ({int(self.has_embedding.sum())} with embeddings)")
+
+    @property
+    def size(self) -> int:
+        """Rows appended so far, including removed ones."""
+        return self.attributes.size
+
+    @property
+    def count(self) -> int:
+        """People currently searchable."""
+        return self.size - self.removed
+
+    @property
+    def version(self) -> str:
+        """Changes whenever a row is added or removed, or the ranker is rebuilt."""
+        return f"{self.file_version}:{self.epoch}:{self.size}:{self.removed}"
+
+    @property
+    def supports_embeddings(self) -> bool:
+        return self.embeddings is not None
+
+    def add(self, person: Dict[str, Any]):
+        """Append a newly ingested person. add and remove calls must not overlap."""
+        if not isinstance(person.get("description"), dict):
+            return
+        row = self.size
+        if row >= len(self.active):
+            capacity = max(16, len(self.active) * 2)
+            self.active = _grown(self.active, capacity, row)
+            self.has_embedding = _grown(self.has_embedding, capacity, row)
+            if self.embeddings is not None:
+                self.embeddings = _grown(self.embeddings, capacity, row)
+        self.active[row] = True
+
+        if person.get("embedding"):
+            vector = np.asarray(person["embedding"], dtype=np.float32)
+            if self.embeddings is None and not self._mixed_dimensions:
+                self.embeddings = np.zeros((len(self.active), vector.shape[0]), dtype=np.float32)
+            if self.embeddings is not None and vector.shape[0] == self.embeddings.shape[1]:
+                norm = np.linalg.norm(vector)
+                self.embeddings[row] = vector / norm if norm > 0 else vector
+                self.has_embedding[row] = True
+
+        self.people.append(person)
+        if person.get("id"):
+            self.index_by_id[person["id"]] = row
+        # Publishes the row to readers, so it goes last
+        self.attributes.append(person["description"])
+
+    def remove(self, person_id: str):
+        """Drop a person from search results; the row is reclaimed by compacted()."""
+        row = self.index_by_id.pop(person_id, None)
+        if row is None:
+            return
+        self.active[row] = False
+        self.has_embedding[row] = False
+        self.removed += 1
+
+    def live_people(self) -> List[Dict[str, Any]]:
+        """Active people that were added after the ml.json records, oldest first."""
+        return [self.people[i] for i in range(self.file_count, self.size) if self.active[i]]
+
+    def newest(self, limit: int) -> List[Dict[str, Any]]:
+        """Up to limit active people, most recently added first."""
+        people = []
+        for i in range(self.size - 1, -1, -1):
+            if len(people) >= limit:
+                break
+            if self.active[i]:
+                people.append(self.people[i])
+        return people
+
+    def compacted(self) -> "HybridRanker":
+        """New ranker over the active rows only."""
+        records = [self.people[i] for i in range(self.file_count) if self.active[i]]
+        return HybridRanker(records, self.file_version, self.live_people())
+
+    def embedding_similarity(self, query_embedding: List[float]) -> np.ndarray:
+        """Cosine similarity of every row to the query embedding (0 where missing)."""
+        size = self.size
+        embeddings = self.embeddings
+        if embeddings is None:
+            return np.zeros(size, dtype=np.float32)
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if query.shape[0] != embeddings.shape[1] or norm == 0:
+            return np.zeros(size, dtype=np.float32)
+        return embeddings[:size] @ (query / norm)
+
+    def score(self, query_json: Dict[str, Any], query_embedding: Optional[List[float]] = None,
+              required_terms: Optional[Dict[str, str]] = None,
+              attribute_weight: float = SEARCH_ATTRIBUTE_WEIGHT,
+              embedding_weight: float = SEARCH_EMBEDDING_WEIGHT) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Score every row against a query.
+
+        Returns:
+            Tuple of (fused scores in [0, 1], attribute scores in [0, 1]);
+            people that are ruled out or removed score -inf
+        """
+        size = self.size
+        attribute_scores, eligible = self.attributes.score(query_json, required_terms=required_terms)
+        attribute_scores = attribute_scores[:size]
+        eligible = eligible[:size] & self.active[:size]
+        scores = attribute_scores.copy()
+
+        if query_embedding is not None and self.embeddings is not None and embedding_weight > 0:
+            cosine = np.clip(self.embedding_similarity(query_embedding)[:size], 0.0, 1.0)
+            fused = (attribute_weight * attribute_scores + embedding_weight * cosine) / (attribute_weight + embedding_weight)
+            scores = np.where(self.has_embedding[:size], fused, attribute_scores)
+
+        # Mirror the attribute-only behaviour: a person with no matching attribute is not a match
+        scores = np.where(eligible & (attribute_scores > 0), scores, -np.inf)
+        return scores, attribute_scores
+
+    def rank(self, query_json: Dict[str, Any], top_k: int, **kwargs) -> List[Tuple[Dict[str, Any], float, float]]:
+        """
+        Return the top_k people as (person, fused score, attribute score), best first.
+        """
+        scores, attribute_scores = self.score(query_json, **kwargs)
+        eligible_count = int(np.isfinite(scores).sum())
+        indices = top_k_indices(scores, min(top_k, eligible_count))
+        return [(self.people[i], float(scores[i]), float(attribute_scores[i])) for i in indices]
+
+    def rank_by_embedding(self, query_embedding: List[float], top_k: int) -> List[Tuple[Dict[str, Any], float]]:
+        """Return the top_k people by embedding cosine similarity alone."""
+        if self.embeddings is None:
+            return []
+        size = self.size
+        has_embedding = self.has_embedding[:size]
+        similarity = np.where(has_embedding, self.embedding_similarity(query_embedding)[:size], -np.inf)
+        indices = top_k_indices(similarity, min(top_k, int(has_embedding.sum())))
+        return [(self.people[i], float(similarity[i])) for i in indices]
+
+
+# Shared ranker. Live store changes are queued by the db listener and applied on the
+# next get_ranker call; only a change to ml.json itself rebuilds it from scratch.
+_ranker: Optional[HybridRanker] = None
+_ranker_lock = threading.Lock()
+_pending: deque = deque()  # ("add" | "evict", person) not yet applied to _ranker
+
+
+def _on_database_change(event: str, person: Dict[str, Any]):
+    # Folded duplicates ("update") only change metadata of a record the ranker already holds
+    if event in ("add", "evict"):
+        _pending.append((event, person))
+
+
+add_listener(_on_database_change, replay=True)
+
+
+def get_ranker() -> HybridRanker:
+    """Return the ranker, brought up to date with the live store and ml.json."""
+    global _ranker
+    file_version = get_file_version()
+    ranker = _ranker
+    if ranker is not None and ranker.file_version == file_version and not _pending:
+        return ranker
+    with _ranker_lock:
+        if _ranker is None or _ranker.file_version != file_version:
+            live = _ranker.live_people() if _ranker is not None else []
+            _ranker = HybridRanker(load_database(include_live=False).get("people", []), file_version, live)
+        while _pending:
+            event, person = _pending.popleft()
+            if event == "add":
+                _ranker.add(person)
+            else:
+                _ranker.remove(person.get("id"))
+        # Evicted rows are only reclaimed once they make up half the ranker
+        if _ranker.removed > _ranker.size // 2:
+            _ranker = _ranker.compacted()
+        return _ranker
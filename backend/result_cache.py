@@ -0,0 +1,106 @@
+# result_cache.py
+
+import os
+import json
+import threading
+import logging
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+from dotenv import load_dotenv
+from db import get_database_version
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Search result cache configuration
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "true").lower() == "true"
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "256"))
+
+
+def make_result_key(structured_query: Dict[str, Any], query: str, **options) -> str:
+    """
+    Cache key for a search: the structured query (or the normalized text when it
+    could not be parsed) plus every option that changes the response.
+    """
+    return json.dumps({
+        "query": structured_query or query,
+        "options": options
+    }, sort_keys=True)
+
+
+class SearchResultCache:
+    """
+    Size-bounded LRU of complete search responses.
+
+    Entries belong to one database version. As soon as a lookup or store sees a
+    newer version - new detections landed or ml.json changed - every entry is
+    dropped, so cached results never lag the data. Cached responses are shared
+    between callers and must not be modified.
+    """
+
+    def __init__(self, max_entries: int = RESULT_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._version: Optional[str] = None
+        self._lock = threading.Lock()
+        self._metrics = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "invalidations": 0}
+
+    def _check_version(self, version: str):
+        """Drop every entry when the database version changes. Must be called with the lock held."""
+        if version == self._version:
+            return
+        if self._entries:
+            self._metrics["invalidations"] += 1
+            logger.info(f"Database version changed, dropping {len(self._entries)} cached search results")
+        self._entries.clear()
+        self._version = version
+
+    def get(self, key: str, version: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._check_version(version)
+            value = self._entries.get(key)
+            if value is None:
+                self._metrics["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._metrics["hits"] += 1
+            return value
+
+    def put(self, key: str, version: str, value: Dict[str, Any]):
+        """Store a response computed against `version`; ignored if the data has moved on since."""
+        if version != get_database_version():
+            logger.info("Search finished after the database changed, not caching its result")
+            return
+        with self._lock:
+            self._check_version(version)
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            self._metrics["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._metrics["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = dict(self._metrics)
+            lookups = metrics["hits"] + metrics["misses"]
+            metrics.update({
+                "enabled": RESULT_CACHE_ENABLED,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "version": self._version,
+                "hit_rate": metrics["hits"] / lookups if lookups else 0.0
+            })
+            return metrics
+
+
+# Shared cache used by the /search endpoint
+result_cache = SearchResultCache()
@@ -2,12 +2,19 @@
 
 import json
 import google.generativeai as genai
-from db import load_database
+from db import load_person_image, get_person
+from images import crop_url
+from query_cache import query_cache, normalize_query, UncachedResult
+from llm import run_calls, submit, LLM_CALL_TIMEOUT_SECONDS
+from pagination import cursor_store, PAGINATION_MAX_RESULTS
+from query_parser import parse_query_locally, record_parse_source, LOCAL_PARSER_MIN_CONFIDENCE
+from ranking import get_ranker, SEARCH_ATTRIBUTE_WEIGHT, SEARCH_EMBEDDING_WEIGHT
 import os
+import time
 from dotenv import load_dotenv
 import base64
 from PIL import Image
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Tuple
 import logging
 
 # Configure logging
@@ -22,6 +29,13 @@ GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 genai.configure(api_key=GEMINI_API_KEY)
 model = genai.GenerativeModel("gemini-2.0-flash-lite")
 
+# Direct search: local candidate retrieval, then parallel chunked Gemini re-ranking
+DIRECT_SEARCH_CANDIDATES = int(os.getenv("DIRECT_SEARCH_CANDIDATES", "150"))
+DIRECT_SEARCH_CHUNK_SIZE = int(os.getenv("DIRECT_SEARCH_CHUNK_SIZE", "50"))
+DIRECT_SEARCH_TOKEN_BUDGET = int(os.getenv("DIRECT_SEARCH_TOKEN_BUDGET", "12000"))
+DIRECT_SEARCH_LATENCY_BUDGET = float(os.getenv("DIRECT_SEARCH_LATENCY_BUDGET", "15"))
+DIRECT_SEARCH_MAX_OUTPUT_TOKENS = int(os.getenv("DIRECT_SEARCH_MAX_OUTPUT_TOKENS", "2048"))
+
 # Prompt for Gemini
 QUERY_PROMPT_TEMPLATE = """
 You are helping an AI vision system identify people.
@@ -56,7 +70,35 @@ Respond with ONLY a valid JSON object.
 """
 
 def query_to_structured_json(query: str) -> Dict[str, Any]:
-    """Convert natural language query to structured JSON."""
+    """
+    Convert natural language query to structured JSON.
+    Parses are cached on the normalized query, and concurrent identical
+    queries share a single Gemini call.
+    """
+    key = normalize_query(query)
+    if not key:
+        return {}
+    try:
+        return query_cache.get_or_compute(key, lambda: _parse_query(key))
+    except Exception as e:
+        logger.error(f"Error in query_to_structured_json: {e}")
+        return {}
+
+def _parse_query(query: str) -> Dict[str, Any]:
+    """Parse locally when the query has a familiar shape, otherwise fall back to Gemini."""
+    local = parse_query_locally(query)
+    if local.confidence >= LOCAL_PARSER_MIN_CONFIDENCE:
+        record_parse_source("local")
+        logger.info(f"Parsed query locally (confidence {local.confidence}): {local.attributes}")
+        return local.attributes
+    
+    logger.info(f"Local parse confidence {local.confidence} below {LOCAL_PARSER_MIN_CONFIDENCE} "
+                f"(unknown terms: {local.unknown_terms}), using Gemini")
+    record_parse_source("gemini")
+    return _parse_query_with_gemini(query)
+
+def _parse_query_with_gemini(query: str) -> Dict[str, Any]:
+    """Ask Gemini to convert a natural language query to structured JSON."""
     try:
         original_query = query
         query = query.lower()
@@ -162,478 +204,21 @@ Return ONLY the JSON object with no other text.
             logger.error(f"Error parsing JSON response: {e}")
             logger.error(f"Response text: {response_text}")
             
-            # Fallback: If JSON parsing fails, attempt to extract key information directly
-            fallback_result = {}
+            # Fallback: If JSON parsing fails, use whatever the local parser understood. It
+            # already failed the confidence check, so it is not cached and the next search retries Gemini
+            fallback_result = UncachedResult(parse_query_locally(original_query).attributes)
             
             # Add detected gender if available
             if detected_gender:
                 fallback_result['gender'] = detected_gender
             
-            # Extract any clothing colors mentioned
-            for color in colors:
-                if color in original_query:
-                    if any(top in original_query for top in clothing_types['top']):
-                        fallback_result['clothing_top_color'] = color
-                    elif any(bottom in original_query for bottom in clothing_types['bottom']):
-                        fallback_result['clothing_bottom_color'] = color
-                    else:
-                        fallback_result['clothing_top_color'] = color
-            
-            # Extract any clothing types mentioned
-            for category, types in clothing_types.items():
-                for clothing_type in types:
-                    if clothing_type in original_query:
-                        if category == 'top':
-                            fallback_result['clothing_top'] = clothing_type
-                        elif category == 'bottom':
-                            fallback_result['clothing_bottom'] = clothing_type
-                        elif category == 'footwear':
-                            fallback_result['footwear'] = clothing_type
-            
             logger.info(f"Using fallback JSON result: {fallback_result}")
             return fallback_result
     except Exception as e:
-        logger.error(f"Error in query_to_structured_json: {e}")
+        logger.error(f"Error parsing query with Gemini: {e}")
         return {}
 
-def calculate_similarity(query_json: Dict[str, Any], person_json: Dict[str, Any]) -> float:
-    """Calculate similarity between query and person description."""
-    try:
-        # Define weights for different attributes - adjusted to improve matching priorities
-        weights = {
-            'gender': 4.0,  # Critical match - increased weight
-            'age_group': 3.0,  # Very important match - increased weight
-            'child_context': 1.5,
-            'height_estimate': 1.0,
-            'build_type': 1.0,
-            'ethnicity': 1.2,
-            'skin_tone': 1.2,
-            'hair_style': 1.5,  # Increased importance
-            'hair_color': 2.5,  # Increased importance
-            'facial_features': 3.0,  # Key identifying feature
-            'clothing_top': 2.5,  # Increased importance
-            'clothing_top_color': 3.0,  # Increased importance as often mentioned
-            'clothing_top_pattern': 1.2,
-            'clothing_bottom': 2.0,  # Increased importance
-            'clothing_bottom_color': 2.0,  # Increased importance
-            'clothing_bottom_pattern': 1.0,
-            'footwear': 1.2,
-            'footwear_color': 1.0,
-            'accessories': 1.5,  # Increased importance
-            'bag_type': 1.0,
-            'bag_color': 1.0,
-            'pose': 0.8,  # Reduced as this can change
-            'location_context': 0.8  # Reduced as this can change
-        }
-        
-        # Define critical attributes that must match exactly when specified
-        must_match_exact = [
-            'facial_features',  # For glasses, beard, etc.
-            'accessories',       # For specific accessories
-            'clothing_top',      # For specific top clothing items
-            'clothing_bottom'    # For specific bottom clothing items
-        ]
-        
-        # Expanded color variations mapping
-        color_variations = {
-            'grey': ['grey', 'gray', 'silver', 'light gray', 'light grey', 'dark gray', 'dark grey', 'charcoal'],
-            'gray': ['grey', 'gray', 'silver', 'light gray', 'light grey', 'dark gray', 'dark grey', 'charcoal'],
-            'black': ['black', 'dark', 'jet black', 'midnight', 'ebony', 'onyx'],
-            'white': ['white', 'light', 'cream', 'ivory', 'off-white', 'snow', 'pale'],
-            'red': ['red', 'maroon', 'burgundy', 'crimson', 'scarlet', 'ruby', 'wine', 'cherry'],
-            'blue': ['blue', 'navy', 'light blue', 'sky blue', 'azure', 'cobalt', 'indigo', 'royal blue', 'denim'],
-            'green': ['green', 'olive', 'emerald', 'lime', 'forest green', 'mint', 'sage', 'teal'],
-            'yellow': ['yellow', 'gold', 'amber', 'mustard', 'lemon', 'honey'],
-            'brown': ['brown', 'tan', 'beige', 'khaki', 'chocolate', 'caramel', 'coffee', 'mocha', 'taupe'],
-            'orange': ['orange', 'peach', 'coral', 'rust', 'amber', 'tangerine'],
-            'purple': ['purple', 'violet', 'lavender', 'plum', 'magenta', 'lilac', 'mauve'],
-            'pink': ['pink', 'salmon', 'coral', 'rose', 'fuchsia', 'blush', 'hot pink']
-        }
-        
-        # Expanded gender variations mapping
-        gender_variations = {
-            'female': ['female', 'woman', 'girl', 'lady', 'women', 'girls', 'ladies', 'feminine'],
-            'male': ['male', 'man', 'boy', 'guy', 'men', 'boys', 'guys', 'masculine'],
-            'other': ['other', 'non-binary', 'nonbinary', 'transgender', 'trans', 'neutral']
-        }
-        
-        # Expanded age group variations mapping
-        age_group_variations = {
-            'child': ['child', 'kid', 'children', 'kids', 'young', 'little', 'small', 'toddler', 'baby'],
-            'teen': ['teen', 'teenager', 'adolescent', 'youth', 'young adult', 'juvenile'],
-            'adult': ['adult', 'grown-up', 'grown up', 'mature', 'middle-aged', 'middle aged'],
-            'senior': ['senior', 'elderly', 'old', 'older', 'aged', 'retired', 'elder']
-        }
-        
-        # Check for specific critical terms that require exact matching
-        critical_terms = {
-            'glasses': 'facial_features',
-            'beard': 'facial_features',
-            'mustache': 'facial_features',
-            'hat': 'accessories',
-            'backpack': 'accessories',
-            'hoodie': 'clothing_top',
-            'jacket': 'clothing_top',
-            'jeans': 'clothing_bottom'
-        }
-        
-        # Check if any critical terms are present in the query
-        strict_match_terms = {}
-        for key in query_json:
-            if key in must_match_exact and query_json[key]:
-                query_val = str(query_json[key]).lower()
-                
-                # Extract specific terms that need exact matching
-                for term, attr in critical_terms.items():
-                    if term in query_val and attr == key:
-                        strict_match_terms[term] = attr
-                        logger.info(f"Found critical term '{term}' in {attr}. Will require exact match.")
-
-        # First check strict match conditions
-        for term, attr in strict_match_terms.items():
-            # If the person doesn't have this attribute or it doesn't contain the term, return 0
-            if attr not in person_json or term not in str(person_json[attr]).lower():
-                logger.info(f"Critical term '{term}' not found in person's {attr}, returning 0 similarity")
-                return 0
-                
-        # Child context variations mapping
-        child_context_variations = {
-            'with_parent': ['with parent', 'with parents', 'with mother', 'with father', 'with guardian', 'with family'],
-            'with_guardian': ['with guardian', 'with caregiver', 'with adult', 'with supervisor'],
-            'alone': ['alone', 'by themselves', 'independent', 'unaccompanied'],
-            'playing': ['playing', 'engaged in play', 'playing with toys', 'playing with others'],
-            'learning': ['learning', 'studying', 'reading', 'in class', 'at school'],
-            'with_peers': ['with peers', 'with friends', 'with other children', 'in group']
-        }
-        
-        # Expanded facial hair variations mapping
-        facial_hair_variations = {
-            'beard': ['beard', 'bearded', 'facial hair', 'facial-hair', 'full beard', 'has beard'],
-            'mustache': ['mustache', 'moustache', 'stache', 'mustachio', 'has mustache'],
-            'goatee': ['goatee', 'goatee beard', 'chin beard', 'has goatee'],
-            'stubble': ['stubble', '5 o\'clock shadow', 'facial stubble', 'light beard', 'stubbled'],
-            'clean-shaven': ['clean-shaven', 'clean shaven', 'no facial hair', 'no beard', 'cleanly shaven'],
-            'beard_length': ['short beard', 'medium beard', 'long beard', 'full beard'],
-            'beard_style': ['trimmed', 'neat', 'well-groomed', 'unkempt', 'messy'],
-            'beard_color': ['black beard', 'brown beard', 'gray beard', 'white beard', 'colored beard']
-        }
-        
-        # Expanded clothing types mapping for better matching
-        clothing_top_variations = {
-            'shirt': ['shirt', 'top', 'tee', 't-shirt', 'tshirt', 't shirt', 'button-up', 'button up', 'blouse'],
-            'sweater': ['sweater', 'jumper', 'pullover', 'cardigan', 'sweatshirt'],
-            'jacket': ['jacket', 'coat', 'blazer', 'windbreaker', 'outerwear', 'hoodie', 'hooded'],
-            'hoodie': ['hoodie', 'hooded sweatshirt', 'hooded jacket', 'sweatshirt with hood'],
-            'tank top': ['tank top', 'sleeveless top', 'camisole', 'vest'],
-            'dress shirt': ['dress shirt', 'button-down', 'formal shirt', 'collared shirt', 'oxford'],
-            'polo': ['polo', 'polo shirt', 'golf shirt', 'tennis shirt']
-        }
-        
-        clothing_bottom_variations = {
-            'jeans': ['jeans', 'denim', 'blue jeans', 'denim pants', 'denim trousers'],
-            'pants': ['pants', 'trousers', 'slacks', 'khakis', 'chinos', 'bottoms'],
-            'shorts': ['shorts', 'short pants', 'bermudas', 'short trousers'],
-            'skirt': ['skirt', 'midi skirt', 'mini skirt', 'maxi skirt'],
-            'leggings': ['leggings', 'tights', 'yoga pants', 'stretch pants'],
-            'joggers': ['joggers', 'sweatpants', 'track pants', 'athletic pants']
-        }
-        
-        # Pattern variations for better matching
-        pattern_variations = {
-            'solid': ['solid', 'plain', 'single color', 'no pattern', 'flat', 'uniform'],
-            'striped': ['striped', 'stripes', 'lined', 'pinstriped', 'vertical stripes', 'horizontal stripes'],
-            'plaid': ['plaid', 'checkered', 'checked', 'tartan', 'gingham'],
-            'floral': ['floral', 'flowery', 'flower pattern', 'botanical'],
-            'polka dot': ['polka dot', 'dotted', 'dots', 'spotted'],
-            'graphic': ['graphic', 'printed', 'design', 'logo', 'text', 'image', 'picture']
-        }
-        
-        weighted_matches = 0
-        weighted_total = 0
-        
-        # Debug tracking for more detailed logs
-        match_details = []
-        
-        # Check if the query contains child-related terms
-        query_contains_child_terms = False
-        if 'age_group' in query_json:
-            query_age = str(query_json['age_group']).lower()
-            if any(term in query_age for term in ['child', 'kid', 'children', 'kids']):
-                query_contains_child_terms = True
-        
-        # Check if the person is a child
-        person_is_child = False
-        if 'age_group' in person_json:
-            person_age = str(person_json['age_group']).lower()
-            if person_age == 'child':
-                person_is_child = True
-        
-        # Check if the query contains facial hair terms
-        query_contains_facial_hair = False
-        if 'facial_features' in query_json:
-            query_features = str(query_json['facial_features']).lower()
-            for feature, variations in facial_hair_variations.items():
-                if any(term in query_features for term in variations):
-                    query_contains_facial_hair = True
-                    break
-        
-        # Check if the person has facial hair
-        person_has_facial_hair = False
-        if 'facial_features' in person_json:
-            person_features = str(person_json['facial_features']).lower()
-            for feature, variations in facial_hair_variations.items():
-                if feature != 'clean-shaven' and any(term in person_features for term in variations):
-                    person_has_facial_hair = True
-                    break
-        
-        # If query contains facial hair terms but person doesn't have facial hair, return 0
-        if query_contains_facial_hair and not person_has_facial_hair:
-            logger.info(f"Query contains facial hair terms but person doesn't have facial hair")
-            return 0
-        
-        # If query specifically contains "clean-shaven" but person has facial hair, return 0
-        if 'facial_features' in query_json and 'clean-shaven' in str(query_json['facial_features']).lower() and person_has_facial_hair:
-            logger.info(f"Query specifies clean-shaven but person has facial hair")
-            return 0
-        
-        # Process each attribute in the query
-        for key in query_json:
-            if key in person_json:
-                weight = weights.get(key, 1.0)
-                weighted_total += weight
-                
-                # Get the values to compare
-                query_val = str(query_json[key]).lower()
-                person_val = str(person_json[key]).lower()
-                
-                # For attributes in must_match_exact, check if specific critical terms are included
-                if key in must_match_exact:
-                    # Extract all terms from the query value
-                    query_terms = set()
-                    for term in query_val.split(','):
-                        query_terms.update(term.strip().split())
-                    
-                    # Check for critical terms in the query value
-                    critical_found = False
-                    for term in critical_terms:
-                        if term in query_terms and critical_terms[term] == key:
-                            critical_found = True
-                            # If the term is not in the person's value, this is a strict mismatch
-                            if term not in person_val:
-                                logger.info(f"Critical term '{term}' from {key} not found in person's attributes")
-                                return 0
-                
-                # Special handling for gender - strict matching
-                if key == 'gender':
-                    # Check for exact match first
-                    if query_val == person_val:
-                        weighted_matches += weight
-                        match_details.append(f"Exact match on gender: {query_val} = {person_val}, +{weight}")
-                    else:
-                        # Check for variations
-                        query_genders = set([query_val])
-                        person_genders = set([person_val])
-                        
-                        # Add variations
-                        for base_gender, variations in gender_variations.items():
-                            if base_gender in query_val or any(var == query_val for var in variations):
-                                query_genders.update(variations)
-                                query_genders.add(base_gender)
-                            if base_gender in person_val or any(var == person_val for var in variations):
-                                person_genders.update(variations)
-                                person_genders.add(base_gender)
-                        
-                        # Check for matches including variations
-                        if query_genders & person_genders:  # If there's any intersection
-                            weighted_matches += weight
-                            match_details.append(f"Match on gender with variations: {query_genders} ~ {person_genders}, +{weight}")
-                        else:
-                            match_details.append(f"No match on gender: {query_val} != {person_val}, +0")
-                            # Return 0 similarity if gender doesn't match (strict matching)
-                            return 0
-                
-                # Special handling for age_group - strict matching for child-related queries
-                elif key == 'age_group':
-                    # Check for exact match first
-                    if query_val == person_val:
-                        weighted_matches += weight
-                        match_details.append(f"Exact match on age_group: {query_val} = {person_val}, +{weight}")
-                    else:
-                        # Check for variations
-                        query_ages = set([query_val])
-                        person_ages = set([person_val])
-                        
-                        # Add variations
-                        for base_age, variations in age_group_variations.items():
-                            if base_age in query_val or any(var == query_val for var in variations):
-                                query_ages.update(variations)
-                                query_ages.add(base_age)
-                            if base_age in person_val or any(var == person_val for var in variations):
-                                person_ages.update(variations)
-                                person_ages.add(base_age)
-                        
-                        # Check for matches including variations
-                        if query_ages & person_ages:  # If there's any intersection
-                            weighted_matches += weight
-                            match_details.append(f"Match on age_group with variations: {query_ages} ~ {person_ages}, +{weight}")
-                        else:
-                            # If query contains child-related terms and person is not a child, return 0
-                            if query_contains_child_terms and not person_is_child:
-                                match_details.append(f"Query contains child terms but person is not a child: {query_val} != {person_val}, +0")
-                                return 0
-                            # Check for partial matches with reduced weight
-                            for query_age in query_ages:
-                                for person_age in person_ages:
-                                    if query_age in person_age or person_age in query_age:
-                                        partial_match = weight * 0.7
-                                        weighted_matches += partial_match
-                                        match_details.append(f"Partial match on age_group: {query_age} ~ {person_age}, +{partial_match}")
-                                        break
-                
-                # Special handling for clothing top
-                elif key == 'clothing_top':
-                    # If this is a must-match attribute and contains specific item, require exact match
-                    exact_item_match_required = False
-                    for term in clothing_top_variations:
-                        if term in query_val:
-                            exact_item_match_required = True
-                            if term not in person_val:
-                                logger.info(f"Specific clothing item '{term}' not found in person's top")
-                                return 0
-                    
-                    # If no exact match required, proceed with normal matching
-                    if not exact_item_match_required:
-                        # Continue with standard clothing top matching logic
-                        # ... (rest of the clothing_top matching code)
-                        pass
-                    
-                    # Exact match
-                    if query_val == person_val:
-                        weighted_matches += weight
-                        match_details.append(f"Exact match on clothing top: {query_val} = {person_val}, +{weight}")
-                    # Categorical match
-                    else:
-                        # Check clothing categories
-                        query_category = None
-                        person_category = None
-                        
-                        for category, variations in clothing_top_variations.items():
-                            if category in query_val or any(var in query_val for var in variations):
-                                query_category = category
-                            if category in person_val or any(var in person_val for var in variations):
-                                person_category = category
-                                
-                        if query_category and person_category and query_category == person_category:
-                            weighted_matches += weight
-                            match_details.append(f"Category match on clothing top: {query_category} ~ {person_category}, +{weight}")
-                        elif query_val in person_val or person_val in query_val:
-                            partial_match = weight * 0.7
-                            weighted_matches += partial_match
-                            match_details.append(f"Partial text match on clothing top: {query_val} ~ {person_val}, +{partial_match}")
-                
-                # Apply similar strict matching for other attributes
-                elif key == 'clothing_bottom':
-                    # Check for specific bottom type requirements
-                    for term, attr in critical_terms.items():
-                        if attr == 'clothing_bottom' and term in query_val:
-                            if term not in person_val:
-                                logger.info(f"Specific bottom item '{term}' not found in person's clothing")
-                                return 0
-                    
-                    # Calculate standard match if no exact match was required
-                    if query_val == person_val:
-                        weighted_matches += weight
-                        match_details.append(f"Exact match on clothing bottom: {query_val} = {person_val}, +{weight}")
-                    else:
-                        weighted_matches += weight * 0.7
-                        match_details.append(f"Partial match on clothing bottom: {query_val} ~ {person_val}, +{weight * 0.7}")
-                
-                # Handle accessories exact matching
-                elif key == 'accessories':
-                    # Check for specific accessory requirements
-                    for term, attr in critical_terms.items():
-                        if attr == 'accessories' and term in query_val:
-                            if term not in person_val:
-                                logger.info(f"Specific accessory '{term}' not found")
-                                return 0
-                    
-                    # Calculate standard match
-                    if query_val == person_val:
-                        weighted_matches += weight
-                        match_details.append(f"Exact match on accessories: {query_val} = {person_val}, +{weight}")
-                    else:
-                        weighted_matches += weight * 0.7
-                        match_details.append(f"Partial match on accessories: {query_val} ~ {person_val}, +{weight * 0.7}")
-                
-                # Default handling for other attributes
-                else:
-                    # Exact match
-                    if query_val == person_val:
-                        weighted_matches += weight
-                        match_details.append(f"Exact match on {key}: {query_val} = {person_val}, +{weight}")
-                    # Partial match
-                    elif query_val in person_val or person_val in query_val:
-                        partial_match = weight * 0.7
-                        weighted_matches += partial_match
-                        match_details.append(f"Partial match on {key}: {query_val} ~ {person_val}, +{partial_match}")
-                    # Word-level match
-                    elif any(word in person_val.split() for word in query_val.split() if len(word) > 2):
-                        word_match = weight * 0.5
-                        weighted_matches += word_match
-                        match_details.append(f"Word-level match on {key}: {query_val} ~ {person_val}, +{word_match}")
-        
-        # Calculate final similarity score (0-1)
-        if weighted_total == 0:
-            return 0
-             
-        similarity = weighted_matches / weighted_total
-         
-        # Log all match details as debug info
-        logger.info(f"Match details: {'; '.join(match_details)}")
-        logger.info(f"Total weighted score: {weighted_matches}/{weighted_total} = {similarity:.4f}")
-        
-        # Boost score if all queried attributes match
-        if weighted_matches == weighted_total:
-            similarity = min(1.0, similarity * 1.2)
-            logger.info(f"Perfect match boost: {similarity:.4f}")
-            
-        # Boost score if key attributes match strongly
-        key_attributes = ['gender', 'age_group', 'hair_color', 'clothing_top_color', 'clothing_top']
-        key_attributes_in_query = [attr for attr in key_attributes if attr in query_json]
-        if len(key_attributes_in_query) >= 3:
-            # Calculate how many key attributes matched well
-            key_match_count = 0
-            key_total = 0
-            for attr in key_attributes_in_query:
-                if attr in person_json:
-                    key_total += 1
-                    query_val = str(query_json[attr]).lower()
-                    person_val = str(person_json[attr]).lower()
-                    if query_val == person_val:
-                        key_match_count += 1
-                    elif attr == 'gender' and any(g in person_val for g in gender_variations.get(query_val, [])):
-                        key_match_count += 1
-                    elif attr == 'age_group' and any(a in person_val for a in age_group_variations.get(query_val, [])):
-                        key_match_count += 1
-                    elif attr == 'hair_color' and any(c in person_val for c in color_variations.get(query_val, [])):
-                        key_match_count += 1
-                    elif attr == 'clothing_top_color' and any(c in person_val for c in color_variations.get(query_val, [])):
-                        key_match_count += 1
-                    elif attr == 'clothing_top' and any(t in person_val for t in clothing_top_variations.get(query_val, [])):
-                        key_match_count += 1
-                        
-            # If most key attributes match, boost the score
-            if key_total > 0 and key_match_count / key_total >= 0.7:
-                key_match_boost = 1.0 + ((key_match_count / key_total) * 0.2)  # Up to 20% boost based on match ratio
-                similarity = min(1.0, similarity * key_match_boost)
-                logger.info(f"Key attribute boost ({key_match_count}/{key_total}): final similarity = {similarity:.4f}")
-        
-        return similarity
-    except Exception as e:
-        logger.error(f"Error in calculate_similarity: {e}")
-        return 0
-
-def find_similar_people(user_description: str, top_k=1, include_match_highlights=True, include_camera_location=True, include_rag_response=True) -> List[Dict[str, Any]]:
+def find_similar_people(user_description: str, top_k=1, include_match_highlights=True, include_camera_location=True, include_rag_response=True, return_image_urls=False, attribute_weight=None, embedding_weight=None) -> List[Dict[str, Any]]:
     """Find similar people based on text description.
     
     Now defaults to only returning the top 1 match.
@@ -644,17 +229,78 @@ def find_similar_people(user_description: str, top_k=1, include_match_highlights
         include_match_highlights: Whether to include key attributes that matched
         include_camera_location: Whether to add camera locations to results
         include_rag_response: Whether to include a natural language response using Gemini
+        return_image_urls: Whether to return an image_url per match instead of inline base64 image_data
+        attribute_weight: Weight of attribute agreement in the hybrid score (defaults to SEARCH_ATTRIBUTE_WEIGHT)
+        embedding_weight: Weight of embedding similarity in the hybrid score (defaults to SEARCH_EMBEDDING_WEIGHT)
         
     Returns:
         List of matching people with descriptions and metadata
     """
+    if not user_description or len(user_description.strip()) < 3:
+        logger.warning(f"Search query too short or empty: '{user_description}'")
+        return []
+    
+    # Collect the streamed events back into a single response
+    matches = []
+    results = {}
+    rag_response = None
+    for event, data in iter_similar_people(user_description, top_k=top_k,
+                                           include_match_highlights=include_match_highlights,
+                                           include_camera_location=include_camera_location,
+                                           include_rag_response=include_rag_response,
+                                           return_image_urls=return_image_urls,
+                                           attribute_weight=attribute_weight,
+                                           embedding_weight=embedding_weight):
+        if event == "match":
+            match_obj = dict(data)
+            match_obj.pop("index", None)
+            matches.append(match_obj)
+        elif event == "image":
+            matches[data["index"]]["image_data"] = data["image_data"]
+        elif event == "results":
+            results = data
+        elif event == "summary":
+            rag_response = data["rag_response"]
+        elif event == "error":
+            return data
+    
+    response = {"matches": matches, **results}
+    if rag_response is not None:
+        response["rag_response"] = rag_response
+    return response
+
+def _empty_search_events(message: str, suggestions: List[str], rag_response: str, include_rag_response: bool):
+    """Events for a search that ends without matches."""
+    yield "results", {"count": 0, "message": message, "suggestions": suggestions}
+    if include_rag_response:
+        yield "summary", {"rag_response": rag_response}
+
+def iter_similar_people(user_description: str, top_k=1, include_match_highlights=True, include_camera_location=True, include_rag_response=True, return_image_urls=False, attribute_weight=None, embedding_weight=None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Run a search as a sequence of (event, data) pairs, each yielded as soon as it is ready.
+    
+    Events, in order:
+        query: the structured query the description was parsed into
+        match: one per ranked match, without image data (carries its "index")
+        results: count, message and suggestions once every match has been sent
+        image: base64 image_data for the match at "index" (skipped with return_image_urls)
+        summary: the RAG response, generated last because it waits on Gemini
+        error: the search failed; carries the full error response
+    
+    Takes the same arguments as find_similar_people.
+    """
     try:
         logger.info(f"Starting search for: '{user_description}'")
         
         # Add more comprehensive logging
         if not user_description or len(user_description.strip()) < 3:
             logger.warning(f"Search query too short or empty: '{user_description}'")
-            return []
+            yield from _empty_search_events(
+                "Search query too short. Please describe the person in more detail.",
+                ["Try describing clothing colors", "Mention gender (man/woman)", "Describe hair color or style"],
+                "Your search was too short for me to understand. Please describe the person in more detail.",
+                include_rag_response
+            )
+            return
             
         # Extract critical terms from the query that will require exact matching
         critical_terms = extract_critical_terms(user_description)
@@ -688,237 +334,117 @@ def find_similar_people(user_description: str, top_k=1, include_match_highlights
             suggested_refinements.append("elderly person")
             suggested_refinements.append("senior")
         
+        # Parsing the query (possibly a Gemini call) and getting the ranker (rebuilt after
+        # new detections) are independent, so they run concurrently
+        prepared = run_calls(
+            {"query_json": lambda: query_to_structured_json(user_description), "ranker": get_ranker},
+            defaults={"query_json": {}}
+        )
+        
         # Convert query to structured JSON
-        query_json = query_to_structured_json(user_description)
+        query_json = prepared["query_json"]
         if not query_json:
             logger.error(f"Could not parse query into structured JSON: '{user_description}'")
-            # Try a simple fallback approach for basic queries
-            basic_query = {}
-            
-            # Check for basic gender terms
-            if any(term in lower_desc for term in ["man", "male", "boy", "guy"]):
-                basic_query["gender"] = "male"
-            elif any(term in lower_desc for term in ["woman", "female", "girl", "lady"]):
-                basic_query["gender"] = "female"
-                
-            # Check for basic color terms
-            for color in color_terms:
-                if color in lower_desc:
-                    if "wearing" in lower_desc or any(term in lower_desc for term in clothing_terms):
-                        basic_query["clothing_top_color"] = color
-                    elif any(term in lower_desc for term in hair_terms):
-                        basic_query["hair_color"] = color
+            # Use whatever the local parser understood, however unsure it is
+            basic_query = parse_query_locally(user_description).attributes
             
             if basic_query:
                 logger.info(f"Using basic fallback query: {basic_query}")
                 query_json = basic_query
             else:
-                empty_response = {
-                    "matches": [],
-                    "count": 0,
-                    "message": "Could not understand your search query. Please try again with more specific details.",
-                    "suggestions": ["Try describing clothing colors", "Mention gender (man/woman)", "Describe hair color or style"]
-                }
-                if include_rag_response:
-                    empty_response["rag_response"] = "I couldn't understand your search query. Please try describing the person with more specific details like clothing colors, gender, or hair characteristics."
-                return empty_response
+                yield from _empty_search_events(
+                    "Could not understand your search query. Please try again with more specific details.",
+                    ["Try describing clothing colors", "Mention gender (man/woman)", "Describe hair color or style"],
+                    "I couldn't understand your search query. Please try describing the person with more specific details like clothing colors, gender, or hair characteristics.",
+                    include_rag_response
+                )
+                return
 
         # Log the structured query for debugging
         logger.info(f"Structured query: {json.dumps(query_json, indent=2)}")
+        yield "query", {"structured_query": query_json}
 
-        # Load database
-        db = load_database()
-        if not db or "people" not in db:
+        # Ranker for the current database version
+        ranker = prepared["ranker"]
+        if ranker is None or not ranker.count:
             logger.error("Database is empty or invalid")
-            empty_response = {
-                "matches": [],
-                "count": 0,
-                "message": "Search database is empty or not available.",
-                "suggestions": ["Try again later", "Check if the database has been initialized"]
-            }
-            if include_rag_response:
-                empty_response["rag_response"] = "I'm sorry, but the database appears to be empty or not accessible right now. Please try again later."
-            return empty_response
+            yield from _empty_search_events(
+                "Search database is empty or not available.",
+                ["Try again later", "Check if the database has been initialized"],
+                "I'm sorry, but the database appears to be empty or not accessible right now. Please try again later.",
+                include_rag_response
+            )
+            return
         
-        logger.info(f"Database loaded with {len(db['people'])} people")
+        logger.info(f"Ranking {ranker.count} people")
         
-        # Calculate similarities for each person
-        similarities = []
-        for idx, person in enumerate(db["people"]):
-            if "description" not in person:
-                logger.warning(f"Person missing description: {person.get('id', 'unknown')}")
-                continue
-            
-            # Log for debugging first few entries    
-            if idx < 3:
-                logger.info(f"Checking person {idx}: {person.get('id', 'unknown')}")
-                logger.info(f"Description: {person['description']}")
-                
-            # If critical terms are present, check for exact matches
-            if critical_terms:
-                # Check if all critical terms exist in the person's description
-                meets_critical_requirements = True
-                for term, attr in critical_terms.items():
-                    if attr not in person["description"] or term not in str(person["description"][attr]).lower():
-                        meets_critical_requirements = False
-                        if idx < 3:  # Only log for first few entries
-                            logger.info(f"Person {person.get('id', 'unknown')} missing critical term '{term}' in {attr}")
-                        break
-                
-                # Skip this person if they don't match critical terms
-                if not meets_critical_requirements:
-                    continue
-            
-            similarity = calculate_similarity(query_json, person["description"])
-            
-            # Only include results with non-zero similarity
-            if similarity > 0:
-                # Log first few matches in detail
-                if idx < 10 or similarity > 0.6:
-                    logger.info(f"Person {person.get('id', 'unknown')} similarity: {similarity:.4f}")
-                
-                # Store more detailed differential scoring for better ranking
-                match_details = calculate_match_details(query_json, person["description"])
-                similarities.append((person, similarity, match_details))
+        top_results = rank_query(ranker, query_json, top_k, critical_terms, attribute_weight, embedding_weight)
+        logger.info(f"Selected top {len(top_results)} results")
         
         # Add a message if there are critical terms but no matches
-        if critical_terms and not similarities:
+        if critical_terms and not top_results:
             logger.info(f"No matches found for critical terms: {critical_terms}")
-            empty_response = {
-                "matches": [],
-                "count": 0,
-                "message": f"No matches found for specific criteria: {', '.join(critical_terms.keys())}",
-                "suggestions": ["Try broader terms", "Remove specific requirements like colors or accessories"]
-            }
-            if include_rag_response:
-                empty_response["rag_response"] = f"I couldn't find anyone matching your specific criteria for {', '.join(critical_terms.keys())}. Try broadening your search by removing specific details."
-            return empty_response
-        
-        # Log how many similarities we found
-        logger.info(f"Found {len(similarities)} potential matches before normalization")
-        
-        # Normalize similarities for better differentiation
-        if similarities:
-            max_sim = max(sim for _, sim, _ in similarities)
-            min_sim = min(sim for _, sim, _ in similarities)
-            
-            # If all scores are the same, create artificial differentiation
-            if max_sim == min_sim and len(similarities) > 1:
-                # Use match details to create more nuanced scoring
-                similarities = sorted(similarities, key=lambda x: (x[1], score_match_details(x[2])), reverse=True)
-                
-                # Create artificial spread between 85% and 100%
-                normalized_sims = []
-                for i, (person, _, match_details) in enumerate(similarities):
-                    # Top match gets 100%, others get progressively lower
-                    normalized_score = 1.0 - (i * (0.15 / len(similarities)))
-                    normalized_sims.append((person, normalized_score, match_details))
-                similarities = normalized_sims
-            elif max_sim > min_sim:
-                # Normalize to amplify small differences
-                similarities = [(p, 0.85 + (0.15 * (s - min_sim) / (max_sim - min_sim)), m) 
-                               for p, s, m in similarities]
-        
-        # Sort by similarity (descending)
-        similarities.sort(key=lambda x: x[1], reverse=True)
-        
-        # Take top k results
-        top_results = similarities[:top_k]
-        logger.info(f"Selected top {len(top_results)} results")
-        
-        # Process results
+            yield from _empty_search_events(
+                f"No matches found for specific criteria: {', '.join(critical_terms.keys())}",
+                ["Try broader terms", "Remove specific requirements like colors or accessories"],
+                f"I couldn't find anyone matching your specific criteria for {', '.join(critical_terms.keys())}. Try broadening your search by removing specific details.",
+                include_rag_response
+            )
+            return
+        
+        # Process results - send each match before loading any images
         matches = []
-        for person, similarity, match_details in top_results:
+        matched_people = []
+        for person, similarity, attribute_score in top_results:
             try:
                 # Only include results with reasonable similarity
                 if similarity < 0.1:
                     logger.info(f"Skipping match with similarity below threshold: {similarity}")
                     continue
                     
-                # Convert similarity to percentage (0-100%)
-                similarity_score = max(0, min(100, similarity * 100))
-                
-                # If critical terms were found, ensure this is marked as 100%
-                # This creates a clear distinction between exact matches and fuzzy matches
-                if critical_terms:
-                    similarity_score = 100
-                
-                # Load and encode image
-                image_data = None
-                image_path = person["metadata"].get("image_path", "")
-                if image_path and os.path.exists(image_path):
-                    try:
-                        with open(image_path, "rb") as img_file:
-                            image_data = base64.b64encode(img_file.read()).decode("utf-8")
-                    except Exception as e:
-                        logger.error(f"Error loading image {image_path}: {e}")
-                
-                # Extract match highlights - the key attributes that matched
-                match_highlights = []
-                
-                # If critical terms were specified, highlight those first
-                if critical_terms:
-                    for term, attr in critical_terms.items():
-                        match_highlights.append(f"{attr}: {term}")
-                
-                # Get the values from both query and person for comparison
-                for key in query_json:
-                    if key in person["description"] and key not in [attr for _, attr in critical_terms.items()]:
-                        query_val = str(query_json[key]).lower()
-                        person_val = str(person["description"][key]).lower()
-                        
-                        # Check if values match or are similar
-                        if query_val == person_val:
-                            match_highlights.append(f"{key}: {person_val}")
-                        elif query_val in person_val or person_val in query_val:
-                            match_highlights.append(f"{key}: {person_val} (partial match)")
-                
-                # Add camera location if requested
-                camera_location = None
-                if include_camera_location:
-                    camera_id = person["metadata"].get("camera_id", "")
-                    camera_location = get_camera_location(camera_id)
-                    logger.info(f"Added camera location '{camera_location}' for camera ID '{camera_id}'")
-                
-                # Build the match object
-                match_obj = {
-                    "description": person["description"],
-                    "metadata": {
-                        **person["metadata"],
-                        "detection_id": person.get("id", ""),
-                    },
-                    "similarity": similarity_score,
-                    "image_data": image_data
-                }
-                
-                # Add camera location if available
-                if camera_location:
-                    match_obj["metadata"]["camera_location"] = camera_location
-                
-                # Add match highlights if requested
-                if include_match_highlights and match_highlights:
-                    match_obj["highlights"] = match_highlights
-                    match_obj["match_details"] = match_details
+                match_obj = build_match(person, similarity, query_json, critical_terms,
+                                        include_match_highlights=include_match_highlights,
+                                        include_camera_location=include_camera_location,
+                                        return_image_urls=return_image_urls)
                 
+                yield "match", {"index": len(matches), **match_obj}
                 matches.append(match_obj)
+                matched_people.append(person)
             except Exception as e:
                 logger.error(f"Error processing match: {e}")
                 continue
         
-        # Build the complete response
-        response = {
-            "matches": matches,
+        yield "results", {
             "count": len(matches),
             "message": f"Found {len(matches)} potential matches.",
             "suggestions": suggested_refinements
         }
         
-        # Add RAG-enhanced response if requested
+        # The RAG response only needs the match descriptions, so Gemini works on it while images load
+        rag_future = None
         if include_rag_response and matches:
-            rag_result = generate_rag_response(user_description, matches)
-            response["rag_response"] = rag_result.get("response", "")
-        
-        return response
+            rag_future = submit(generate_rag_response, user_description, [dict(match) for match in matches])
+        
+        # Load and encode images
+        if not return_image_urls:
+            for index, person in enumerate(matched_people):
+                try:
+                    image_bytes = load_person_image(person)
+                    if image_bytes:
+                        image_data = base64.b64encode(image_bytes).decode("utf-8")
+                        matches[index]["image_data"] = image_data
+                        yield "image", {"index": index, "detection_id": person.get("id", ""), "image_data": image_data}
+                except Exception as e:
+                    logger.error(f"Error loading image for match {index}: {e}")
+        
+        # Add RAG-enhanced response if requested - last, since it waits on Gemini
+        if rag_future is not None:
+            try:
+                rag_result = rag_future.result(timeout=LLM_CALL_TIMEOUT_SECONDS)
+            except Exception as e:
+                logger.error(f"RAG response failed or timed out: {e}")
+                rag_result = {"response": "I found some matches for your search, but couldn't generate a detailed explanation."}
+            yield "summary", {"rag_response": rag_result.get("response", "")}
         
     except Exception as e:
         logger.error(f"Error in find_similar_people: {e}")
@@ -931,7 +457,194 @@ def find_similar_people(user_description: str, top_k=1, include_match_highlights
         }
         if include_rag_response:
             error_response["rag_response"] = "I'm sorry, but an error occurred while searching. Please try again with a different query."
-        return error_response
+        yield "error", error_response
+
+def paginated_search(user_description: str = "", page_size=10, cursor=None, include_match_highlights=True, include_camera_location=True, return_image_urls=False, attribute_weight=None, embedding_weight=None) -> Dict[str, Any]:
+    """Browse search results page by page.
+    
+    Without a cursor, the query is ranked once to a depth of PAGINATION_MAX_RESULTS and
+    the ranked detection IDs and scores are kept server-side; with a cursor, the next page
+    is sliced from that ranking without searching again. Pages do not include a RAG response.
+    
+    Args:
+        user_description: Natural language description to search for (ignored with a cursor)
+        page_size: Number of matches per page
+        cursor: next_cursor from a previous page
+        include_match_highlights, include_camera_location, return_image_urls, attribute_weight,
+        embedding_weight: As for find_similar_people; fixed by the first page for later pages
+        
+    Returns:
+        Dictionary with matches, count, total, offset and next_cursor (None on the last page),
+        or with an "error" and expired=True when the cursor is unknown or has expired
+    """
+    try:
+        if cursor is None:
+            if not user_description or len(user_description.strip()) < 3:
+                logger.warning(f"Search query too short or empty: '{user_description}'")
+                return {"matches": [], "count": 0, "total": 0, "offset": 0, "next_cursor": None,
+                        "message": "Search query too short. Please describe the person in more detail."}
+            
+            query_json = query_to_structured_json(user_description) or parse_query_locally(user_description).attributes
+            critical_terms = extract_critical_terms(user_description)
+            ranker = get_ranker()
+            ranked = rank_query(ranker, query_json, PAGINATION_MAX_RESULTS, critical_terms,
+                                attribute_weight, embedding_weight) if query_json and ranker.count else []
+            # Same threshold as find_similar_people
+            ranked = [(person, score) for person, score, _ in ranked if score >= 0.1 and person.get("id")]
+            logger.info(f"Ranked {len(ranked)} results for paginated search: '{user_description}'")
+            
+            cursor = cursor_store.create(
+                [person["id"] for person, _ in ranked],
+                [score for _, score in ranked],
+                {
+                    "query_json": query_json,
+                    "critical_terms": critical_terms,
+                    "include_match_highlights": include_match_highlights,
+                    "include_camera_location": include_camera_location,
+                    "return_image_urls": return_image_urls
+                }
+            )
+        
+        page = cursor_store.page(cursor, page_size)
+        if page is None:
+            logger.info(f"Unknown or expired search cursor: {cursor}")
+            return {"matches": [], "count": 0, "next_cursor": None, "expired": True,
+                    "error": "Search cursor is unknown or has expired. Please run the search again."}
+        result_set, offset, items, next_cursor = page
+        context = result_set.context
+        
+        # Resolve IDs against the current data; people evicted since the search are skipped
+        matches = []
+        for detection_id, score in items:
+            person = get_person(detection_id)
+            if person is None:
+                continue
+            match_obj = build_match(person, score, context["query_json"], context["critical_terms"],
+                                    include_match_highlights=context["include_match_highlights"],
+                                    include_camera_location=context["include_camera_location"],
+                                    return_image_urls=context["return_image_urls"])
+            if not context["return_image_urls"]:
+                image_bytes = load_person_image(person)
+                if image_bytes:
+                    match_obj["image_data"] = base64.b64encode(image_bytes).decode("utf-8")
+            matches.append(match_obj)
+        
+        total = len(result_set.ids)
+        return {
+            "matches": matches,
+            "count": len(matches),
+            "total": total,
+            "offset": offset,
+            "next_cursor": next_cursor,
+            "message": f"Showing {offset + 1}-{offset + len(items)} of {total} potential matches." if items else f"Found {total} potential matches."
+        }
+    except Exception as e:
+        logger.error(f"Error in paginated_search: {e}")
+        return {
+            "matches": [],
+            "count": 0,
+            "next_cursor": None,
+            "message": "An error occurred during search. Please try again.",
+            "error": str(e)
+        }
+
+def rank_query(ranker, query_json: Dict[str, Any], top_k: int, critical_terms: Dict[str, str],
+               attribute_weight=None, embedding_weight=None):
+    """Hybrid attribute + embedding ranking of a structured query, best first."""
+    # Embed the structured query only when stored people carry embeddings to compare against
+    weights = {
+        "attribute_weight": SEARCH_ATTRIBUTE_WEIGHT if attribute_weight is None else attribute_weight,
+        "embedding_weight": SEARCH_EMBEDDING_WEIGHT if embedding_weight is None else embedding_weight
+    }
+    query_embedding = None
+    if ranker.supports_embeddings and weights["embedding_weight"] > 0:
+        query_embedding = embed_query(query_json)
+    
+    # Hybrid attribute + embedding scoring, then top-k by partition
+    return ranker.rank(query_json, top_k, query_embedding=query_embedding,
+                       required_terms=critical_terms, **weights)
+
+def build_match(person: Dict[str, Any], similarity: float, query_json: Dict[str, Any], critical_terms: Dict[str, str],
+                include_match_highlights=True, include_camera_location=True, return_image_urls=False) -> Dict[str, Any]:
+    """
+    Build the response object for one ranked person, without inline image data.
+    
+    Args:
+        person: Person record from the database
+        similarity: Ranking score in [0, 1]
+        query_json: Structured query the person was ranked against
+        critical_terms: Terms from extract_critical_terms, highlighted first
+        
+    Returns:
+        Match object with description, metadata, similarity percentage and optional highlights
+    """
+    # Convert similarity to percentage (0-100%)
+    similarity_score = max(0, min(100, similarity * 100))
+    match_details = calculate_match_details(query_json, person["description"])
+    
+    # Extract match highlights - the key attributes that matched
+    match_highlights = []
+    
+    # If critical terms were specified, highlight those first
+    if critical_terms:
+        for term, attr in critical_terms.items():
+            match_highlights.append(f"{attr}: {term}")
+    
+    # Get the values from both query and person for comparison
+    for key in query_json:
+        if key in person["description"] and key not in [attr for _, attr in critical_terms.items()]:
+            query_val = str(query_json[key]).lower()
+            person_val = str(person["description"][key]).lower()
+            
+            # Check if values match or are similar
+            if query_val == person_val:
+                match_highlights.append(f"{key}: {person_val}")
+            elif query_val in person_val or person_val in query_val:
+                match_highlights.append(f"{key}: {person_val} (partial match)")
+    
+    # Add camera location if requested
+    camera_location = None
+    if include_camera_location:
+        camera_id = person["metadata"].get("camera_id", "")
+        camera_location = get_camera_location(camera_id)
+        logger.info(f"Added camera location '{camera_location}' for camera ID '{camera_id}'")
+    
+    # Build the match object; inline image data is loaded separately
+    match_obj = {
+        "description": person["description"],
+        "metadata": {
+            **person["metadata"],
+            "detection_id": person.get("id", ""),
+        },
+        "similarity": similarity_score,
+        "image_data": None
+    }
+    
+    if return_image_urls:
+        match_obj["image_url"] = crop_url(person.get("id", ""))
+    
+    # Add camera location if available
+    if camera_location:
+        match_obj["metadata"]["camera_location"] = camera_location
+    
+    # Add match highlights if requested
+    if include_match_highlights and match_highlights:
+        match_obj["highlights"] = match_highlights
+        match_obj["match_details"] = match_details
+    
+    return match_obj
+
+def embed_query(query_json: Dict[str, Any]):
+    """
+    Embed a structured query the same way person descriptions are embedded.
+    Returns None if the embedding model is unavailable.
+    """
+    try:
+        from embedder import embed_description
+        return embed_description(query_json)
+    except Exception as e:
+        logger.error(f"Error embedding query, ranking on attributes only: {e}")
+        return None
 
 # Helper function to get camera location from camera ID
 def get_camera_location(camera_id: str) -> str:
@@ -1023,22 +736,6 @@ def calculate_match_details(query_json: Dict[str, Any], person_json: Dict[str, A
     
     return match_details
 
-def score_match_details(match_details: Dict[str, Any]) -> float:
-    """Convert match details to a single score for secondary sorting."""
-    exact_weight = 1.0
-    partial_weight = 0.3
-    key_attr_weight = 2.0
-    
-    score = (match_details["exact_matches"] * exact_weight + 
-             match_details["partial_matches"] * partial_weight + 
-             match_details["key_attribute_matches"] * key_attr_weight)
-             
-    # Normalize by total attributes
-    if match_details["total_attributes"] > 0:
-        score = score / match_details["total_attributes"]
-    
-    return score
-
 def generate_rag_response(user_query: str, matches: List[Dict[str, Any]]) -> Dict[str, Any]:
     """
     Use Gemini to generate a RAG-enhanced response based on the user query and matches.
@@ -1143,183 +840,246 @@ Keep your response concise and focused on helping the user understand the search
             "matches": matches
         }
 
-def direct_database_search(query: str, top_k=5) -> Dict[str, Any]:
+# Attributes in the order they appear in a compact candidate line
+COMPACT_FIELDS = [
+    ("gender", None), ("age_group", None), ("skin_tone", "skin"), ("ethnicity", None),
+    (("hair_color", "hair_style"), "hair"), ("facial_features", "face"),
+    (("clothing_top_color", "clothing_top_pattern", "clothing_top"), "top"),
+    (("clothing_bottom_color", "clothing_bottom_pattern", "clothing_bottom"), "bottom"),
+    (("footwear_color", "footwear"), "shoes"), ("accessories", "acc"),
+    (("bag_color", "bag_type"), "bag"), ("pose", None), ("location_context", None)
+]
+EMPTY_VALUES = {"", "none", "unknown", "n/a", "null", "solid"}
+
+def encode_candidate(ref: str, person: Dict[str, Any]) -> str:
     """
-    Use Gemini to directly search the database with natural language.
-    This function:
-    1. Loads the entire database from ml.json (read-only mode)
-    2. Formats it as a context for Gemini
-    3. Asks Gemini to find the best matches for the query
-    4. Returns structured results with camera locations and detailed explanations
-    
-    Note: The database is accessed in read-only mode from ml.json
-    
-    Args:
-        query: Natural language query string
-        top_k: Maximum number of results to return
-        
-    Returns:
-        Dictionary with matches, count, explanations and suggestions
+    Encode a person as one compact line for an LLM prompt, e.g.
+    "P3 | Mission District | 2025-04-05T14:02 | male; adult; hair black short; top blue hoodie; bag black backpack".
+    Empty and placeholder values are dropped.
     """
-    try:
-        logger.info(f"Starting direct database search with Gemini for: '{query}'")
-        
-        # Load the database from ml.json (read-only)
-        db = load_database()  # This now loads from ml.json
-        if not db or "people" not in db or len(db["people"]) == 0:
-            logger.error("Database is empty or invalid")
-            return {
-                "matches": [],
-                "count": 0,
-                "message": "Search database (ml.json) is empty or not available.",
-                "suggestions": ["Check if ml.json exists and is properly formatted"],
-                "rag_response": "I'm sorry, but the database appears to be empty or not accessible right now. Please ensure ml.json contains valid data."
-            }
-        
-        # Count how many entries we have
-        people_count = len(db["people"])
-        logger.info(f"Loaded database with {people_count} entries")
-        
-        # Format the database entries for Gemini
-        db_entries = []
-        
-        for idx, person in enumerate(db["people"]):
-            if "description" not in person or not isinstance(person["description"], dict):
-                continue
-                
-            # Get metadata
-            metadata = person.get("metadata", {})
-            camera_id = metadata.get("camera_id", "unknown")
-            timestamp = metadata.get("timestamp", "unknown time")
-            
-            # Map camera ID to location
-            camera_location = get_camera_location(camera_id)
-            
-            # Create a formatted entry
-            entry = {
-                "id": person.get("id", f"person_{idx}"),
-                "description": person["description"],
-                "camera_id": camera_id,
-                "camera_location": camera_location,
-                "timestamp": timestamp
-            }
-            
-            db_entries.append(entry)
-        
-        # Limit entries if database is too large
-        if len(db_entries) > 200:
-            logger.warning(f"Database too large ({len(db_entries)} entries), limiting to 200 for Gemini")
-            db_entries = db_entries[:200]
-        
-        # Create a context for Gemini with the database entries
-        database_json = json.dumps(db_entries, indent=2)
-        
-        # Create the prompt for Gemini
-        gemini_prompt = f"""
-You are a powerful search system for surveillance camera footage. 
-Your task is to find people matching a user's description in the database.
+    desc = person.get("description", {})
+    metadata = person.get("metadata", {})
+    parts = []
+    for keys, label in COMPACT_FIELDS:
+        keys = keys if isinstance(keys, tuple) else (keys,)
+        values = []
+        for k in keys:
+            value = desc.get(k)
+            value = ", ".join(str(v) for v in value) if isinstance(value, list) else str(value or "").strip()
+            if value.lower() not in EMPTY_VALUES:
+                values.append(value)
+        if values:
+            parts.append(f"{label} {' '.join(values)}" if label else " ".join(values))
+    location = get_camera_location(metadata.get("camera_id", "unknown"))
+    timestamp = str(metadata.get("timestamp", ""))[:16]
+    return f"{ref} | {location} | {timestamp} | {'; '.join(parts)}"
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token)."""
+    return len(text) // 4 + 1
+
+def retrieve_candidates(query: str, limit: int) -> List[Tuple[Dict[str, Any], float]]:
+    """
+    Local candidate retrieval for direct search: the hybrid ranker's top `limit` people,
+    best first, as (person, local score). Falls back to embedding similarity, then to the
+    newest detections, when the query has no attributes the ranker can score.
+    """
+    ranker = get_ranker()
+    if not ranker.count:
+        return []
+    query_json = query_to_structured_json(query) or parse_query_locally(query).attributes
+    if query_json:
+        query_embedding = embed_query(query_json) if ranker.supports_embeddings else None
+        return [(person, score) for person, score, _ in ranker.rank(query_json, limit, query_embedding=query_embedding)]
+    if ranker.supports_embeddings:
+        query_embedding = embed_query({"description": query})
+        if query_embedding is not None:
+            return ranker.rank_by_embedding(query_embedding, limit)
+    logger.info("Query has no structured attributes, using the newest detections as candidates")
+    return [(person, 0.0) for person in ranker.newest(limit)]
+
+DIRECT_SEARCH_PROMPT_TEMPLATE = """
+You are a powerful search system for surveillance camera footage.
+Your task is to find people matching a user's description among the candidates below.
 
 USER QUERY: "{query}"
 
-SURVEILLANCE DATABASE (JSON):
-{database_json}
+CANDIDATES (one per line: ref | camera location | time | attributes):
+{candidates}
 
 INSTRUCTIONS:
-1. Find the best matches for this query, considering:
+1. Pick up to {top_k} candidates that best match the query, considering:
    - Exact attribute matches (e.g., specific clothing items, colors)
    - Semantic matches (e.g., "man" = "male", "kid" = "child")
    - Partial matches when no exact match exists
    - Best overall match of multiple criteria
-
-2. For each match, explain why it matches the query and include:
-   - Camera location
-   - Key attributes that matched
-   - Any notable differences
-   - Similarity score (0-100%)
-
-3. Format your response as structured JSON with these components:
-   - best_matches: Array of up to {top_k} best matching entries
-   - explanations: Object with entry IDs as keys and explanation strings as values
-   - summary: A natural language summary of the search results
-   - suggestions: Array of suggested alternative queries if results are not satisfactory
+2. Score each pick 0-100 and explain in one sentence why it matches and any notable differences.
+3. If results are not satisfactory, suggest alternative queries.
 
 RESPONSE FORMAT:
 {{
-  "best_matches": [
-    {{
-      "id": "entry_id",
-      "similarity": 92,
-      "description": {{...original description object...}},
-      "camera_id": "camera_id",
-      "camera_location": "Human readable location"
-    }}
-  ],
-  "explanations": {{
-    "entry_id": "This person matches because they have X, Y, and Z attributes that match the query."
-  }},
-  "summary": "I found 3 people matching your description. The best match is a male child wearing a red shirt at Mission District.",
-  "suggestions": ["Try specifying clothing colors", "Include age group (child, teen, adult)"]
+  "matches": [{{"ref": "P3", "similarity": 92, "explanation": "Male child in a red shirt, matching age and clothing."}}],
+  "summary": "A natural language summary of the search results",
+  "suggestions": ["Try specifying clothing colors"]
 }}
 
 Return ONLY a valid JSON object, no additional text.
 """
 
-        # Call Gemini for the search
-        logger.info("Sending search request to Gemini with database context")
-        response = model.generate_content(gemini_prompt)
-        
-        # Extract the JSON response
-        result_text = response.text.strip()
+def _rerank_chunk(query: str, lines: List[str], top_k: int) -> Dict[str, Any]:
+    """Ask Gemini to pick and score the best matches among one chunk of candidate lines."""
+    prompt = DIRECT_SEARCH_PROMPT_TEMPLATE.format(query=query, candidates="\n".join(lines), top_k=top_k)
+    response = model.generate_content(prompt, generation_config={"max_output_tokens": DIRECT_SEARCH_MAX_OUTPUT_TOKENS})
+    result_text = response.text.strip()
+    
+    # Attempt to extract JSON if wrapped in code blocks
+    if "```json" in result_text:
+        result_text = result_text.split("```json")[1].split("```")[0].strip()
+    elif "```" in result_text:
+        result_text = result_text.split("```")[1].split("```")[0].strip()
+    return json.loads(result_text)
+
+def direct_database_search(query: str, top_k=5, token_budget=None, latency_budget=None) -> Dict[str, Any]:
+    """
+    Use Gemini to directly search the database with natural language.
+    This function:
+    1. Retrieves the best local candidates with the hybrid ranker (read-only ml.json plus live detections)
+    2. Encodes each candidate as one compact line
+    3. Splits the candidates into chunks that Gemini re-ranks in parallel
+    4. Merges the chunk results by score into structured results with camera locations and explanations
+    
+    Candidates are added best-first until the prompt token budget is spent. Chunks that
+    have not answered within the latency budget are dropped; if none answers, the local
+    ranking is returned instead.
+    
+    Args:
+        query: Natural language query string
+        top_k: Maximum number of results to return
+        token_budget: Estimated prompt tokens across all chunks (defaults to DIRECT_SEARCH_TOKEN_BUDGET)
+        latency_budget: Seconds to wait for the re-ranking calls (defaults to DIRECT_SEARCH_LATENCY_BUDGET)
         
-        # Attempt to extract JSON if wrapped in code blocks
-        if "```json" in result_text:
-            result_text = result_text.split("```json")[1].split("```")[0].strip()
-        elif "```" in result_text:
-            result_text = result_text.split("```")[1].split("```")[0].strip()
-            
-        logger.info(f"Received response from Gemini (length: {len(result_text)})")
+    Returns:
+        Dictionary with matches, count, explanations and suggestions
+    """
+    try:
+        logger.info(f"Starting direct database search with Gemini for: '{query}'")
+        token_budget = token_budget or DIRECT_SEARCH_TOKEN_BUDGET
+        latency_budget = latency_budget or DIRECT_SEARCH_LATENCY_BUDGET
+        start_time = time.time()
         
-        try:
-            result = json.loads(result_text)
-            
-            # Structure the response for the frontend
-            matches = []
-            for match in result.get("best_matches", []):
-                # Format each match entry
-                entry = {
-                    "description": match.get("description", {}),
-                    "metadata": {
-                        "camera_id": match.get("camera_id", "unknown"),
-                        "camera_location": match.get("camera_location", "Unknown location"),
-                        "detection_id": match.get("id", "")
-                    },
-                    "similarity": match.get("similarity", 0),
-                    "explanation": result.get("explanations", {}).get(match.get("id", ""), "")
-                }
-                matches.append(entry)
-                
-            # Build the complete response
-            search_response = {
-                "matches": matches,
-                "count": len(matches),
-                "message": f"Found {len(matches)} potential matches.",
-                "suggestions": result.get("suggestions", []),
-                "rag_response": result.get("summary", "I searched the database for matches to your query.")
-            }
-            
-            logger.info(f"Returning {len(matches)} matches from direct Gemini search")
-            return search_response
-            
-        except json.JSONDecodeError as e:
-            logger.error(f"Error parsing Gemini response as JSON: {e}")
-            logger.error(f"Raw response: {result_text[:500]}...")
+        candidates = retrieve_candidates(query, DIRECT_SEARCH_CANDIDATES)
+        if not candidates:
+            logger.info("No local candidates for direct search")
             return {
                 "matches": [],
                 "count": 0,
-                "message": "Error parsing search results. Please try again.",
-                "error": f"JSON parse error: {str(e)}",
-                "rag_response": "I had trouble understanding the search results. Please try rephrasing your query."
+                "message": "No potential matches found for your search.",
+                "suggestions": ["Try broader terms", "Describe clothing colors, gender or hair"],
+                "rag_response": "I couldn't find anyone matching your description. Try using more general terms or fewer specific details."
             }
+        
+        # Encode best-first until the token budget is spent
+        prompt_overhead = estimate_tokens(DIRECT_SEARCH_PROMPT_TEMPLATE) + estimate_tokens(query)
+        lines, people = [], []
+        spent = 0
+        for person, _ in candidates:
+            line = encode_candidate(f"P{len(lines)}", person)
+            cost = estimate_tokens(line) + 1
+            # Every chunk repeats the prompt overhead
+            chunks_needed = len(lines) // DIRECT_SEARCH_CHUNK_SIZE + 1
+            if lines and spent + cost + chunks_needed * prompt_overhead > token_budget:
+                break
+            lines.append(line)
+            people.append(person)
+            spent += cost
+        if len(lines) < len(candidates):
+            logger.info(f"Token budget {token_budget} fits {len(lines)} of {len(candidates)} candidates")
+        
+        # Stripe candidates across chunks so each chunk gets a similar mix of strong and weak candidates
+        chunk_count = (len(lines) + DIRECT_SEARCH_CHUNK_SIZE - 1) // DIRECT_SEARCH_CHUNK_SIZE
+        chunks = [lines[i::chunk_count] for i in range(chunk_count)]
+        logger.info(f"Re-ranking {len(lines)} candidates in {chunk_count} chunk(s) "
+                    f"(~{spent + chunk_count * prompt_overhead} prompt tokens)")
+        
+        # Chunks run on the shared LLM pool; calls that overrun the latency budget are dropped
+        remaining = max(0.0, latency_budget - (time.time() - start_time))
+        results = run_calls({f"chunk {i}": (lambda chunk=chunk: _rerank_chunk(query, chunk, top_k)) for i, chunk in enumerate(chunks)},
+                            timeout=remaining)
+        if results.failed:
+            logger.warning(f"{len(results.failed)} of {chunk_count} re-ranking chunk(s) failed or missed the {latency_budget}s latency budget")
+        
+        # Merge chunk results by score
+        ranked = {}
+        summaries = []
+        suggestions = []
+        failed_chunks = len(results.failed)
+        for name, result in results.items():
+            if name in results.failed:
+                continue
+            if result.get("summary"):
+                summaries.append(result["summary"])
+            for suggestion in result.get("suggestions", []):
+                if suggestion not in suggestions:
+                    suggestions.append(suggestion)
+            for match in result.get("matches", []):
+                ref = str(match.get("ref", ""))
+                if not ref.startswith("P") or not ref[1:].isdigit() or int(ref[1:]) >= len(people):
+                    logger.warning(f"Ignoring unknown candidate ref from Gemini: {ref}")
+                    continue
+                index = int(ref[1:])
+                try:
+                    similarity = float(match.get("similarity", 0))
+                except (TypeError, ValueError):
+                    similarity = 0.0
+                if index not in ranked or similarity > ranked[index][0]:
+                    ranked[index] = (similarity, match.get("explanation", ""))
+        
+        if failed_chunks == chunk_count:
+            logger.warning("No re-ranking chunk succeeded, returning the local ranking")
+            ranked = {i: (max(0, min(100, score * 100)), "Ranked by local attribute matching.")
+                      for i, (_, score) in enumerate(candidates[:min(top_k, len(people))])}
+        
+        # Structure the response for the frontend
+        matches = []
+        for index, (similarity, explanation) in sorted(ranked.items(), key=lambda item: -item[1][0])[:top_k]:
+            person = people[index]
+            metadata = person.get("metadata", {})
+            camera_id = metadata.get("camera_id", "unknown")
+            matches.append({
+                "description": person.get("description", {}),
+                "metadata": {
+                    "camera_id": camera_id,
+                    "camera_location": get_camera_location(camera_id),
+                    "detection_id": person.get("id", ""),
+                    "timestamp": metadata.get("timestamp", "")
+                },
+                "similarity": similarity,
+                "explanation": explanation
+            })
+        
+        # A single chunk saw every candidate, so its summary covers the whole search
+        if len(summaries) == 1 and chunk_count == 1:
+            rag_response = summaries[0]
+        elif matches:
+            best = matches[0]
+            rag_response = (f"I reviewed {len(people)} candidates and found {len(matches)} potential matches. "
+                            f"The best match ({best['similarity']:.0f}%) was seen at {best['metadata']['camera_location']}. "
+                            f"{best['explanation']}").strip()
+        else:
+            rag_response = "I couldn't find anyone matching your description. Try using more general terms or fewer specific details."
+        
+        logger.info(f"Returning {len(matches)} matches from direct Gemini search in {time.time() - start_time:.2f}s")
+        search_response = {
+            "matches": matches,
+            "count": len(matches),
+            "message": f"Found {len(matches)} potential matches.",
+            "suggestions": suggestions[:5],
+            "rag_response": rag_response
+        }
+        # Some candidates were never re-ranked
+        if failed_chunks:
+            search_response["partial"] = True
+        return search_response
             
     except Exception as e:
         logger.error(f"Error in direct_database_search: {str(e)}")
@@ -0,0 +1,235 @@
+# standing_queries.py
+
+import os
+import json
+import uuid
+import threading
+import logging
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+from dotenv import load_dotenv
+from db import add_listener
+from events import event_bus
+from images import crop_url
+from ranking import score_attribute_value, ATTRIBUTE_WEIGHTS, MUST_MATCH_EXACT
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Standing query configuration
+STANDING_QUERIES_PATH = os.getenv("STANDING_QUERIES_PATH", os.path.join(os.path.dirname(__file__), "data", "standing_queries.json"))
+STANDING_QUERY_MIN_SCORE = float(os.getenv("STANDING_QUERY_MIN_SCORE", "0.6"))
+STANDING_QUERY_MEMO_SIZE = int(os.getenv("STANDING_QUERY_MEMO_SIZE", "1024"))  # memoized person values per clause
+
+# Event type published for each detection that matches a standing query
+STANDING_QUERY_HIT = "standing_query_hit"
+
+# Attributes that can rule a person out, evaluated first so most detections are rejected early
+VETO_ATTRIBUTES = ["gender", "age_group"] + MUST_MATCH_EXACT
+
+
+class _Clause:
+    """One queried attribute, with person values it has already scored memoized."""
+
+    __slots__ = ("key", "value", "weight", "_memo")
+
+    def __init__(self, key: str, value: str, weight: float):
+        self.key = key
+        self.value = value
+        self.weight = weight
+        self._memo: Dict[Optional[str], Optional[Tuple[float, bool]]] = {}
+
+    def score(self, person_val: Optional[str]) -> Optional[Tuple[float, bool]]:
+        if person_val in self._memo:
+            return self._memo[person_val]
+        result = score_attribute_value(self.key, self.value, person_val)
+        if len(self._memo) >= STANDING_QUERY_MEMO_SIZE:
+            self._memo.clear()
+        self._memo[person_val] = result
+        return result
+
+
+class StandingQuery:
+    """
+    A saved search, compiled once into clauses scored with the same rules as /search
+    (score_attribute_value and ATTRIBUTE_WEIGHTS), so a detection that would rank for
+    the query in a search also hits it here.
+    """
+
+    def __init__(self, query_id: str, name: str, query_json: Dict[str, Any], min_score: float = STANDING_QUERY_MIN_SCORE,
+                 camera_ids: Optional[List[str]] = None, required_terms: Optional[Dict[str, str]] = None,
+                 description: Optional[str] = None, created_at: Optional[str] = None):
+        self.id = query_id
+        self.name = name
+        self.query_json = query_json
+        self.min_score = min_score
+        self.camera_ids = set(camera_ids) if camera_ids else None
+        self.required_terms = required_terms or {}
+        self.description = description
+        self.created_at = created_at or datetime.now().isoformat()
+        self.hits = 0
+        self.last_hit_at: Optional[str] = None
+
+        clauses = [
+            _Clause(key, str(value).lower(), ATTRIBUTE_WEIGHTS.get(key, 1.0))
+            for key, value in query_json.items() if value is not None and value != ""
+        ]
+        clauses.sort(key=lambda clause: VETO_ATTRIBUTES.index(clause.key) if clause.key in VETO_ATTRIBUTES else len(VETO_ATTRIBUTES))
+        self.clauses = clauses
+
+    def evaluate(self, person: Dict[str, Any]) -> Optional[float]:
+        """
+        Score one detection against the query.
+
+        Returns:
+            Score in [0, 1] if the detection matches at or above min_score, otherwise None
+        """
+        if self.camera_ids is not None and person.get("metadata", {}).get("camera_id") not in self.camera_ids:
+            return None
+        desc = person.get("description", {})
+        if not isinstance(desc, dict):
+            return None
+
+        matched = 0.0
+        total = 0.0
+        for clause in self.clauses:
+            value = desc.get(clause.key)
+            result = clause.score(str(value).lower() if value is not None and value != "" else None)
+            if result is None:
+                return None
+            credit, counted = result
+            matched += clause.weight * credit
+            total += clause.weight * counted
+
+        for term, key in self.required_terms.items():
+            if term not in str(desc.get(key) or "").lower():
+                return None
+
+        score = matched / total if total > 0 else 0.0
+        return score if score >= self.min_score else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "description": self.description,
+            "query_json": self.query_json,
+            "required_terms": self.required_terms,
+            "min_score": self.min_score,
+            "camera_ids": sorted(self.camera_ids) if self.camera_ids else None,
+            "created_at": self.created_at,
+            "hits": self.hits,
+            "last_hit_at": self.last_hit_at
+        }
+
+
+class StandingQueryStore:
+    """
+    Saved searches evaluated against every new detection as it is ingested.
+
+    Matches are published on the event bus as STANDING_QUERY_HIT events, so clients
+    subscribe once instead of polling /search. Queries are persisted to
+    STANDING_QUERIES_PATH and survive restarts.
+    """
+
+    def __init__(self, path: str = STANDING_QUERIES_PATH):
+        self.path = path
+        self._queries: Dict[str, StandingQuery] = {}
+        self._lock = threading.Lock()
+        self._metrics = {"evaluated": 0, "hits": 0}
+        self._load()
+        add_listener(self._on_change)
+
+    def _load(self):
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, 'r') as f:
+                    saved = json.load(f)
+                for entry in saved.get("queries", []):
+                    query = StandingQuery(entry["id"], entry.get("name", ""), entry.get("query_json", {}),
+                                          entry.get("min_score", STANDING_QUERY_MIN_SCORE), entry.get("camera_ids"),
+                                          entry.get("required_terms"), entry.get("description"), entry.get("created_at"))
+                    self._queries[query.id] = query
+                logger.info(f"Loaded {len(self._queries)} standing queries from {self.path}")
+        except Exception as e:
+            logger.error(f"Error loading standing queries: {e}")
+
+    def _save(self):
+        """Persist the queries. Must be called with the lock held."""
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({"queries": [query.to_dict() for query in self._queries.values()]}, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.error(f"Error saving standing queries: {e}")
+
+    def add(self, query_json: Dict[str, Any], name: Optional[str] = None, min_score: float = STANDING_QUERY_MIN_SCORE,
+            camera_ids: Optional[List[str]] = None, required_terms: Optional[Dict[str, str]] = None,
+            description: Optional[str] = None) -> Dict[str, Any]:
+        """Compile and register a standing query. Returns the saved query."""
+        query_id = uuid.uuid4().hex
+        query = StandingQuery(query_id, name or description or query_id, query_json, min_score,
+                              camera_ids, required_terms, description)
+        with self._lock:
+            self._queries[query_id] = query
+            self._save()
+        logger.info(f"Added standing query {query_id} ({query.name}) with {len(query.clauses)} clauses")
+        return query.to_dict()
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [query.to_dict() for query in self._queries.values()]
+
+    def get(self, query_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            query = self._queries.get(query_id)
+            return query.to_dict() if query else None
+
+    def delete(self, query_id: str) -> bool:
+        with self._lock:
+            if self._queries.pop(query_id, None) is None:
+                return False
+            self._save()
+        logger.info(f"Deleted standing query {query_id}")
+        return True
+
+    def _on_change(self, event: str, person: Dict[str, Any]):
+        """db listener: runs with the live store lock held, so it only scores and publishes."""
+        if event != "add":
+            return
+        with self._lock:
+            queries = list(self._queries.values())
+            self._metrics["evaluated"] += 1
+        for query in queries:
+            score = query.evaluate(person)
+            if score is None:
+                continue
+            query.hits += 1
+            query.last_hit_at = datetime.now().isoformat()
+            with self._lock:
+                self._metrics["hits"] += 1
+            event_bus.publish(STANDING_QUERY_HIT, {
+                "query_id": query.id,
+                "name": query.name,
+                "score": round(score, 4),
+                "person": {
+                    "id": person["id"],
+                    "description": person.get("description", {}),
+                    "metadata": person.get("metadata", {})
+                },
+                "image_url": crop_url(person["id"])
+            }, camera_id=person.get("metadata", {}).get("camera_id"))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._metrics, "queries": len(self._queries)}
+
+
+# Shared store evaluated on every ingest and managed through /standing_queries
+standing_queries = StandingQueryStore()
@@ -0,0 +1,192 @@
+# stats.py
+
+import threading
+import logging
+from collections import Counter
+from typing import Dict, Any, Iterable, List, Optional
+from dotenv import load_dotenv
+from db import load_database, get_file_version, add_listener
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Attributes counted across the whole dataset
+STAT_ATTRIBUTES = [
+    "gender", "age_group", "hair_color", "facial_features",
+    "clothing_top", "clothing_top_color", "location_context"
+]
+
+# Attributes counted per camera, with the name of their distribution in the snapshot
+CAMERA_ATTRIBUTES = {"gender": "gender_dist", "age_group": "age_dist", "clothing_top": "clothing_dist"}
+
+
+def _attribute_values(value: Any) -> List[str]:
+    """Split a description value into the individual values it counts towards."""
+    if isinstance(value, list):
+        return [str(v).strip() for v in value if str(v).strip()]
+    if isinstance(value, str):
+        return [v.strip() for v in value.split(",") if v.strip()]
+    return [str(value)] if value is not None else []
+
+
+def _hour_bucket(timestamp: Any) -> str:
+    """Hourly bucket of an ISO timestamp, e.g. "2025-04-06T09"."""
+    timestamp = str(timestamp or "")
+    return timestamp[:13] if len(timestamp) >= 13 else "unknown"
+
+
+def _update_counter(counter: Counter, keys: Iterable[str], sign: int):
+    for key in keys:
+        counter[key] += sign
+        if counter[key] <= 0:
+            del counter[key]
+
+
+class _CameraStats:
+    __slots__ = ("count", "last_seen", "distributions", "hourly")
+
+    def __init__(self):
+        self.count = 0
+        self.last_seen = ""
+        self.distributions = {name: Counter() for name in CAMERA_ATTRIBUTES.values()}
+        self.hourly = Counter()
+
+
+class DatasetAggregates:
+    """Counts over a set of people that can be updated one person at a time."""
+
+    def __init__(self, people: Iterable[Dict[str, Any]] = ()):
+        self.total = 0
+        self.attributes = {attr: Counter() for attr in STAT_ATTRIBUTES}
+        self.cameras: Dict[str, _CameraStats] = {}
+        self.hourly = Counter()
+        for person in people:
+            self.apply(person, 1)
+
+    def apply(self, person: Dict[str, Any], sign: int):
+        """Add (sign=1) or remove (sign=-1) a person's contribution."""
+        desc = person.get("description", {})
+        if not isinstance(desc, dict):
+            return
+        metadata = person.get("metadata", {})
+        camera_id = metadata.get("camera_id", "unknown")
+        timestamp = metadata.get("timestamp", "")
+        bucket = _hour_bucket(timestamp)
+
+        self.total += sign
+        for attr in STAT_ATTRIBUTES:
+            if attr in desc:
+                _update_counter(self.attributes[attr], _attribute_values(desc[attr]), sign)
+        _update_counter(self.hourly, [bucket], sign)
+
+        camera = self.cameras.setdefault(camera_id, _CameraStats())
+        camera.count += sign
+        for attr, name in CAMERA_ATTRIBUTES.items():
+            if attr in desc:
+                _update_counter(camera.distributions[name], [str(desc[attr])], sign)
+        _update_counter(camera.hourly, [bucket], sign)
+        if sign > 0:
+            self.touch(camera_id, metadata.get("last_seen", timestamp))
+        elif camera.count <= 0:
+            del self.cameras[camera_id]
+
+    def touch(self, camera_id: str, seen_at: Any):
+        """Record activity on a camera. last_seen only moves forward, even when people are evicted."""
+        camera = self.cameras.get(camera_id)
+        if camera is not None and str(seen_at or "") > camera.last_seen:
+            camera.last_seen = str(seen_at)
+
+
+def _merge(counters: Iterable[Counter]) -> Dict[str, int]:
+    merged = Counter()
+    for counter in counters:
+        merged.update(counter)
+    return dict(merged.most_common())
+
+
+class DatasetStats:
+    """
+    Dataset statistics for the chat endpoints and /stats, kept up to date incrementally.
+
+    ml.json is aggregated once per file version; detections in the live store are
+    added, updated and evicted through a db listener. Snapshots are rendered once per
+    change and shared between callers, so reading them is O(1) while the data is unchanged.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._file_version: Optional[str] = None
+        self._file = DatasetAggregates()
+        self._live = DatasetAggregates()
+        self._snapshot: Optional[Dict[str, Any]] = None
+        add_listener(self._on_live_change, replay=True)
+
+    def _on_live_change(self, event: str, person: Dict[str, Any]):
+        with self._lock:
+            if event == "add":
+                self._live.apply(person, 1)
+            elif event == "evict":
+                self._live.apply(person, -1)
+            elif event == "update":
+                metadata = person.get("metadata", {})
+                self._live.touch(metadata.get("camera_id", "unknown"), metadata.get("last_seen"))
+            self._snapshot = None
+
+    def _refresh_file(self):
+        """Re-aggregate ml.json if it changed on disk."""
+        version = get_file_version()
+        if version == self._file_version:
+            return
+        people = load_database(include_live=False).get("people", [])
+        aggregates = DatasetAggregates(people)
+        with self._lock:
+            self._file = aggregates
+            self._file_version = version
+            self._snapshot = None
+        logger.info(f"Aggregated statistics for {aggregates.total} people from ml.json")
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Current statistics. The returned dict is shared and must not be modified.
+
+        Returns:
+            Dictionary with total_people, unique_cameras, per-attribute value counts,
+            per-camera rollups (count, last_seen, distributions, hourly) and hourly counts
+        """
+        self._refresh_file()
+        with self._lock:
+            if self._snapshot is None:
+                self._snapshot = self._render()
+            return self._snapshot
+
+    def _render(self) -> Dict[str, Any]:
+        """Merge the file and live aggregates. Must be called with the lock held."""
+        parts = (self._file, self._live)
+        cameras = {}
+        for camera_id in sorted(set(self._file.cameras) | set(self._live.cameras)):
+            stats = [part.cameras[camera_id] for part in parts if camera_id in part.cameras]
+            cameras[camera_id] = {
+                "count": sum(camera.count for camera in stats),
+                "last_seen": max(camera.last_seen for camera in stats) or "unknown",
+                **{name: _merge(camera.distributions[name] for camera in stats) for name in CAMERA_ATTRIBUTES.values()},
+                "hourly": dict(sorted(_merge(camera.hourly for camera in stats).items()))
+            }
+        return {
+            "total_people": self._file.total + self._live.total,
+            "unique_cameras": len(cameras),
+            "attributes": {attr: _merge(part.attributes[attr] for part in parts) for attr in STAT_ATTRIBUTES},
+            "cameras": cameras,
+            "hourly": dict(sorted(_merge(part.hourly for part in parts).items()))
+        }
+
+
+# Shared statistics used by /stats and the chat endpoints
+dataset_stats = DatasetStats()
+
+
+def get_stats_snapshot() -> Dict[str, Any]:
+    return dataset_stats.snapshot()
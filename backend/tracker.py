@@ -6,6 +6,7 @@ from ultralytics import YOLO
 from ultralytics.nn.tasks import DetectionModel
 import supervision as sv
 import os
+from crop_quality import score_crop, TrackCropSelector, CROP_QUALITY_TOP_K
 
 # ✅ Load YOLOv8 model safely
 MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "yolo11n.pt")
@@ -51,10 +52,10 @@ def process_image(image: Image.Image):
         return []
 
 
-def process_video(path: str, every_n_frames=10):
+def process_video(path: str, every_n_frames=10, top_k=CROP_QUALITY_TOP_K):
     """
     Detect and track people in video using YOLOv8 + ByteTrack.
-    Returns list of cropped images per person track.
+    Returns the best top_k cropped images per person track, scored by crop_quality.score_crop.
     """
     try:
         if not os.path.exists(path):
@@ -65,7 +66,7 @@ def process_video(path: str, every_n_frames=10):
             raise ValueError(f"Could not open video file: {path}")
             
         frame_idx = 0
-        tracked_crops = []
+        selector = TrackCropSelector(top_k=top_k)
 
         while True:
             ret, frame = cap.read()
@@ -78,28 +79,34 @@ def process_video(path: str, every_n_frames=10):
 
             results = yolo_model(frame, classes=[TARGET_CLASS_ID], device=DEVICE)[0]
             
-            # Convert results to usable format
-            bboxes = results.boxes.xyxy.cpu().numpy().astype("int")
-            classes = results.boxes.cls.cpu().numpy().astype("int")
-            
             detections = sv.Detections.from_ultralytics(results)
             tracks = byte_tracker.update_with_detections(detections)
 
-            for track in tracks:
-                x1, y1, x2, y2 = map(int, track[1])
-                tid = track[2]
-                crop = frame[y1:y2, x1:x2]
-                crop_pil = Image.fromarray(cv2.cvtColor(crop, cv2.COLOR_BGR2RGB))
-                tracked_crops.append({
-                    "track_id": tid,
+            for xyxy, confidence, tid in zip(tracks.xyxy, tracks.confidence, tracks.tracker_id):
+                x1, y1, x2, y2 = map(int, xyxy)
+                x1, y1 = max(0, x1), max(0, y1)
+                crop = frame[y1:y2, x1:x2].copy()  # not a view, so the frame can be freed
+                if crop.size == 0:
+                    continue
+                score, components = score_crop(crop, (x1, y1, x2, y2), frame.shape, confidence)
+                selector.offer(tid, score, {
+                    "track_id": int(tid),
                     "frame": frame_idx,
-                    "image": crop_pil,
-                    "box": (x1, y1, x2, y2)
+                    "crop": crop,
+                    "box": (x1, y1, x2, y2),
+                    "quality": round(score, 4),
+                    "quality_components": {key: round(value, 4) for key, value in components.items()}
                 })
 
             frame_idx += 1
 
         cap.release()
+
+        # Only the kept crops are converted for description
+        tracked_crops = selector.selected()
+        for tracked in tracked_crops:
+            tracked["image"] = Image.fromarray(cv2.cvtColor(tracked.pop("crop"), cv2.COLOR_BGR2RGB))
+        print(f"Kept {len(tracked_crops)} of {selector.offered} crops ({selector.rejected} below minimum quality)")
         return tracked_crops
         
     except Exception as e: